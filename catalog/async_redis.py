@@ -0,0 +1,41 @@
+"""
+Асинхронный клиент Redis (redis.asyncio) для async views.
+
+Соединения redis.asyncio привязаны к event loop, поэтому клиент создаётся на каждый loop:
+под uvicorn это один клиент на воркер, под WSGI и в тестах (async_to_sync) — на запрос.
+Клиент закрывается вместе со своим loop: asyncio.run и async_to_sync перед закрытием loop
+завершают его async-генераторы (shutdown_asyncgens), и генератор-сторож закрывает соединения.
+Подключение то же, что у кэша Django (CACHES['default']).
+"""
+import asyncio
+import weakref
+
+from django.conf import settings
+from redis import asyncio as aioredis
+
+_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_redis():
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = aioredis.Redis.from_url(settings.CACHES['default']['LOCATION'])
+        watcher = _close_on_shutdown(client)
+        # loop хранит async-генераторы по слабой ссылке: сторож живёт, пока жив клиент
+        client._loop_watcher = watcher
+        _clients[loop] = client
+        loop.create_task(_start(watcher))
+    return client
+
+
+async def _start(watcher):
+    await watcher.__anext__()
+
+
+async def _close_on_shutdown(client):
+    try:
+        yield
+    finally:
+        _clients.pop(asyncio.get_running_loop(), None)
+        await client.aclose()
@@ -0,0 +1,236 @@
+"""
+Async-версии эндпоинтов чтения каталога (catalog, search, product-detail, products) для ASGI (uvicorn).
+
+Быстрый путь — GET с JSON-ответом: JWT проверяется в event loop, данные читаются через
+async ORM (Django 4.2 выполняет SQL в отдельном потоке на запрос, event loop в это время
+обслуживает другие запросы), Redis — через redis.asyncio. Queryset, сериализация
+и пагинация берутся из DRF view, поэтому ответ побайтно совпадает с синхронным.
+
+Ошибки быстрого пути (неверный токен, 404, неверный курсор) отдаются сразу в формате DRF.
+Всё остальное — запросы без токена, ?stream=1, browsable API, другие методы — отдаёт
+исходная DRF view через sync_to_async.
+"""
+from functools import lru_cache
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ObjectDoesNotExist
+from django.http import Http404, HttpResponse
+from django.utils.decorators import classonlymethod
+from django.views import View
+from rest_framework.exceptions import APIException, AuthenticationFailed, NotAuthenticated
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from . import compression, product_fragments, response_cache
+from .authentication import StoreClaimsJWTAuthentication, aget_request_store
+from .conditional import (
+    catalog_validators, is_conditional, loaded_product_version, not_modified, product_validators,
+    product_version_queryset, product_versions_queryset, search_validators, set_validators,
+)
+from .renderers import ORJSONRenderer
+from .search import trigram_available
+from .view_counter import arecord_view, arecord_views
+from .views import CatalogListView, ProductDetailView, ProductMultiGetView, ProductSearchView
+
+
+class FallbackToSync(Exception):
+    """
+    Запрос не обрабатывается быстрым путём и передаётся синхронной DRF view.
+    """
+
+
+@lru_cache(maxsize=None)
+def sync_view(drf_view_class):
+    return sync_to_async(drf_view_class.as_view())
+
+
+async def authenticate(request):
+    """
+    Пользователь по JWT или None. Подпись и срок токена проверяются в event loop,
+    пользователь берётся из claims, а для устаревших токенов читается из БД в потоке.
+    """
+    authentication = StoreClaimsJWTAuthentication()
+    header = authentication.get_header(request)
+    if header is None:
+        return None
+    raw_token = authentication.get_raw_token(header)
+    if raw_token is None:
+        return None
+    validated_token = authentication.get_validated_token(raw_token)
+    return await authentication.aget_user(validated_token)
+
+
+class AsyncReadView(View):
+    drf_view_class = None
+    renderer = ORJSONRenderer()
+
+    @classonlymethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+        # CSRF для запросов, отданных DRF view, проверяет сама DRF (как в APIView.as_view)
+        view.csrf_exempt = True
+        return view
+
+    async def dispatch(self, request, *args, **kwargs):
+        if request.method == 'GET' and self.accepts_json(request):
+            try:
+                return await self.get(request, *args, **kwargs)
+            except FallbackToSync:
+                pass
+            except (APIException, Http404) as exc:
+                # Повтор через DRF view выполнил бы запрос второй раз с тем же результатом
+                return self.error_response(request, exc)
+        return await sync_view(self.drf_view_class)(request, *args, **kwargs)
+
+    def error_response(self, request, exc):
+        """
+        Ответ на ошибку, как у APIView.handle_exception: тот же обработчик исключений DRF,
+        401 с WWW-Authenticate и заголовки DRF view.
+        """
+        if isinstance(exc, (NotAuthenticated, AuthenticationFailed)):
+            exc.auth_header = StoreClaimsJWTAuthentication().authenticate_header(request)
+        drf_response = api_settings.EXCEPTION_HANDLER(exc, {'view': self, 'request': request})
+        response = HttpResponse(
+            self.renderer.render(drf_response.data),
+            status=drf_response.status_code,
+            content_type=self.renderer.media_type,
+        )
+        view = self.drf_view_class()
+        view.setup(request, *self.args, **self.kwargs)
+        for header, value in view.default_response_headers.items():
+            response[header] = value
+        for header, value in drf_response.items():
+            if header != 'Content-Type':
+                response[header] = value
+        return response
+
+    @staticmethod
+    def accepts_json(request):
+        # ?format= и text/html (browsable API) — согласование рендерера остаётся за DRF
+        return 'format' not in request.GET and 'text/html' not in request.headers.get('Accept', '')
+
+    async def get_drf_view(self, request):
+        """
+        Экземпляр DRF view для get_queryset/get_serializer/paginator,
+        с пользователем и магазином, полученными без блокировки event loop.
+        """
+        user = await authenticate(request)
+        if user is None:
+            raise FallbackToSync
+        drf_request = Request(request)
+        drf_request.user = user
+        view = self.drf_view_class(format_kwarg=None)
+        # setup() как в as_view: request, args, kwargs и head (Allow в заголовках ответа)
+        view.setup(drf_request, *self.args, **self.kwargs)
+        view.store = await aget_request_store(user)
+        return view
+
+    def is_stream(self, view):
+        return view.request.query_params.get(view.stream_query_param) in ('1', 'true')
+
+    async def render_list(self, view):
+        queryset = view.filter_queryset(view.get_queryset())
+        page = await view.paginator.apaginate_queryset(queryset, view.request, view)
+        if page is None:
+            return self.renderer.render(view.get_serializer([obj async for obj in queryset], many=True).data)
+        data = view.get_serializer(page, many=True).data
+        return self.renderer.render(view.paginator.get_paginated_response(data).data)
+
+    def json_response(self, view, content):
+        response = HttpResponse(content, content_type=self.renderer.media_type)
+        for header, value in view.default_response_headers.items():
+            response[header] = value
+        return response
+
+
+class AsyncCatalogListView(AsyncReadView):
+    drf_view_class = CatalogListView
+
+    async def get(self, request, *args, **kwargs):
+        view = await self.get_drf_view(request)
+        if view.store is None or self.is_stream(view):
+            raise FallbackToSync
+
+        version, modified = await response_cache.astore_validators(view.store.pk)
+        validators = catalog_validators(view.store, version, modified)
+        response = not_modified(request, *validators)
+        if response is not None:
+            return response
+
+        # Тот же ключ и формат, что у CachedCatalogPageMixin: страницы общие для sync и async
+        paginator = view.paginator
+        key = response_cache.page_key(
+            view.store,
+            request.get_host(),
+            request.GET.get(paginator.cursor_query_param),
+            request.GET.get(paginator.page_size_query_param),
+            version=version,
+        )
+        content, hit, encoding = await response_cache.aget_or_build(
+            key, lambda: self.render_list(view), compression.accepted_encoding(request),
+        )
+        response = self.json_response(view, content)
+        response['X-Cache'] = 'HIT' if hit else 'MISS'
+        set_validators(response, *validators)
+        return compression.mark_encoded(response, encoding) if encoding else response
+
+
+class AsyncProductSearchView(AsyncReadView):
+    drf_view_class = ProductSearchView
+
+    async def get(self, request, *args, **kwargs):
+        view = await self.get_drf_view(request)
+        if self.is_stream(view):
+            raise FallbackToSync
+        validators = search_validators(view.store, *await response_cache.acatalog_validators())
+        response = not_modified(request, *validators)
+        if response is not None:
+            return response
+        # Проверка pg_trgm кэшируется на процесс; первый вызов ходит в БД
+        await sync_to_async(trigram_available)()
+        return set_validators(self.json_response(view, await self.render_list(view)), *validators)
+
+
+class AsyncProductDetailView(AsyncReadView):
+    drf_view_class = ProductDetailView
+
+    async def get(self, request, *args, **kwargs):
+        view = await self.get_drf_view(request)
+        if is_conditional(request):
+            version = await product_version_queryset(kwargs['pk'], view.store).afirst()
+            if version is not None:
+                response = not_modified(request, *product_validators(kwargs['pk'], view.store, version))
+                if response is not None:
+                    await arecord_view(kwargs['pk'])
+                    return response
+
+        queryset = view.get_queryset()
+        try:
+            product = await queryset.aget(pk=kwargs['pk'])
+        except ObjectDoesNotExist:
+            # Как get_object_or_404 в DRF view
+            raise Http404(f"No {queryset.model._meta.object_name} matches the given query.")
+        product.view_count += await arecord_view(product.pk)
+        response = self.json_response(view, self.renderer.render(view.get_serializer(product).data))
+        return set_validators(response, *product_validators(product.pk, view.store, loaded_product_version(product)))
+
+
+class AsyncProductMultiGetView(AsyncReadView):
+    drf_view_class = ProductMultiGetView
+
+    async def get(self, request, *args, **kwargs):
+        view = await self.get_drf_view(request)
+        ids = view.get_ids()
+        versions = [row async for row in product_versions_queryset(ids, view.store)]
+        keys = view.fragment_keys(versions)
+        fragments = await product_fragments.aget_many(keys)
+
+        misses = [product_id for product_id in keys if product_id not in fragments]
+        if misses:
+            products = [product async for product in view.get_queryset().filter(pk__in=misses)]
+            built = view.render_fragments(products)
+            await product_fragments.aset_many({keys[product_id]: fragment for product_id, fragment in built.items()})
+            fragments.update(built)
+
+        pending = await arecord_views(fragments)
+        return self.json_response(view, view.assemble(ids, versions, fragments, pending))
@@ -0,0 +1,116 @@
+"""
+JWT с магазином пользователя в claims (store_id, city_id, store_ver): запросы каталога
+аутентифицируются без чтения User и UserProfile из БД.
+
+Claims записываются в каждый access-токен, выданный через /token/ и /token/refresh/
+(TOKEN_OBTAIN_SERIALIZER, TOKEN_REFRESH_SERIALIZER), магазин перечитывается при каждом refresh.
+StoreClaimsJWTAuthentication возвращает CatalogTokenUser, магазин берётся из справочника
+процесса (catalog.reference). Проверка на запрос — одно чтение версии магазина пользователя из Redis:
+токены, выпущенные до изменения профиля, магазина или пользователя (catalog.signals ->
+forget_user_stores), и токены без claims проверяются как раньше, с загрузкой User из БД,
+пока клиент не обновит токен.
+"""
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.utils.functional import cached_property
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .db_routing import aset_request_user, set_request_user
+from .reference import aget_store, get_store
+from .user_store import aget_user_store, auser_store_version, get_user_store, user_store_version
+
+STORE_CLAIM = 'store_id'
+CITY_CLAIM = 'city_id'
+STORE_VERSION_CLAIM = 'store_ver'
+
+
+class CatalogRefreshToken(RefreshToken):
+    @property
+    def access_token(self):
+        # access-токен копирует claims refresh-токена: магазин актуален на момент выдачи.
+        # Версия читается до магазина: изменение между чтениями оставит токен устаревшим
+        user_id = self[api_settings.USER_ID_CLAIM]
+        self[STORE_VERSION_CLAIM] = user_store_version(user_id)
+        store = get_user_store(user_id)
+        self[STORE_CLAIM] = store.pk if store else None
+        self[CITY_CLAIM] = store.city_id if store else None
+        return super().access_token
+
+
+class CatalogTokenObtainPairSerializer(TokenObtainPairSerializer):
+    token_class = CatalogRefreshToken
+
+
+class CatalogTokenRefreshSerializer(TokenRefreshSerializer):
+    token_class = CatalogRefreshToken
+
+
+class CatalogTokenUser(TokenUser):
+    """
+    Пользователь из claims токена (TOKEN_USER_CLASS): is_authenticated, pk и магазин
+    без обращения к БД.
+    """
+
+    @cached_property
+    def store_id(self):
+        return self.token.get(STORE_CLAIM)
+
+    @cached_property
+    def city_id(self):
+        return self.token.get(CITY_CLAIM)
+
+    def get_store(self):
+        return get_store(self.store_id) if self.store_id else None
+
+    async def aget_store(self):
+        return await aget_store(self.store_id) if self.store_id else None
+
+
+class StoreClaimsJWTAuthentication(JWTAuthentication):
+
+    @staticmethod
+    def has_store_claims(validated_token):
+        return STORE_VERSION_CLAIM in validated_token and api_settings.USER_ID_CLAIM in validated_token
+
+    def get_user(self, validated_token):
+        # Пользователь, недавно писавший в каталог, читает с primary (catalog.db_routing)
+        set_request_user(validated_token.get(api_settings.USER_ID_CLAIM))
+        if self.has_store_claims(validated_token) and validated_token[STORE_VERSION_CLAIM] == user_store_version(
+                validated_token[api_settings.USER_ID_CLAIM]):
+            return api_settings.TOKEN_USER_CLASS(validated_token)
+        return super().get_user(validated_token)
+
+    async def aget_user(self, validated_token):
+        await aset_request_user(validated_token.get(api_settings.USER_ID_CLAIM))
+        if self.has_store_claims(validated_token) and validated_token[STORE_VERSION_CLAIM] == (
+                await auser_store_version(validated_token[api_settings.USER_ID_CLAIM])):
+            return api_settings.TOKEN_USER_CLASS(validated_token)
+        return await sync_to_async(super().get_user)(validated_token)
+
+
+def get_request_store(user):
+    """
+    Магазин аутентифицированного пользователя: из claims токена или из профиля (catalog.user_store).
+    """
+    if isinstance(user, CatalogTokenUser):
+        return user.get_store()
+    return get_user_store(user.pk)
+
+
+async def aget_request_store(user):
+    if isinstance(user, CatalogTokenUser):
+        return await user.aget_store()
+    return await aget_user_store(user.pk)
+
+
+def user_is_staff(user):
+    """
+    is_staff пользователя запроса: в claims CatalogTokenUser его нет — читается из БД.
+    """
+    if isinstance(user, CatalogTokenUser):
+        return get_user_model().objects.filter(pk=user.pk, is_staff=True).exists()
+    return user.is_staff
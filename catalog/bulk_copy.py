@@ -0,0 +1,401 @@
+"""
+Массовая загрузка и выгрузка каталога через COPY (manage.py catalog_import / catalog_export).
+
+Файлы — CSV с заголовком или NDJSON (объект на строку). Ссылки — по естественным ключам:
+город по имени, магазин по (городу, имени), товар по id. Строки потоком идут в
+COPY ... FROM STDIN во временную таблицу (колонки text), затем один set-based запрос
+разрешает ключи join-ами и делает upsert: память процесса не зависит от размера файла.
+Выгрузка — COPY (SELECT ...) TO STDOUT в том же формате, порядок строк детерминирован.
+
+Загрузка идёт в обход ORM-сигналов, поэтому проекция каталога, версия справочников
+и версии магазинов (кэш страниц) обновляются здесь же — только по изменённым строкам.
+"""
+import csv
+
+from django.db import connection, transaction
+
+from .images import DEFAULT_CONTENT_TYPE
+from .models import City, Price, Product, ProductImage, Stock, Store, StoreCatalogEntry
+from .projection import refresh_from_table
+from .reference import bump_reference_version
+from .response_cache import bump_store_versions
+
+FORMATS = ('csv', 'ndjson')
+
+STAGING_TABLE = 'catalog_import_rows'
+RAW_TABLE = 'catalog_import_raw'
+CHANGED_TABLE = 'catalog_import_changed'
+
+_tables = {
+    'city': City._meta.db_table,
+    'store': Store._meta.db_table,
+    'product': Product._meta.db_table,
+    'image': ProductImage._meta.db_table,
+    'price': Price._meta.db_table,
+    'stock': Stock._meta.db_table,
+    'staging': STAGING_TABLE,
+    'changed': CHANGED_TABLE,
+    'entry': StoreCatalogEntry._meta.db_table,
+}
+
+# NDJSON через COPY: разделитель и кавычка — управляющие символы, которых нет в JSON
+# (в строках они экранируются как \u0001), поэтому строка файла проходит как одно значение.
+_LINE_OPTIONS = "FORMAT csv, QUOTE e'\\x01', DELIMITER e'\\x02'"
+
+# Разбор строки NDJSON без ошибки на некорректном JSON (NULL): Postgres 14 не умеет
+# pg_input_is_valid, поэтому — функция с обработчиком исключения во временной схеме сессии.
+_PARSE_LINE_SQL = """
+CREATE OR REPLACE FUNCTION pg_temp.catalog_import_jsonb(line text) RETURNS jsonb
+LANGUAGE plpgsql IMMUTABLE AS $$
+BEGIN
+    RETURN line::jsonb;
+EXCEPTION WHEN others THEN
+    RETURN NULL;
+END
+$$
+"""
+
+
+# Значения из файла приводятся к типам только после проверки формата и диапазона (CASE вычисляет
+# условие раньше приведения): некорректное значение даёт NULL, строка считается пропущенной
+# и не роняет всю загрузку ошибкой приведения.
+_INTEGER_RE = "'^[[:space:]]*[+-]?[0-9]+[[:space:]]*$'"
+_DECIMAL_RE = "'^[[:space:]]*[+-]?([0-9]+[.]?[0-9]*|[.][0-9]+)[[:space:]]*$'"
+_BASE64_RE = "'^[A-Za-z0-9+/]*(|=|==)$'"
+
+
+def _safe_integer(column, sql_type, low, high):
+    return (
+        f"CASE WHEN {column} ~ {_INTEGER_RE} THEN "
+        f"CASE WHEN {column}::numeric BETWEEN {low} AND {high} THEN {column}::{sql_type} END END"
+    )
+
+
+def _safe_decimal(column, field):
+    rounded = f"round({column}::numeric, {field.decimal_places})"
+    limit = 10 ** (field.max_digits - field.decimal_places)
+    return f"CASE WHEN {column} ~ {_DECIMAL_RE} THEN CASE WHEN abs({rounded}) < {limit} THEN {rounded} END END"
+
+
+def _safe_base64(column):
+    # decode() пропускает пробелы и переносы, но не другие символы и неполные группы
+    compact = f"regexp_replace({column}, '[[:space:]]+', '', 'g')"
+    return (
+        f"CASE WHEN {compact} ~ {_BASE64_RE} THEN "
+        f"CASE WHEN length({compact}) % 4 = 0 THEN decode({column}, 'base64') END END"
+    )
+
+
+def _safe_id(column):
+    return _safe_integer(column, 'bigint', 1, 2 ** 63 - 1)
+
+
+_QUANTITY = _safe_integer('s.quantity', 'integer', 0, 2 ** 31 - 1)
+_AMOUNT = _safe_decimal('s.amount', Price._meta.get_field('amount'))
+
+
+class CopyEntity:
+    """
+    Сущность каталога в файле: колонки, выгрузка и запрос слияния из временной таблицы.
+
+    merge_sql возвращает (строк после разрешения ключей и дедупликации, записанных строк);
+    изменённые товары / пары (store_id, product_id) он сохраняет в CHANGED_TABLE
+    (data-modifying CTE выполняется целиком, даже если основной запрос его не читает).
+    changes — что обновить после слияния: 'reference', 'products' или 'pairs'.
+    """
+
+    def __init__(self, columns, required, export_sql, merge_sql, changes, after_sql=None):
+        self.columns = columns
+        self.required = required
+        self.export_sql = export_sql.format(**_tables)
+        self.merge_sql = merge_sql.format(**_tables)
+        self.changes = changes
+        self.after_sql = after_sql.format(**_tables) if after_sql else None
+
+
+# Порядок словаря — порядок загрузки: ссылки указывают на уже загруженные сущности.
+# Повторы ключа в файле схлопываются, побеждает последняя строка (как в deduplicate_stock_rows).
+ENTITIES = {
+    'cities': CopyEntity(
+        columns=('name',),
+        required=('name',),
+        export_sql="SELECT name FROM {city} ORDER BY name",
+        merge_sql="""
+WITH rows AS (
+    SELECT DISTINCT name FROM {staging} WHERE name <> ''
+), written AS (
+    INSERT INTO {city} (name)
+    SELECT name FROM rows ORDER BY name
+    ON CONFLICT (name) DO NOTHING
+    RETURNING id
+)
+SELECT (SELECT count(*) FROM rows), (SELECT count(*) FROM written)
+""",
+        changes='reference',
+    ),
+    'stores': CopyEntity(
+        columns=('city', 'name'),
+        required=('city', 'name'),
+        export_sql="""
+SELECT c.name AS city, s.name FROM {store} s JOIN {city} c ON c.id = s.city_id
+ORDER BY c.name, s.name, s.id
+""",
+        merge_sql="""
+WITH rows AS (
+    SELECT DISTINCT c.id AS city_id, s.name
+    FROM {staging} s
+    JOIN {city} c ON c.name = s.city
+    WHERE s.name <> ''
+), written AS (
+    INSERT INTO {store} (city_id, name)
+    SELECT city_id, name FROM rows r
+    WHERE NOT EXISTS (SELECT 1 FROM {store} st WHERE st.city_id = r.city_id AND st.name = r.name)
+    ORDER BY city_id, name
+    RETURNING id
+)
+SELECT (SELECT count(*) FROM rows), (SELECT count(*) FROM written)
+""",
+        changes='reference',
+    ),
+    'products': CopyEntity(
+        columns=('id', 'name', 'description'),
+        required=('id', 'name'),
+        export_sql="SELECT id, name, description FROM {product} ORDER BY id",
+        merge_sql=f"""
+WITH rows AS (
+    SELECT DISTINCT ON (id) id, name, description
+    FROM (SELECT s.line, {_safe_id('s.id')} AS id, s.name, s.description FROM {{staging}} s) s
+    WHERE id IS NOT NULL AND name IS NOT NULL
+    ORDER BY id, line DESC
+), written AS (
+    INSERT INTO {{product}} AS p (id, name, description, view_count)
+    SELECT id, name, description, 0 FROM rows
+    ON CONFLICT (id) DO UPDATE
+        SET name = EXCLUDED.name, description = EXCLUDED.description
+        WHERE (p.name, p.description) IS DISTINCT FROM (EXCLUDED.name, EXCLUDED.description)
+    RETURNING p.id
+), saved AS (
+    INSERT INTO {{changed}} (product_id) SELECT id FROM written
+)
+SELECT (SELECT count(*) FROM rows), (SELECT count(*) FROM written)
+""",
+        changes='products',
+        # id пришли из файла: последовательность сдвигается, чтобы следующий INSERT через ORM не упал
+        after_sql="SELECT setval(pg_get_serial_sequence('{product}', 'id'), max(id)) FROM {product}",
+    ),
+    'images': CopyEntity(
+        columns=('product_id', 'city', 'content_type', 'content'),
+        required=('product_id', 'content'),
+        # content — base64 без переносов строк; изображения, ещё не перенесённые
+        # из image_data (manage.py migrate_image_storage), не выгружаются
+        export_sql="""
+SELECT i.product_id, c.name AS city, i.content_type,
+       translate(encode(i.content, 'base64'), chr(10), '') AS content
+FROM {image} i LEFT JOIN {city} c ON c.id = i.city_id
+WHERE i.content IS NOT NULL
+ORDER BY i.product_id, i.id
+""",
+        # Изображение с тем же содержимым у того же товара и города не дублируется;
+        # новые вставляются в порядке файла (порядок изображений в выдаче — по id)
+        merge_sql=f"""
+WITH rows AS (
+    SELECT DISTINCT ON (product_id, city_id, content_hash) *
+    FROM (
+        SELECT s.line, p.id AS product_id, c.id AS city_id, s.content_type, d.content,
+               encode(sha256(d.content), 'hex') AS content_hash
+        FROM {{staging}} s
+        JOIN {{product}} p ON p.id = {_safe_id('s.product_id')}
+        LEFT JOIN {{city}} c ON c.name = s.city
+        CROSS JOIN LATERAL (SELECT {_safe_base64('s.content')} AS content) d
+        WHERE d.content IS NOT NULL AND (coalesce(s.city, '') = '' OR c.id IS NOT NULL)
+    ) decoded
+    ORDER BY product_id, city_id, content_hash, line DESC
+), written AS (
+    INSERT INTO {{image}} (product_id, city_id, image_data, content, content_hash, content_type)
+    SELECT product_id, city_id, '', content, content_hash,
+           coalesce(nullif(content_type, ''), '{DEFAULT_CONTENT_TYPE}')
+    FROM rows r
+    WHERE NOT EXISTS (
+        SELECT 1 FROM {{image}} i
+        WHERE i.product_id = r.product_id AND i.city_id IS NOT DISTINCT FROM r.city_id
+          AND i.content_hash = r.content_hash
+    )
+    ORDER BY line
+    RETURNING product_id
+), saved AS (
+    INSERT INTO {{changed}} (product_id) SELECT DISTINCT product_id FROM written
+)
+SELECT (SELECT count(*) FROM rows), (SELECT count(*) FROM written)
+""",
+        changes='products',
+    ),
+    'prices': CopyEntity(
+        columns=('product_id', 'city', 'store', 'amount'),
+        required=('product_id', 'city', 'store', 'amount'),
+        export_sql="""
+SELECT pr.product_id, c.name AS city, st.name AS store, pr.amount
+FROM {price} pr JOIN {store} st ON st.id = pr.store_id JOIN {city} c ON c.id = st.city_id
+ORDER BY c.name, st.name, pr.product_id
+""",
+        merge_sql=f"""
+WITH rows AS (
+    SELECT DISTINCT ON (st.id, p.id) st.id AS store_id, p.id AS product_id, s.amount
+    FROM (SELECT s.line, s.city, s.store, {_safe_id('s.product_id')} AS product_id, {_AMOUNT} AS amount
+          FROM {{staging}} s) s
+    JOIN {{city}} c ON c.name = s.city
+    JOIN {{store}} st ON st.city_id = c.id AND st.name = s.store
+    JOIN {{product}} p ON p.id = s.product_id
+    WHERE s.amount IS NOT NULL
+    ORDER BY st.id, p.id, s.line DESC
+), written AS (
+    INSERT INTO {{price}} AS pr (product_id, store_id, amount)
+    SELECT product_id, store_id, amount FROM rows
+    ON CONFLICT (product_id, store_id) DO UPDATE
+        SET amount = EXCLUDED.amount
+        WHERE pr.amount IS DISTINCT FROM EXCLUDED.amount
+    RETURNING pr.store_id, pr.product_id
+), saved AS (
+    INSERT INTO {{changed}} (store_id, product_id) SELECT store_id, product_id FROM written
+)
+SELECT (SELECT count(*) FROM rows), (SELECT count(*) FROM written)
+""",
+        changes='pairs',
+    ),
+    'stocks': CopyEntity(
+        columns=('product_id', 'city', 'store', 'quantity'),
+        required=('product_id', 'city', 'store', 'quantity'),
+        export_sql="""
+SELECT s.product_id, c.name AS city, st.name AS store, s.quantity
+FROM {stock} s JOIN {store} st ON st.id = s.store_id JOIN {city} c ON c.id = st.city_id
+ORDER BY c.name, st.name, s.product_id
+""",
+        # Строки упорядочены по (store_id, product_id) — тот же порядок блокировок, что у upsert_stocks
+        merge_sql=f"""
+WITH rows AS (
+    SELECT DISTINCT ON (st.id, p.id) st.id AS store_id, p.id AS product_id, s.quantity
+    FROM (SELECT s.line, s.city, s.store, {_safe_id('s.product_id')} AS product_id, {_QUANTITY} AS quantity
+          FROM {{staging}} s) s
+    JOIN {{city}} c ON c.name = s.city
+    JOIN {{store}} st ON st.city_id = c.id AND st.name = s.store
+    JOIN {{product}} p ON p.id = s.product_id
+    WHERE s.quantity IS NOT NULL
+    ORDER BY st.id, p.id, s.line DESC
+), written AS (
+    INSERT INTO {{stock}} AS s (product_id, store_id, quantity)
+    SELECT product_id, store_id, quantity FROM rows
+    ON CONFLICT (product_id, store_id) DO UPDATE
+        SET quantity = EXCLUDED.quantity
+        WHERE s.quantity IS DISTINCT FROM EXCLUDED.quantity
+    RETURNING s.store_id, s.product_id
+), saved AS (
+    INSERT INTO {{changed}} (store_id, product_id) SELECT store_id, product_id FROM written
+)
+SELECT (SELECT count(*) FROM rows), (SELECT count(*) FROM written)
+""",
+        changes='pairs',
+    ),
+}
+
+
+def read_csv_header(stream, entity):
+    """
+    Читает строку заголовка CSV и возвращает колонки файла в порядке файла.
+    Порядок колонок произвольный, лишние и отсутствующие обязательные — ошибка.
+    """
+    line = stream.readline()
+    if isinstance(line, bytes):
+        line = line.decode('utf-8-sig')
+    header = next(csv.reader([line]), [])
+    unknown = [column for column in header if column not in entity.columns]
+    missing = [column for column in entity.required if column not in header]
+    if unknown or missing or len(set(header)) != len(header):
+        raise ValueError(
+            f"Invalid CSV header {header!r}: expected columns {', '.join(entity.columns)}"
+            f" (required: {', '.join(entity.required)})"
+        )
+    return header
+
+
+def _copy_to_staging(cursor, entity, stream, fmt):
+    """
+    Заливает файл во временную таблицу STAGING_TABLE, возвращает число прочитанных строк.
+    """
+    columns = ', '.join(entity.columns)
+    typed_columns = ', '.join(f'{column} text' for column in entity.columns)
+    cursor.execute(f"CREATE TEMP TABLE {STAGING_TABLE} (line bigserial, {typed_columns}) ON COMMIT DROP")
+
+    if fmt == 'csv':
+        header = ', '.join(read_csv_header(stream, entity))
+        cursor.copy_expert(f"COPY {STAGING_TABLE} ({header}) FROM STDIN WITH (FORMAT csv)", stream)
+    else:
+        # Строки NDJSON разбираются в Postgres: jsonb_to_record по колонкам сущности. Строка
+        # с некорректным JSON или не объектом попадает в таблицу с пустыми колонками
+        # и считается пропущенной (пустые строки файла не считаются)
+        cursor.execute(f"CREATE TEMP TABLE {RAW_TABLE} (line bigserial, doc text) ON COMMIT DROP")
+        cursor.copy_expert(f"COPY {RAW_TABLE} (doc) FROM STDIN WITH ({_LINE_OPTIONS})", stream)
+        cursor.execute(_PARSE_LINE_SQL)
+        cursor.execute(f"""
+            INSERT INTO {STAGING_TABLE} (line, {columns})
+            SELECT raw.line, r.*
+            FROM (
+                SELECT line, pg_temp.catalog_import_jsonb(doc) AS doc FROM {RAW_TABLE} WHERE doc IS NOT NULL
+            ) raw
+            LEFT JOIN LATERAL jsonb_to_record(
+                CASE WHEN jsonb_typeof(raw.doc) = 'object' THEN raw.doc END
+            ) AS r({typed_columns}) ON true
+            ORDER BY raw.line
+        """)
+    read = cursor.rowcount
+    # У временных таблиц нет autovacuum-статистики: без ANALYZE планировщик не видит миллионы строк
+    cursor.execute(f"ANALYZE {STAGING_TABLE}")
+    return read
+
+
+def import_entity(name, stream, fmt='csv'):
+    """
+    Загружает сущность name из потока stream (файл, открытый на чтение, лучше в бинарном режиме)
+    одной транзакцией. Возвращает {'read', 'written', 'skipped'}: skipped — строки с неизвестными
+    городом / магазином / товаром, пустым ключом, некорректными числами или base64, строки NDJSON
+    с некорректным JSON или не объектом и повторы ключа.
+    """
+    entity = ENTITIES[name]
+    with transaction.atomic(), connection.cursor() as cursor:
+        read = _copy_to_staging(cursor, entity, stream, fmt)
+        cursor.execute(f"CREATE TEMP TABLE {CHANGED_TABLE} (store_id bigint, product_id bigint) ON COMMIT DROP")
+        cursor.execute(entity.merge_sql)
+        valid, written = cursor.fetchone()
+        if entity.after_sql:
+            cursor.execute(entity.after_sql)
+
+        if written and entity.changes == 'reference':
+            bump_reference_version()
+        elif written and entity.changes == 'products':
+            refresh_from_table(CHANGED_TABLE, 'product_id')
+            cursor.execute(f"""
+                SELECT DISTINCT e.store_id FROM {_tables['entry']} e
+                WHERE e.product_id IN (SELECT product_id FROM {CHANGED_TABLE})
+            """)
+            bump_store_versions(row[0] for row in cursor.fetchall())
+        elif written:
+            refresh_from_table(CHANGED_TABLE)
+            cursor.execute(f"SELECT DISTINCT store_id FROM {CHANGED_TABLE}")
+            bump_store_versions(row[0] for row in cursor.fetchall())
+
+        cursor.execute(f"DROP TABLE IF EXISTS {STAGING_TABLE}, {RAW_TABLE}, {CHANGED_TABLE}")
+
+    return {'read': read, 'written': written, 'skipped': read - valid}
+
+
+def export_entity(name, stream, fmt='csv'):
+    """
+    Выгружает сущность name в поток stream (файл, открытый на запись) в формате,
+    который читает import_entity. Возвращает число строк.
+    """
+    query = ENTITIES[name].export_sql
+    if fmt == 'csv':
+        sql = f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER true)"
+    else:
+        sql = f"COPY (SELECT row_to_json(t) FROM ({query}) t) TO STDOUT WITH ({_LINE_OPTIONS})"
+    with connection.cursor() as cursor:
+        cursor.copy_expert(sql, stream)
+        return cursor.rowcount
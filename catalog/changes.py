@@ -0,0 +1,202 @@
+"""
+Журнал изменений каталога магазинов для инкрементальной синхронизации
+(/api/v1/catalog/changes?since=<seq>).
+
+Изменение — строка проекции (catalog.projection) появилась, изменилась или исчезла. Журнал пишется
+тем же SQL, что пересчитывает проекцию (refresh_* и upsert остатков), поэтому в него попадают
+и записи через ORM, и массовые (upsert_stock_rows, bulk_copy). Просмотры (view_count) изменением
+не считаются.
+
+Номера изменений (seq) растут отдельно для каждого магазина (StoreChangeSequence) и выдаются
+после коммита: пишущая транзакция добавляет изменения без номера (seq IS NULL) и не трогает
+счётчик, поэтому параллельные пачки остатков одного магазина друг друга не ждут. Номера
+выдаёт sequence_changes (transaction.on_commit пишущей транзакции) в своей короткой транзакции:
+счётчик магазина блокируется только на время нумерации уже закоммиченных изменений, так что
+номера видны в порядке коммитов нумерации — клиент, прочитавший ленту до seq N, не пропустит
+изменение с меньшим номером. Изменения без номера в ленту не попадают; оставшиеся после падения
+процесса между коммитом и нумерацией нумеруются следующей записью или задачей сжатия.
+Лента отдаёт текущее состояние изменившихся строк, повторы товара в пределах страницы схлопываются.
+
+Сжатие (compact_changes, задача compact_catalog_changes_task) удаляет изменения старше
+CATALOG_CHANGES_RETENTION секунд и сдвигает trimmed_seq: клиент с since меньше неё
+получает 410 и перечитывает каталог целиком.
+"""
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import CatalogChange, StoreCatalogEntry, StoreChangeSequence
+
+_tables = {
+    'change': CatalogChange._meta.db_table,
+    'sequence': StoreChangeSequence._meta.db_table,
+}
+
+
+def log_changes_sql(pairs):
+    """
+    CTE, записывающие в журнал пары (store_id, product_id) из CTE pairs (пары уникальны).
+    Вставляются в WITH после pairs. Изменения пишутся без номера: вызывающий код
+    планирует sequence_changes после коммита (schedule_sequencing).
+    """
+    return f"""
+logged AS (
+    INSERT INTO {_tables['change']} (store_id, seq, product_id, created_at)
+    SELECT store_id, NULL, product_id, now() FROM {pairs}
+    ORDER BY store_id, product_id
+)"""
+
+
+# Блокирует счётчики магазинов с изменениями без номера (в порядке store_id — без взаимных
+# блокировок) и создаёт недостающие.
+LOCK_SEQUENCES_SQL = f"""
+INSERT INTO {_tables['sequence']} AS q (store_id, seq, trimmed_seq)
+SELECT DISTINCT store_id, 0, 0 FROM {_tables['change']} WHERE seq IS NULL
+ORDER BY store_id
+ON CONFLICT (store_id) DO UPDATE SET seq = q.seq
+RETURNING q.store_id
+"""
+
+# Нумерует изменения без номера заблокированных магазинов подряд в порядке записи.
+# Отдельный запрос после блокировки: его снимок видит нумерацию, закоммиченную до неё.
+NUMBER_SQL = f"""
+WITH pending AS (
+    SELECT id, store_id, row_number() OVER (PARTITION BY store_id ORDER BY id) AS ord
+    FROM {_tables['change']}
+    WHERE seq IS NULL AND store_id = ANY(%s)
+), counts AS (
+    SELECT store_id, count(*) AS n FROM pending GROUP BY store_id
+), advanced AS (
+    UPDATE {_tables['sequence']} AS q
+    SET seq = q.seq + c.n
+    FROM counts c
+    WHERE q.store_id = c.store_id
+    RETURNING q.store_id, q.seq - c.n AS base
+)
+UPDATE {_tables['change']} AS ch
+SET seq = a.base + p.ord
+FROM pending p
+JOIN advanced a ON a.store_id = p.store_id
+WHERE ch.id = p.id
+"""
+
+
+def sequence_changes():
+    """
+    Выдаёт номера закоммиченным изменениям без номера. Возвращает число пронумерованных.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(LOCK_SEQUENCES_SQL)
+        store_ids = [store_id for store_id, in cursor.fetchall()]
+        if not store_ids:
+            return 0
+        cursor.execute(NUMBER_SQL, [store_ids])
+        return cursor.rowcount
+
+
+def schedule_sequencing():
+    """
+    Нумерация изменений, записанных текущей транзакцией, — после её коммита
+    (вне транзакции — сразу).
+    """
+    transaction.on_commit(sequence_changes)
+
+
+PAGE_SQL = f"""
+SELECT seq, product_id FROM {_tables['change']}
+WHERE store_id = %s AND seq > %s
+ORDER BY seq
+LIMIT %s
+"""
+
+TRIM_SQL = f"""
+WITH trimmed AS (
+    DELETE FROM {_tables['change']}
+    WHERE id IN (
+        SELECT id FROM {_tables['change']}
+        WHERE created_at < %s AND seq IS NOT NULL
+        ORDER BY id LIMIT %s
+    )
+    RETURNING store_id, seq
+), horizons AS (
+    SELECT store_id, max(seq) AS seq FROM trimmed GROUP BY store_id
+), advanced AS (
+    UPDATE {_tables['sequence']} AS q
+    SET trimmed_seq = greatest(q.trimmed_seq, h.seq)
+    FROM horizons h
+    WHERE q.store_id = h.store_id
+)
+SELECT count(*) FROM trimmed
+"""
+
+
+class ChangesExpired(Exception):
+    """
+    Позиция since недоступна: изменения после неё удалены сжатием (или since впереди журнала).
+    """
+
+    def __init__(self, head):
+        super().__init__(head)
+        self.head = head
+
+
+def get_positions(store_id):
+    """
+    (seq, trimmed_seq) магазина; (0, 0), если изменений ещё не было.
+    """
+    positions = StoreChangeSequence.objects.filter(store_id=store_id).values_list('seq', 'trimmed_seq').first()
+    return positions or (0, 0)
+
+
+def changes_page(store_id, since, limit):
+    """
+    Страница ленты изменений магазина после since: {'seq', 'has_more', 'changes'}, где
+    changes — [(seq, product_id, строка проекции или None для удалённых и закончившихся)],
+    seq — позиция для следующего запроса. Три запроса независимо от размера каталога.
+    Бросает ChangesExpired, если since вне журнала.
+    """
+    head, trimmed = get_positions(store_id)
+    if since < trimmed or since > head:
+        raise ChangesExpired(head)
+
+    with connection.cursor() as cursor:
+        cursor.execute(PAGE_SQL, [store_id, since, limit + 1])
+        rows = cursor.fetchall()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    # Товар, изменившийся несколько раз, — один раз, под последним номером
+    latest = {product_id: seq for seq, product_id in rows}
+    entries = {
+        entry.product_id: entry
+        for entry in StoreCatalogEntry.objects.filter(
+            store_id=store_id, product_id__in=latest, quantity__gt=0
+        ).with_view_count()
+    }
+    changes = sorted(
+        (seq, product_id, entries.get(product_id)) for product_id, seq in latest.items()
+    )
+    return {
+        'seq': rows[-1][0] if rows else since,
+        'has_more': has_more,
+        'changes': changes,
+    }
+
+
+def compact_changes(retention, batch_size=10000):
+    """
+    Удаляет изменения старше retention секунд пачками по batch_size строк (каждая — своя
+    транзакция) и сдвигает trimmed_seq магазинов. Возвращает число удалённых строк.
+    Изменения без номера не удаляются: сначала они нумеруются.
+    """
+    sequence_changes()
+    before = timezone.now() - timedelta(seconds=retention)
+    deleted = 0
+    while True:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(TRIM_SQL, [before, batch_size])
+            count = cursor.fetchone()[0]
+        deleted += count
+        if count < batch_size:
+            return deleted
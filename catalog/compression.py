@@ -0,0 +1,121 @@
+"""
+Сжатие ответов API (gzip, brotli) по Accept-Encoding.
+
+catalog.middleware.CompressionMiddleware сжимает JSON-ответы не меньше COMPRESSION_MIN_SIZE байт;
+потоковые ответы (?stream=1) — по мере отдачи, со сбросом после каждого фрагмента (COMPRESSION_STREAMING),
+так что клиент получает данные, не дожидаясь конца потока. Ответ, уже сжатый view
+(страницы каталога из response_cache хранят сжатые варианты рядом со страницей), не трогается.
+
+brotli — необязательная зависимость: без пакета brotli ответы сжимаются только gzip.
+Сжатые ответы получают слабый ETag (как у django.middleware.gzip): байты отличаются, содержимое — нет.
+"""
+import gzip
+import zlib
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+GZIP = 'gzip'
+BROTLI = 'br'
+
+# В порядке предпочтения при равном q
+ENCODINGS = (BROTLI, GZIP) if brotli is not None else (GZIP,)
+
+
+def accepted_encoding(request):
+    """
+    Кодировка из ENCODINGS с наибольшим q в Accept-Encoding или None.
+    """
+    header = request.headers.get('Accept-Encoding', '')
+    if not header:
+        return None
+    weights = {}
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        weight = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[coding.strip().lower()] = weight
+    default = weights.get('*', 0.0)
+    best, best_weight = None, 0.0
+    for encoding in ENCODINGS:
+        weight = weights.get(encoding, default)
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+def compressible(response):
+    return response['Content-Type'].startswith(settings.COMPRESSION_CONTENT_TYPES)
+
+
+def compress(content, encoding, cached=False):
+    """
+    Сжимает байты. cached — результат сохраняется в кэш и отдаётся многократно:
+    сжатие сильнее и дороже (COMPRESSION_CACHED_*).
+    """
+    if encoding == BROTLI:
+        quality = settings.COMPRESSION_CACHED_BROTLI_QUALITY if cached else settings.COMPRESSION_BROTLI_QUALITY
+        return brotli.compress(content, quality=quality)
+    level = settings.COMPRESSION_CACHED_GZIP_LEVEL if cached else settings.COMPRESSION_GZIP_LEVEL
+    return gzip.compress(content, compresslevel=level, mtime=0)
+
+
+class _StreamCompressor:
+    """
+    Потоковое сжатие: каждый фрагмент сбрасывается, чтобы клиент мог разбирать ответ по мере прихода.
+    """
+
+    def __init__(self, encoding):
+        self.brotli = encoding == BROTLI
+        if self.brotli:
+            self.compressor = brotli.Compressor(quality=settings.COMPRESSION_BROTLI_QUALITY)
+        else:
+            # wbits=31: заголовок и контрольная сумма gzip
+            self.compressor = zlib.compressobj(settings.COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def chunk(self, data):
+        if self.brotli:
+            return self.compressor.process(data) + self.compressor.flush()
+        return self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self.compressor.finish() if self.brotli else self.compressor.flush()
+
+
+def compress_stream(chunks, encoding):
+    compressor = _StreamCompressor(encoding)
+    for data in chunks:
+        if data:
+            yield compressor.chunk(data)
+    yield compressor.finish()
+
+
+async def acompress_stream(chunks, encoding):
+    compressor = _StreamCompressor(encoding)
+    async for data in chunks:
+        if data:
+            yield compressor.chunk(data)
+    yield compressor.finish()
+
+
+def mark_encoded(response, encoding):
+    """
+    Заголовки ответа, тело которого сжато encoding.
+    """
+    response['Content-Encoding'] = encoding
+    patch_vary_headers(response, ('Accept-Encoding',))
+    etag = response.get('ETag')
+    if etag and etag.startswith('"'):
+        response['ETag'] = 'W/' + etag
+    return response
+
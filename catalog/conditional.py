@@ -0,0 +1,105 @@
+"""
+Условные GET (If-None-Match / If-Modified-Since) для каталога, поиска и карточки товара:
+304 отдаётся до сборки и сериализации ответа.
+
+Валидаторы — слабый ETag и Last-Modified, проверка стоит одно чтение Redis или один запрос:
+- каталог магазина — версия и время изменения магазина (catalog.response_cache), MGET;
+- поиск — версия каталога в целом (растёт при любой инвалидации каталога магазинов)
+  и магазин пользователя, MGET;
+- карточка товара — наибольший updated_at товара, его цены и остатка в магазине пользователя
+  и показываемых изображений: один запрос по первичному ключу и уникальным индексам, а для
+  ответа 200 — из уже загруженных объектов. Удаление цены, остатка или изображения
+  обновляет updated_at товара (catalog.signals).
+
+view_count в валидаторы не входит: в ответе 304 число просмотров может быть устаревшим.
+"""
+from django.db.models import F, OuterRef, Q, Subquery
+from django.db.models.functions import Greatest
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from .models import Price, Product, ProductImage, Stock
+
+
+def is_conditional(request):
+    return 'If-None-Match' in request.headers or 'If-Modified-Since' in request.headers
+
+
+def make_etag(*parts):
+    return 'W/"{}"'.format('-'.join(str(part) for part in parts))
+
+
+def set_validators(response, etag, last_modified=None):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def not_modified(request, etag, last_modified=None):
+    """
+    Ответ 304 (или 412 для If-Match), если валидаторы клиента совпали, иначе None.
+    last_modified — unix time в секундах.
+    """
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        set_validators(response, etag, last_modified)
+    return response
+
+
+def catalog_validators(store, version, modified):
+    return make_etag('catalog', store.pk, store.city_id, version), modified
+
+
+def search_validators(store, version, modified):
+    # Выдача зависит от магазина пользователя (in_user_store, цена, остаток, изображения города)
+    store_part = f'{store.pk}.{store.city_id}' if store else 0
+    return make_etag('search', store_part, version), modified
+
+
+def product_validators(product_id, store, version):
+    """
+    (ETag, Last-Modified) карточки товара по version — наибольшему updated_at.
+    """
+    micros = round(version.timestamp() * 1_000_000)
+    return make_etag('product', product_id, store.pk if store else 0, micros), int(version.timestamp())
+
+
+def product_version_queryset(product_id, store):
+    """
+    Версия карточки товара одним запросом (для sync и async ORM): values_list с одним значением,
+    пустой — если товара нет.
+    """
+    return _with_version(Product.objects.filter(pk=product_id), store).values_list('version', flat=True)
+
+
+def product_versions_queryset(product_ids, store):
+    """
+    То же для нескольких товаров: (id, версия, view_count) одним запросом.
+    """
+    return _with_version(Product.objects.filter(pk__in=product_ids), store).values_list(
+        'pk', 'version', 'view_count'
+    )
+
+
+def _with_version(queryset, store):
+    images = ProductImage.objects.filter(product=OuterRef('pk'))
+    if store:
+        images = images.filter(Q(city__isnull=True) | Q(city_id=store.city_id))
+    else:
+        images = images.filter(city__isnull=True)
+    versions = [F('updated_at'), Subquery(images.order_by('-updated_at').values('updated_at')[:1])]
+    if store:
+        for model in (Price, Stock):
+            rows = model.objects.filter(product=OuterRef('pk'), store=store)
+            versions.append(Subquery(rows.values('updated_at')[:1]))
+    # GREATEST в PostgreSQL пропускает NULL (нет цены, остатка или изображений)
+    return queryset.annotate(version=Greatest(*versions))
+
+
+def loaded_product_version(product):
+    """
+    То же для товара, загруженного с with_store_data, — без запроса.
+    """
+    rows = product.store_prices + product.store_stocks + product.store_images
+    return max([product.updated_at] + [row.updated_at for row in rows])
@@ -0,0 +1,138 @@
+"""
+Чтение с реплик Postgres (DATABASE_REPLICAS) с read-your-writes для автора записи.
+
+PrimaryReplicaRouter отправляет чтения HTTP-запросов на случайную реплику, записи и миграции —
+на primary. Вне HTTP-запроса (задачи Celery, команды, сигналы в shell) все запросы идут на primary.
+Внутри запроса на primary остаются:
+- запросы с изменяющим методом (POST/PUT/PATCH/DELETE) целиком — DatabaseRoutingMiddleware;
+- запросы пользователя, писавшего в последние DATABASE_REPLICA_STICKY_SECONDS секунд
+  (метка в Redis ставится после его изменяющего запроса, проверяется при аутентификации);
+- код внутри use_primary() и внутри transaction.atomic на primary.
+
+Состояние запроса — изменяемый объект в ContextVar: его видят и sync-код в потоках
+sync_to_async (контекст копируется), и async views. Без реплик роутер всегда отвечает 'default',
+а middleware и аутентификация не обращаются к Redis.
+
+Долгоживущие кэши, которые нельзя сбросить повторным чтением той же версии — справочники City/Store
+процесса (catalog.reference) и магазин пользователя в Redis (catalog.user_store), — заполняются
+только с primary. Ответы, собранные из отстающей реплики сразу после записи, могут попасть в кэш
+страниц (catalog.response_cache) под новой версией магазина — до следующей записи в магазин или TTL.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django_redis import get_redis_connection
+
+from .async_redis import get_async_redis
+
+STICKY_KEY = 'catalog:db:primary:{user_id}'
+
+SAFE_METHODS = frozenset(('GET', 'HEAD', 'OPTIONS', 'TRACE'))
+
+
+class RoutingState:
+    __slots__ = ('primary', 'wrote', 'user_id')
+
+    def __init__(self, primary=False, wrote=False):
+        self.primary = primary
+        self.wrote = wrote
+        self.user_id = None
+
+
+_state = ContextVar('catalog_db_routing', default=None)
+
+
+def replicas_enabled():
+    return bool(settings.DATABASE_REPLICAS)
+
+
+@contextmanager
+def use_primary():
+    """
+    Все запросы внутри блока, включая чтения, идут на primary.
+    """
+    token = _state.set(RoutingState(primary=True))
+    try:
+        yield
+    finally:
+        _state.reset(token)
+
+
+def start_request(method):
+    """
+    Состояние маршрутизации на время запроса; изменяющий запрос целиком идёт на primary.
+    Возвращает токен для finish_request / afinish_request.
+    """
+    wrote = method not in SAFE_METHODS
+    return _state.set(RoutingState(primary=wrote, wrote=wrote))
+
+
+def _sticky_key(user_id):
+    return STICKY_KEY.format(user_id=user_id)
+
+
+def finish_request(token):
+    state = _state.get()
+    _state.reset(token)
+    if state.wrote and state.user_id is not None:
+        get_redis_connection('default').set(
+            _sticky_key(state.user_id), 1, ex=settings.DATABASE_REPLICA_STICKY_SECONDS)
+
+
+async def afinish_request(token):
+    state = _state.get()
+    _state.reset(token)
+    if state.wrote and state.user_id is not None:
+        await get_async_redis().set(
+            _sticky_key(state.user_id), 1, ex=settings.DATABASE_REPLICA_STICKY_SECONDS)
+
+
+def set_request_user(user_id):
+    """
+    Пользователь запроса (из аутентификации): недавно писавший читает с primary.
+    """
+    state = _state.get()
+    if state is None or user_id is None or not replicas_enabled():
+        return
+    state.user_id = user_id
+    if not state.primary and get_redis_connection('default').exists(_sticky_key(user_id)):
+        state.primary = True
+
+
+async def aset_request_user(user_id):
+    state = _state.get()
+    if state is None or user_id is None or not replicas_enabled():
+        return
+    state.user_id = user_id
+    if not state.primary and await get_async_redis().exists(_sticky_key(user_id)):
+        state.primary = True
+
+
+class PrimaryReplicaRouter:
+    """
+    DATABASE_ROUTERS: чтения HTTP-запроса — на реплику из DATABASE_REPLICAS, если запрос
+    не закреплён за primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        if not replicas:
+            return DEFAULT_DB_ALIAS
+        state = _state.get()
+        # Внутри транзакции на primary читаем её же данные
+        if state is None or state.primary or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики содержат те же данные, что и primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
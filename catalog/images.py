@@ -0,0 +1,96 @@
+"""
+Хранение изображений товаров в бинарном виде, адресация по sha256 содержимого.
+
+ProductImage.image_data (base64) декодируется один раз при сохранении
+(или командой migrate_image_storage для старых строк) в ProductImage.content.
+Эндпоинт /api/v1/images/<hash> отдаёт байты из Redis-кэша, при промахе — из Postgres.
+"""
+import base64
+import binascii
+import hashlib
+import re
+
+from django.core.cache import cache
+
+IMAGE_CACHE_KEY = 'catalog:image:{}'
+IMAGE_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+DEFAULT_CONTENT_TYPE = 'application/octet-stream'
+# Единственные типы, которые отдаёт /api/v1/images/: тип из data URI задаёт клиент,
+# и text/html или image/svg+xml с того же origin, что и API, — хранимый XSS
+IMAGE_CONTENT_TYPES = frozenset(('image/png', 'image/jpeg', 'image/gif', 'image/webp'))
+
+_data_uri_re = re.compile(r'^data:(?P<content_type>[\w.+-]+/[\w.+-]+)?(;[\w=-]+)*;base64,')
+_signatures = (
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+)
+
+
+def sniff_content_type(content):
+    for signature, content_type in _signatures:
+        if content.startswith(signature):
+            return content_type
+    if content[:4] == b'RIFF' and content[8:12] == b'WEBP':
+        return 'image/webp'
+    return DEFAULT_CONTENT_TYPE
+
+
+def safe_content_type(content_type):
+    """
+    content_type, если это разрешённый тип изображения, иначе DEFAULT_CONTENT_TYPE.
+    """
+    content_type = (content_type or '').lower()
+    return content_type if content_type in IMAGE_CONTENT_TYPES else DEFAULT_CONTENT_TYPE
+
+
+def decode_image_data(image_data):
+    """
+    base64 (в т.ч. data URI) -> (байты, content type).
+    Строки, которые не являются корректным base64, сохраняются как есть (utf-8).
+    Тип из data URI принимается только из IMAGE_CONTENT_TYPES, иначе — определённый по байтам.
+    """
+    content_type = None
+    match = _data_uri_re.match(image_data)
+    if match:
+        content_type = match.group('content_type')
+        image_data = image_data[match.end():]
+
+    try:
+        content = base64.b64decode(''.join(image_data.split()), validate=True)
+    except (binascii.Error, ValueError):
+        content = image_data.encode('utf-8')
+
+    if content_type and content_type.lower() in IMAGE_CONTENT_TYPES:
+        return content, content_type.lower()
+    return content, sniff_content_type(content)
+
+
+def content_hash(content):
+    return hashlib.sha256(content).hexdigest()
+
+
+def get_image(content_hash_value):
+    """
+    (байты, content type) по хэшу или None. Горячие изображения отдаются из Redis без запроса к БД.
+    """
+    from .models import ProductImage
+
+    key = IMAGE_CACHE_KEY.format(content_hash_value)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    row = (
+        ProductImage.objects.filter(content_hash=content_hash_value, content__isnull=False)
+        .values_list('content', 'content_type')
+        .first()
+    )
+    if row is None:
+        return None
+
+    # Строки, сохранённые до ограничения типов, могут содержать любой тип из data URI
+    image = (bytes(row[0]), safe_content_type(row[1]))
+    cache.set(key, image, IMAGE_CACHE_TIMEOUT)
+    return image
@@ -0,0 +1,108 @@
+"""
+Профиль запроса: число и время SQL-запросов, повторяющиеся запросы (N+1), время этапов
+(сериализация). Профиль хранится в contextvar: SQL-обёртка и timing() работают только
+в запросах, выбранных PerformanceMiddleware для профилирования, в остальных это no-op.
+"""
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack, asynccontextmanager, contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import sync_to_async
+from django.db import connections
+
+_current_profile = ContextVar('catalog_request_profile', default=None)
+# IN (%s, %s, ...) и VALUES (%s, %s), (%s, %s) разной длины — один и тот же запрос
+_placeholders_re = re.compile(r'\(\s*%s(?:\s*,\s*%s)*\s*\)(?:\s*,\s*\(\s*%s(?:\s*,\s*%s)*\s*\))*')
+
+
+def fingerprint(sql):
+    return _placeholders_re.sub('(...)', sql)
+
+
+class RequestProfile:
+    """
+    Вызывается как execute_wrapper для каждого SQL-запроса. Нормализация SQL откладывается
+    до duplicate_queries(): на горячем пути — только замер времени и счётчик по тексту запроса.
+    """
+
+    def __init__(self):
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.timings = {}
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.db_queries += 1
+            self.statements[sql] += 1
+
+    def add_timing(self, name, seconds):
+        self.timings[name] = self.timings.get(name, 0.0) + seconds
+
+    def duplicate_queries(self, threshold):
+        """
+        {fingerprint: count} запросов, выполненных не меньше threshold раз за запрос.
+        """
+        counts = Counter()
+        for sql, count in self.statements.items():
+            counts[fingerprint(sql)] += count
+        return {sql: count for sql, count in counts.most_common() if count >= threshold}
+
+
+@contextmanager
+def profile_request():
+    """
+    Профилирует SQL на всех подключениях и timing() внутри блока.
+    """
+    profile = RequestProfile()
+    token = _current_profile.set(profile)
+    try:
+        with ExitStack() as stack:
+            _wrap_connections(stack, profile)
+            yield profile
+    finally:
+        _current_profile.reset(token)
+
+
+@asynccontextmanager
+async def aprofile_request():
+    """
+    profile_request для async views. Подключения к БД привязаны к потоку, а async ORM
+    выполняет SQL в потоке sync_to_async запроса — обёртка ставится и снимается там же.
+    """
+    profile = RequestProfile()
+    token = _current_profile.set(profile)
+    stack = ExitStack()
+    try:
+        await sync_to_async(_wrap_connections)(stack, profile)
+        yield profile
+    finally:
+        await sync_to_async(stack.close)()
+        _current_profile.reset(token)
+
+
+def _wrap_connections(stack, profile):
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(profile))
+
+
+@contextmanager
+def timing(name):
+    """
+    Добавляет время блока к этапу name профиля текущего запроса (если он профилируется).
+    """
+    profile = _current_profile.get()
+    if profile is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.add_timing(name, time.perf_counter() - started)
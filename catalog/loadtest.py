@@ -0,0 +1,106 @@
+"""
+Замеры производительности API: перцентили латентности, запросы к БД и размер ответа
+на запрос, проверка порогов. Используется бенчмарками (catalog/tests/benchmarks)
+и HTTP-драйвером нагрузки (manage.py load_catalog).
+"""
+import json
+import math
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+# Метрики, для которых задаются пороги: значение в сводке не должно превышать порог
+THRESHOLD_METRICS = ('p50_ms', 'p95_ms', 'p99_ms', 'queries', 'bytes')
+
+
+def percentile(values, pct):
+    """
+    Перцентиль методом nearest rank по отсортированному списку.
+    """
+    if not values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(values)))
+    return values[rank - 1]
+
+
+def summarize(latencies, sizes, queries=None):
+    """
+    latencies — секунды, sizes — байты ответа, queries — число SQL-запросов на каждый запрос (если известно).
+    """
+    ordered = sorted(latencies)
+    summary = {
+        'requests': len(ordered),
+        'p50_ms': percentile(ordered, 50) * 1000,
+        'p95_ms': percentile(ordered, 95) * 1000,
+        'p99_ms': percentile(ordered, 99) * 1000,
+        'max_ms': (ordered[-1] if ordered else 0.0) * 1000,
+        'bytes': max(sizes, default=0),
+    }
+    if queries is not None:
+        summary['queries'] = max(queries, default=0)
+    return summary
+
+
+def check_thresholds(name, summary, thresholds, latency_factor=1.0):
+    """
+    Список нарушений порогов. Пороги латентности умножаются на latency_factor
+    (для медленных машин и CI), запросы и байты сравниваются как есть.
+    """
+    violations = []
+    for metric in THRESHOLD_METRICS:
+        limit = thresholds.get(metric)
+        if limit is None or metric not in summary:
+            continue
+        if metric.endswith('_ms'):
+            limit *= latency_factor
+        if summary[metric] > limit:
+            violations.append(f"{name}: {metric} {summary[metric]:.1f} > {limit:.1f}")
+    return violations
+
+
+def format_summary(name, summary):
+    queries = f" queries={summary['queries']}" if 'queries' in summary else ''
+    return (
+        f"{name:<16} n={summary['requests']:<5} p50={summary['p50_ms']:7.1f}ms "
+        f"p95={summary['p95_ms']:7.1f}ms p99={summary['p99_ms']:7.1f}ms "
+        f"max={summary['max_ms']:7.1f}ms bytes={summary['bytes']}{queries}"
+    )
+
+
+def obtain_token(base_url, username, password, timeout=10):
+    request = urllib.request.Request(
+        base_url.rstrip('/') + '/api/v1/token/',
+        data=json.dumps({'username': username, 'password': password}).encode(),
+        headers={'Content-Type': 'application/json'},
+    )
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.load(response)['access']
+
+
+def fetch(url, headers, timeout=30):
+    """
+    GET url: (латентность в секундах, байт в ответе, HTTP статус).
+    """
+    request = urllib.request.Request(url, headers=headers)
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            body = response.read()
+            status = response.status
+    except urllib.error.HTTPError as exc:
+        body = exc.read()
+        status = exc.code
+    return time.perf_counter() - started, len(body), status
+
+
+def run_load(urls, headers, concurrency=10):
+    """
+    Выполняет GET по списку urls в concurrency потоках.
+    Возвращает (сводка, число ответов со статусом >= 400).
+    """
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda url: fetch(url, headers), urls))
+    errors = sum(1 for _, _, status in results if status >= 400)
+    summary = summarize([latency for latency, _, _ in results], [size for _, size, _ in results])
+    return summary, errors
@@ -0,0 +1,33 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from catalog.bulk_copy import ENTITIES, FORMATS, export_entity
+
+from .catalog_import import guess_format
+
+
+class Command(BaseCommand):
+    help = (
+        "Выгрузка каталога через COPY TO STDOUT в формате catalog_import (CSV или NDJSON). "
+        "Пример: manage.py catalog_export stocks stocks.csv; без пути — в stdout."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('entity', choices=list(ENTITIES))
+        parser.add_argument('path', nargs='?', default='-')
+        parser.add_argument('--format', choices=FORMATS,
+                            help="По умолчанию по расширению файла: .ndjson / .jsonl — NDJSON, иначе CSV.")
+
+    def handle(self, *args, entity, path, **options):
+        fmt = guess_format(path, options['format'])
+        if path == '-':
+            rows = export_entity(entity, sys.stdout.buffer, fmt)
+            sys.stdout.buffer.flush()
+            # stdout занят данными
+            self.stderr.write(f"Exported {rows} {entity}")
+            return
+
+        with open(path, 'wb') as stream:
+            rows = export_entity(entity, stream, fmt)
+        self.stdout.write(self.style.SUCCESS(f"Done: {rows} {entity} exported to {path}"))
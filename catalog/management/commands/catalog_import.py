@@ -0,0 +1,43 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError
+
+from catalog.bulk_copy import ENTITIES, FORMATS, import_entity
+
+
+def guess_format(path, fmt):
+    if fmt:
+        return fmt
+    return 'ndjson' if path.endswith(('.ndjson', '.jsonl')) else 'csv'
+
+
+class Command(BaseCommand):
+    help = (
+        "Массовая загрузка каталога через COPY FROM STDIN: CSV с заголовком или NDJSON, "
+        "ссылки по естественным ключам (город по имени, магазин по городу и имени, товар по id). "
+        "Загружайте в порядке: " + ', '.join(ENTITIES) + ". Пример: "
+        "manage.py catalog_import stocks stocks.csv; '-' — чтение из stdin."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('entity', choices=list(ENTITIES))
+        parser.add_argument('path', nargs='?', default='-')
+        parser.add_argument('--format', choices=FORMATS,
+                            help="По умолчанию по расширению файла: .ndjson / .jsonl — NDJSON, иначе CSV.")
+
+    def handle(self, *args, entity, path, **options):
+        fmt = guess_format(path, options['format'])
+        try:
+            if path == '-':
+                result = import_entity(entity, sys.stdin.buffer, fmt)
+            else:
+                with open(path, 'rb') as stream:
+                    result = import_entity(entity, stream, fmt)
+        except (OSError, ValueError, DatabaseError) as exc:
+            raise CommandError(f"{entity}: {exc}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Done: {entity} {result['read']} rows read, {result['written']} written, "
+            f"{result['skipped']} skipped"
+        ))
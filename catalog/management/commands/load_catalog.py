@@ -0,0 +1,76 @@
+import json
+import urllib.parse
+import urllib.request
+from itertools import cycle, islice
+
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog.loadtest import check_thresholds, format_summary, obtain_token, run_load
+
+ENDPOINTS = ('catalog', 'catalog-page', 'search', 'product-detail')
+
+
+class Command(BaseCommand):
+    help = (
+        "Нагрузочный тест запущенного сервера: параллельные GET к эндпоинтам каталога, "
+        "отчёт p50/p95/p99 и размер ответа. Завершается с ошибкой, если превышен "
+        "любой из заданных порогов. Данные: manage.py seed_catalog."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://localhost:8000')
+        parser.add_argument('--username', default='bench-0')
+        parser.add_argument('--password', default='benchpass')
+        parser.add_argument('--endpoints', default=','.join(ENDPOINTS),
+                            help=f"Через запятую: {', '.join(ENDPOINTS)}.")
+        parser.add_argument('--requests', type=int, default=200, help="Запросов на эндпоинт.")
+        parser.add_argument('--concurrency', type=int, default=10)
+        parser.add_argument('--query', default='laptop', help="Строка поиска для search.")
+        parser.add_argument('--max-p50-ms', type=float)
+        parser.add_argument('--max-p95-ms', type=float)
+        parser.add_argument('--max-p99-ms', type=float)
+        parser.add_argument('--max-bytes', type=int)
+
+    def handle(self, *args, **options):
+        endpoints = [name.strip() for name in options['endpoints'].split(',') if name.strip()]
+        unknown = set(endpoints) - set(ENDPOINTS)
+        if unknown:
+            raise CommandError(f"Unknown endpoints: {', '.join(sorted(unknown))}")
+
+        base_url = options['base_url'].rstrip('/') + '/api/v1'
+        token = obtain_token(options['base_url'], options['username'], options['password'])
+        headers = {'Authorization': f'Bearer {token}'}
+        thresholds = {
+            'p50_ms': options['max_p50_ms'],
+            'p95_ms': options['max_p95_ms'],
+            'p99_ms': options['max_p99_ms'],
+            'bytes': options['max_bytes'],
+        }
+
+        violations = []
+        for name in endpoints:
+            urls = list(islice(cycle(self.urls(name, base_url, headers, options)), options['requests']))
+            summary, errors = run_load(urls, headers, options['concurrency'])
+            self.stdout.write(format_summary(name, summary) + (f" errors={errors}" if errors else ''))
+            if errors:
+                violations.append(f"{name}: {errors} responses with status >= 400")
+            violations.extend(check_thresholds(name, summary, thresholds))
+
+        if violations:
+            raise CommandError("Thresholds exceeded:\n" + '\n'.join(violations))
+
+    def urls(self, name, base_url, headers, options):
+        if name == 'catalog':
+            return [f'{base_url}/catalog/']
+        if name == 'catalog-page':
+            return [f'{base_url}/catalog/?limit=100']
+        if name == 'search':
+            return [f'{base_url}/search/?q={urllib.parse.quote(options["query"])}&limit=20']
+
+        # product-detail: перебираем товары с первой страницы каталога пользователя
+        request = urllib.request.Request(f'{base_url}/catalog/?limit=100', headers=headers)
+        with urllib.request.urlopen(request, timeout=30) as response:
+            ids = [item['id'] for item in json.load(response)['results']]
+        if not ids:
+            raise CommandError("Catalog is empty: run manage.py seed_catalog first")
+        return [f'{base_url}/product/{pk}/' for pk in ids]
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from catalog.models import ProductImage
+from catalog.projection import refresh_products
+
+
+class Command(BaseCommand):
+    help = (
+        "Переносит изображения товаров из base64 (image_data) в бинарное хранение "
+        "(content + content_hash) для отдачи через /api/v1/images/<hash>."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--clear-base64', action='store_true',
+            help="Очистить image_data после переноса, чтобы освободить место в БД.",
+        )
+
+    def handle(self, *args, batch_size, clear_base64, **options):
+        fields = ['content', 'content_hash', 'content_type'] + (['image_data'] if clear_base64 else [])
+        pending = ProductImage.objects.filter(content__isnull=True).exclude(image_data='')
+        total = 0
+
+        # Выбираем пачку заново после каждого обновления: обработанные строки
+        # выпадают из выборки, поэтому команду можно прервать и перезапустить.
+        while True:
+            batch = list(pending.only('id', 'product_id', 'image_data').order_by('id')[:batch_size])
+            if not batch:
+                break
+            for image in batch:
+                image.set_content_from_image_data()
+                if clear_base64:
+                    image.image_data = ''
+            with transaction.atomic():
+                ProductImage.objects.bulk_update(batch, fields)
+                # Хэши изображений хранятся в проекции каталога
+                refresh_products({image.product_id for image in batch})
+            total += len(batch)
+            self.stdout.write(f"Migrated {total} images")
+
+        if clear_base64:
+            cleared = (
+                ProductImage.objects.filter(content__isnull=False).exclude(image_data='').update(image_data='')
+            )
+            if cleared:
+                self.stdout.write(f"Cleared base64 for {cleared} already migrated images")
+
+        self.stdout.write(self.style.SUCCESS(f"Done: {total} images migrated"))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from catalog.models import Store
+from catalog.projection import rebuild_catalog_entries
+from catalog.response_cache import bump_store_versions
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересобирает проекцию каталога (StoreCatalogEntry) из товаров, цен, остатков и изображений: "
+        "после массовых изменений в обход ORM-сигналов или для проверки расхождений."
+    )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            result = rebuild_catalog_entries()
+            if result['written'] or result['removed']:
+                bump_store_versions(Store.objects.values_list('pk', flat=True))
+        self.stdout.write(self.style.SUCCESS(
+            f"Done: {result['written']} entries written, {result['removed']} removed"
+        ))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from catalog.seeding import seed_catalog
+
+
+class Command(BaseCommand):
+    help = (
+        "Заполняет БД тестовым каталогом (города, магазины, товары, цены, остатки, изображения) "
+        "и пользователями bench-N для нагрузочного тестирования (см. load_catalog)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cities', type=int, default=3)
+        parser.add_argument('--stores-per-city', type=int, default=3)
+        parser.add_argument('--products', type=int, default=10000)
+        parser.add_argument('--stock-share', type=float, default=0.3,
+                            help="Доля магазинов, в которых продаётся каждый товар.")
+        parser.add_argument('--city-image-share', type=float, default=0.2)
+        parser.add_argument('--users', type=int, default=10)
+        parser.add_argument('--password', default='benchpass')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        catalog = seed_catalog(
+            cities=options['cities'],
+            stores_per_city=options['stores_per_city'],
+            products=options['products'],
+            stock_share=options['stock_share'],
+            city_image_share=options['city_image_share'],
+            users=options['users'],
+            password=options['password'],
+            seed=options['seed'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {len(catalog.cities)} cities, {len(catalog.stores)} stores, "
+            f"{len(catalog.products)} products, users bench-0..bench-{len(catalog.users) - 1}"
+        ))
@@ -0,0 +1,236 @@
+"""
+Метрики API в формате Prometheus (/metrics).
+
+Счётчики лежат в Redis-хэше, поле — имя серии вместе с метками, поэтому /metrics
+отдаёт сумму по всем воркерам gunicorn. Метрики запросов копятся в памяти процесса
+и переносятся в Redis одним pipeline не чаще раза в METRICS_FLUSH_INTERVAL секунд
+(при выходе процесса и перед отдачей /metrics — сразу): запрос Redis не трогает.
+Воркеры, сбросившие счётчики давно, видны в /metrics с задержкой до интервала.
+Метки ограничены именем маршрута (url_name), методом и статусом: путь с id товара
+в метки не попадает. Задачи Celery пишут в тот же хэш свои серии catalog_task_*
+(метки — имя задачи и итоговое состояние).
+"""
+import atexit
+import re
+import threading
+import time
+
+from django.conf import settings
+from django_redis import get_redis_connection
+
+from .async_redis import get_async_redis
+from .response_cache import cache_stats
+
+METRICS_KEY = 'catalog:metrics'
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+TASK_DURATION_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+# Семейство метрики: (тип, описание)
+FAMILIES = {
+    'catalog_http_requests_total': ('counter', 'HTTP requests by route, method and status.'),
+    'catalog_http_request_duration_seconds': ('histogram', 'Request duration in the Django stack.'),
+    'catalog_http_response_bytes_total': ('counter', 'Response body bytes (streaming responses excluded).'),
+    'catalog_http_profiled_requests_total': ('counter', 'Requests sampled for SQL and phase profiling.'),
+    'catalog_http_db_queries_total': ('counter', 'SQL queries issued by profiled requests.'),
+    'catalog_http_db_seconds_total': ('counter', 'SQL time of profiled requests.'),
+    'catalog_http_phase_seconds_total': ('counter', 'Time of profiled request phases (serialize, ...).'),
+    'catalog_http_duplicate_queries_total': ('counter', 'Repeated SQL statements (N+1) in profiled requests.'),
+    'catalog_page_cache_events_total': ('counter', 'Catalog page cache hits, misses and lock waits.'),
+    'catalog_task_runs_total': ('counter', 'Celery task runs by task and final state.'),
+    'catalog_task_duration_seconds': ('histogram', 'Celery task run duration.'),
+    'catalog_task_rows_total': ('counter', 'Rows processed by successful task runs.'),
+    'catalog_task_rows_per_second': ('gauge', 'Rows per second of the last successful task run.'),
+    'catalog_task_retries_total': ('counter', 'Celery task retries by task and reason.'),
+}
+
+_series_re = re.compile(r'^(?P<name>\w+?)(?P<suffix>_bucket|_sum|_count)?\{(?P<labels>.*)\}$')
+_le_re = re.compile(r',?le="([^"]+)"')
+
+
+def _redis():
+    return get_redis_connection('default')
+
+
+class _Buffer:
+    """
+    Приращения счётчиков процесса до переноса в Redis: поле хэша -> сумма.
+    Повторяет hincrby / hincrbyfloat pipeline, поэтому _add_request пишет в него так же.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ints = {}
+        self.floats = {}
+        self.flushed_at = time.monotonic()
+
+    def hincrby(self, key, field, amount):
+        self.ints[field] = self.ints.get(field, 0) + amount
+
+    def hincrbyfloat(self, key, field, amount):
+        self.floats[field] = self.floats.get(field, 0.0) + amount
+
+    def due(self):
+        return time.monotonic() - self.flushed_at >= settings.METRICS_FLUSH_INTERVAL
+
+    def take(self):
+        with self.lock:
+            ints, floats = self.ints, self.floats
+            self.ints, self.floats = {}, {}
+            self.flushed_at = time.monotonic()
+        return ints, floats
+
+    def restore(self, ints, floats):
+        # Redis недоступен: приращения вернутся при следующем сбросе (их не больше, чем серий)
+        with self.lock:
+            for field, amount in ints.items():
+                self.hincrby(METRICS_KEY, field, amount)
+            for field, amount in floats.items():
+                self.hincrbyfloat(METRICS_KEY, field, amount)
+
+
+_buffer = _Buffer()
+
+
+def _fill(pipe, ints, floats):
+    for field, amount in ints.items():
+        pipe.hincrby(METRICS_KEY, field, amount)
+    for field, amount in floats.items():
+        pipe.hincrbyfloat(METRICS_KEY, field, amount)
+
+
+def flush():
+    """
+    Переносит накопленные процессом метрики запросов в Redis.
+    """
+    ints, floats = _buffer.take()
+    if not ints and not floats:
+        return
+    pipe = _redis().pipeline(transaction=False)
+    _fill(pipe, ints, floats)
+    try:
+        pipe.execute()
+    except Exception:
+        _buffer.restore(ints, floats)
+        raise
+
+
+async def aflush():
+    ints, floats = _buffer.take()
+    if not ints and not floats:
+        return
+    pipe = get_async_redis().pipeline(transaction=False)
+    _fill(pipe, ints, floats)
+    try:
+        await pipe.execute()
+    except Exception:
+        _buffer.restore(ints, floats)
+        raise
+
+
+def reset_buffer():
+    _buffer.take()
+
+
+def _flush_at_exit():
+    try:
+        flush()
+    except Exception:
+        pass
+
+
+atexit.register(_flush_at_exit)
+
+
+def record_request(route, method, status, duration, size, profile=None, duplicates=0):
+    with _buffer.lock:
+        _add_request(_buffer, route, method, status, duration, size, profile, duplicates)
+    if _buffer.due():
+        flush()
+
+
+async def arecord_request(route, method, status, duration, size, profile=None, duplicates=0):
+    with _buffer.lock:
+        _add_request(_buffer, route, method, status, duration, size, profile, duplicates)
+    if _buffer.due():
+        await aflush()
+
+
+def _add_request(pipe, route, method, status, duration, size, profile, duplicates):
+    labels = f'route="{route}",method="{method}"'
+    pipe.hincrby(METRICS_KEY, f'catalog_http_requests_total{{{labels},status="{status}"}}', 1)
+
+    _add_histogram(pipe, 'catalog_http_request_duration_seconds', labels, duration, DURATION_BUCKETS)
+
+    if size:
+        pipe.hincrby(METRICS_KEY, f'catalog_http_response_bytes_total{{{labels}}}', size)
+
+    if profile is not None:
+        pipe.hincrby(METRICS_KEY, f'catalog_http_profiled_requests_total{{{labels}}}', 1)
+        pipe.hincrby(METRICS_KEY, f'catalog_http_db_queries_total{{{labels}}}', profile.db_queries)
+        pipe.hincrbyfloat(METRICS_KEY, f'catalog_http_db_seconds_total{{{labels}}}', profile.db_time)
+        for phase, seconds in profile.timings.items():
+            pipe.hincrbyfloat(METRICS_KEY, f'catalog_http_phase_seconds_total{{{labels},phase="{phase}"}}', seconds)
+        if duplicates:
+            pipe.hincrby(METRICS_KEY, f'catalog_http_duplicate_queries_total{{{labels}}}', duplicates)
+
+
+def _add_histogram(pipe, histogram, labels, value, buckets):
+    for bucket in buckets:
+        if value <= bucket:
+            pipe.hincrby(METRICS_KEY, f'{histogram}_bucket{{{labels},le="{bucket}"}}', 1)
+    pipe.hincrby(METRICS_KEY, f'{histogram}_bucket{{{labels},le="+Inf"}}', 1)
+    pipe.hincrbyfloat(METRICS_KEY, f'{histogram}_sum{{{labels}}}', value)
+    pipe.hincrby(METRICS_KEY, f'{histogram}_count{{{labels}}}', 1)
+
+
+def record_task(task, state, duration, rows=None):
+    """
+    Один запуск задачи: состояние (SUCCESS, FAILURE, RETRY), длительность и, для успешных,
+    число обработанных строк.
+    """
+    labels = f'task="{task}"'
+    pipe = _redis().pipeline(transaction=False)
+    pipe.hincrby(METRICS_KEY, f'catalog_task_runs_total{{{labels},state="{state}"}}', 1)
+    _add_histogram(pipe, 'catalog_task_duration_seconds', labels, duration, TASK_DURATION_BUCKETS)
+    if rows is not None:
+        pipe.hincrby(METRICS_KEY, f'catalog_task_rows_total{{{labels}}}', rows)
+        if duration > 0:
+            pipe.hset(METRICS_KEY, f'catalog_task_rows_per_second{{{labels}}}', round(rows / duration, 3))
+    pipe.execute()
+
+
+def record_task_retry(task, reason):
+    _redis().hincrby(METRICS_KEY, f'catalog_task_retries_total{{task="{task}",reason="{reason}"}}', 1)
+
+
+def _sort_key(series):
+    # Бакеты гистограммы — по возрастанию le, +Inf последним
+    match = _series_re.match(series)
+    le = _le_re.search(series)
+    bound = float(le.group(1)) if le else 0.0
+    return match.group('name'), _le_re.sub('', match.group('labels')), match.group('suffix') or '', bound
+
+
+def render_metrics():
+    """
+    Текст в формате Prometheus exposition 0.0.4.
+    """
+    flush()
+    values = {
+        field.decode(): value.decode()
+        for field, value in _redis().hgetall(METRICS_KEY).items()
+    }
+    for event, count in cache_stats().items():
+        values[f'catalog_page_cache_events_total{{event="{event}"}}'] = str(count)
+
+    lines = []
+    family = None
+    for series in sorted(values, key=_sort_key):
+        name = _series_re.match(series).group('name')
+        if name != family:
+            family = name
+            kind, description = FAMILIES.get(name, ('untyped', ''))
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} {kind}')
+        lines.append(f'{series} {values[series]}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,221 @@
+import json
+import logging
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from redis.exceptions import RedisError
+
+from . import compression, db_routing, metrics
+from .instrumentation import aprofile_request, profile_request
+
+logger = logging.getLogger('catalog.perf')
+
+
+class PerformanceMiddleware:
+    """
+    Метрики каждого запроса: длительность, статус, размер ответа (-> /metrics).
+
+    Доля PERF_SAMPLE_RATE запросов профилируется подробно: число и время SQL-запросов,
+    повторяющиеся запросы (N+1), время сериализации. Для них добавляется заголовок
+    Server-Timing и пишется JSON-строка в лог catalog.perf (WARNING для медленных
+    запросов и N+1). Непрофилируемые запросы стоят два perf_counter и запись в счётчики процесса
+    (в Redis они переносятся раз в METRICS_FLUSH_INTERVAL секунд, catalog.metrics).
+
+    Для потоковых ответов (?stream=1) учитывается только время до начала отдачи тела.
+    Работает и в sync (WSGI), и в async (ASGI) цепочке middleware.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not settings.PERF_METRICS_ENABLED:
+            return self.get_response(request)
+
+        started = time.perf_counter()
+        if random.random() < settings.PERF_SAMPLE_RATE:
+            with profile_request() as profile:
+                response = self.get_response(request)
+        else:
+            profile = None
+            response = self.get_response(request)
+
+        record = self.finish(request, response, time.perf_counter() - started, profile)
+        if record is not None:
+            try:
+                metrics.record_request(*record)
+            except RedisError:
+                # Метрики не должны ронять запрос
+                logger.warning("Failed to record request metrics", exc_info=True)
+        return response
+
+    async def __acall__(self, request):
+        if not settings.PERF_METRICS_ENABLED:
+            return await self.get_response(request)
+
+        started = time.perf_counter()
+        if random.random() < settings.PERF_SAMPLE_RATE:
+            async with aprofile_request() as profile:
+                response = await self.get_response(request)
+        else:
+            profile = None
+            response = await self.get_response(request)
+
+        record = self.finish(request, response, time.perf_counter() - started, profile)
+        if record is not None:
+            try:
+                await metrics.arecord_request(*record)
+            except RedisError:
+                logger.warning("Failed to record request metrics", exc_info=True)
+        return response
+
+    def finish(self, request, response, duration, profile):
+        """
+        Server-Timing и лог для профилированного запроса; аргументы для metrics.record_request
+        или None, если запрос не учитывается (сам /metrics).
+        """
+        match = request.resolver_match
+        route = match.url_name if match and match.url_name else 'unmatched'
+        if route == 'metrics':
+            return None
+
+        size = 0 if response.streaming else len(response.content)
+        duplicates = {}
+        if profile is not None:
+            duplicates = profile.duplicate_queries(settings.PERF_DUPLICATE_QUERY_THRESHOLD)
+            response['Server-Timing'] = self.server_timing(profile, duration)
+            self.log(request, route, response.status_code, duration, size, profile, duplicates)
+        return route, request.method, response.status_code, duration, size, profile, sum(duplicates.values())
+
+    @staticmethod
+    def server_timing(profile, duration):
+        entries = [f'db;dur={profile.db_time * 1000:.1f};desc="{profile.db_queries} queries"']
+        entries += [f'{name};dur={seconds * 1000:.1f}' for name, seconds in profile.timings.items()]
+        entries.append(f'total;dur={duration * 1000:.1f}')
+        return ', '.join(entries)
+
+    @staticmethod
+    def log(request, route, status, duration, size, profile, duplicates):
+        duration_ms = duration * 1000
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'route': route,
+            'status': status,
+            'duration_ms': round(duration_ms, 1),
+            'db_queries': profile.db_queries,
+            'db_ms': round(profile.db_time * 1000, 1),
+            **{f'{name}_ms': round(seconds * 1000, 1) for name, seconds in profile.timings.items()},
+            'bytes': size,
+        }
+        if duplicates:
+            record['duplicate_queries'] = [
+                {'count': count, 'sql': sql[:300]} for sql, count in duplicates.items()
+            ]
+        level = logging.WARNING if duplicates or duration_ms >= settings.PERF_SLOW_REQUEST_MS else logging.INFO
+        logger.log(level, json.dumps(record, ensure_ascii=False))
+
+
+class DatabaseRoutingMiddleware:
+    """
+    Маршрутизация запросов к БД на время HTTP-запроса (catalog.db_routing): изменяющие запросы
+    читают с primary, после них пользователь DATABASE_REPLICA_STICKY_SECONDS секунд читает с primary.
+    Без реплик (DATABASE_REPLICAS пуст) ничего не делает.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not db_routing.replicas_enabled():
+            return self.get_response(request)
+
+        token = db_routing.start_request(request.method)
+        try:
+            return self.get_response(request)
+        finally:
+            try:
+                db_routing.finish_request(token)
+            except RedisError:
+                logger.warning("Failed to pin user to primary database", exc_info=True)
+
+    async def __acall__(self, request):
+        if not db_routing.replicas_enabled():
+            return await self.get_response(request)
+
+        token = db_routing.start_request(request.method)
+        try:
+            return await self.get_response(request)
+        finally:
+            try:
+                await db_routing.afinish_request(token)
+            except RedisError:
+                logger.warning("Failed to pin user to primary database", exc_info=True)
+
+class CompressionMiddleware:
+    """
+    Сжатие ответов по Accept-Encoding (catalog.compression): JSON не меньше COMPRESSION_MIN_SIZE,
+    потоковые ответы — по фрагментам, если COMPRESSION_STREAMING. Уже сжатые view ответы не трогает.
+    В async-цепочке сжимает прямо в event loop: MiddlewareMixin ушёл бы в поток через sync_to_async.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return self.process_response(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.process_response(request, await self.get_response(request))
+
+    @staticmethod
+    def process_response(request, response):
+        if (response.has_header('Content-Encoding') or not response.has_header('Content-Type')
+                or not compression.compressible(response)):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = compression.accepted_encoding(request)
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            if not settings.COMPRESSION_STREAMING:
+                return response
+            if response.is_async:
+                response.streaming_content = compression.acompress_stream(response.streaming_content, encoding)
+            else:
+                response.streaming_content = compression.compress_stream(response.streaming_content, encoding)
+            del response['Content-Length']
+        else:
+            if len(response.content) < settings.COMPRESSION_MIN_SIZE:
+                return response
+            compressed = compression.compress(response.content, encoding)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response['Content-Length'] = str(len(compressed))
+        return compression.mark_encoded(response, encoding)
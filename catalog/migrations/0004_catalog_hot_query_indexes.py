@@ -0,0 +1,24 @@
+# Generated by Django 4.2.5 on 2026-10-18 01:49
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY не блокирует запись в таблицы и не работает внутри транзакции
+    atomic = False
+
+    dependencies = [
+        ('catalog', '0003_productimage_binary_content'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='price',
+            index=models.Index(fields=['store', 'product'], include=('amount',), name='price_store_product_amount'),
+        ),
+        AddIndexConcurrently(
+            model_name='stock',
+            index=models.Index(condition=models.Q(('quantity__gt', 0)), fields=['store', 'product'], name='stock_store_in_stock'),
+        ),
+    ]
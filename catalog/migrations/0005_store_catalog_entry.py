@@ -0,0 +1,65 @@
+# Generated by Django 4.2.5 on 2026-10-18 02:26
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# Первичное заполнение проекции; дальше её поддерживает catalog.projection
+# (и manage.py rebuild_catalog_entries для полной пересборки).
+POPULATE_CATALOG_ENTRIES = """
+INSERT INTO catalog_storecatalogentry (store_id, product_id, name, description, view_count, price, quantity, images)
+SELECT sc.store_id, sc.product_id, p.name, p.description, p.view_count,
+       pr.amount, coalesce(s.quantity, 0), img.images
+FROM (
+    SELECT store_id, product_id FROM catalog_stock
+    UNION SELECT store_id, product_id FROM catalog_price
+) sc
+JOIN catalog_product p ON p.id = sc.product_id
+JOIN catalog_store st ON st.id = sc.store_id
+LEFT JOIN catalog_price pr ON pr.store_id = sc.store_id AND pr.product_id = sc.product_id
+LEFT JOIN catalog_stock s ON s.store_id = sc.store_id AND s.product_id = sc.product_id
+CROSS JOIN LATERAL (
+    SELECT coalesce(jsonb_agg(jsonb_build_array(i.id, i.content_hash) ORDER BY i.id), '[]'::jsonb) AS images
+    FROM catalog_productimage i
+    WHERE i.product_id = sc.product_id
+      AND i.city_id IS NOT DISTINCT FROM (
+          SELECT c.city_id FROM catalog_productimage c
+          WHERE c.product_id = sc.product_id AND c.city_id = st.city_id
+          LIMIT 1
+      )
+) img
+ORDER BY sc.store_id, sc.product_id;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0004_catalog_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoreCatalogEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('description', models.TextField(blank=True, null=True)),
+                ('view_count', models.PositiveIntegerField(default=0)),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10, null=True)),
+                ('quantity', models.PositiveIntegerField(default=0)),
+                ('images', models.JSONField(default=list)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='catalog_entries', to='catalog.product')),
+                ('store', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='catalog_entries', to='catalog.store')),
+            ],
+            options={
+                'unique_together': {('store', 'product')},
+            },
+        ),
+        # Место на странице под новую версию строки: обновление quantity без записи в индексы (HOT)
+        migrations.RunSQL(
+            'ALTER TABLE catalog_storecatalogentry SET (fillfactor = 80)',
+            'ALTER TABLE catalog_storecatalogentry RESET (fillfactor)',
+        ),
+        migrations.RunSQL(POPULATE_CATALOG_ENTRIES, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 4.2.5 on 2026-10-18 03:14
+
+from django.db import migrations, models
+
+
+# updated_at должен быть верным и для записей в обход save(): bulk_update, update(),
+# upsert остатков (catalog.stocks), COPY (catalog.bulk_copy). INSERT без значения получает
+# DEFAULT, UPDATE без явного updated_at — время из триггера. У товара время меняют
+# только поля ответа (не view_count, который переносит flush_view_counts).
+# clock_timestamp(), а не now(): now() — начало транзакции, и строки, изменённые долгой
+# транзакцией (массовой загрузкой), получили бы время раньше уже отданных клиентам версий.
+TOUCH_FUNCTION = """
+CREATE OR REPLACE FUNCTION catalog_touch_updated_at() RETURNS trigger AS $$
+BEGIN
+    IF NEW.updated_at IS NOT DISTINCT FROM OLD.updated_at THEN
+        NEW.updated_at := clock_timestamp();
+    END IF;
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+"""
+
+DROP_TOUCH_FUNCTION = "DROP FUNCTION IF EXISTS catalog_touch_updated_at();"
+
+TOUCHED_TABLES = {
+    'catalog_product': 'UPDATE OF name, description',
+    'catalog_price': 'UPDATE OF amount',
+    'catalog_stock': 'UPDATE OF quantity',
+    'catalog_productimage': 'UPDATE',
+}
+
+
+def touch_trigger(table, event):
+    return migrations.RunSQL(
+        f"""
+        ALTER TABLE {table} ALTER COLUMN updated_at SET DEFAULT clock_timestamp();
+        CREATE TRIGGER {table}_touch_updated_at
+            BEFORE {event} ON {table}
+            FOR EACH ROW EXECUTE FUNCTION catalog_touch_updated_at();
+        """,
+        f"""
+        DROP TRIGGER IF EXISTS {table}_touch_updated_at ON {table};
+        ALTER TABLE {table} ALTER COLUMN updated_at DROP DEFAULT;
+        """,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0005_store_catalog_entry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='price',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='stock',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunSQL(TOUCH_FUNCTION, DROP_TOUCH_FUNCTION),
+        *(touch_trigger(table, event) for table, event in TOUCHED_TABLES.items()),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.5 on 2026-10-18 03:32
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0006_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoreChangeSequence',
+            fields=[
+                ('store', models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='change_sequence', serialize=False, to='catalog.store')),
+                ('seq', models.BigIntegerField(default=0)),
+                ('trimmed_seq', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CatalogChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('seq', models.BigIntegerField()),
+                ('product_id', models.BigIntegerField()),
+                ('created_at', models.DateTimeField()),
+                ('store', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='catalog_changes', to='catalog.store')),
+            ],
+            options={
+                'indexes': [django.contrib.postgres.indexes.BrinIndex(fields=['created_at'], name='catalog_change_created_brin')],
+                'unique_together': {('store', 'seq')},
+            },
+        ),
+    ]
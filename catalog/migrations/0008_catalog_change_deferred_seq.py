@@ -0,0 +1,22 @@
+# Generated by Django 4.2.5 on 2026-10-18 04:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0007_catalog_changes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='catalogchange',
+            name='seq',
+            field=models.BigIntegerField(null=True),
+        ),
+        migrations.AddIndex(
+            model_name='catalogchange',
+            index=models.Index(condition=models.Q(('seq__isnull', True)), fields=['store'], name='catalog_change_pending_idx'),
+        ),
+    ]
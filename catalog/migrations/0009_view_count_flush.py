@@ -0,0 +1,24 @@
+# Generated by Django 4.2.5 on 2026-10-18 04:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0008_catalog_change_deferred_seq'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ViewCountFlush',
+            fields=[
+                ('flush_id', models.UUIDField(primary_key=True, serialize=False)),
+                ('applied_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.RemoveField(
+            model_name='storecatalogentry',
+            name='view_count',
+        ),
+    ]
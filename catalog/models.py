@@ -1,6 +1,11 @@
 from django.db import models
+from django.db.models import OuterRef, Prefetch, Q, Subquery
 from django.contrib.auth import get_user_model
-from django.contrib.postgres.search import SearchVector
+from django.contrib.postgres.indexes import BrinIndex, GinIndex
+from django.contrib.postgres.search import SearchVectorField
+
+from .images import content_hash, decode_image_data
+from .reference import get_city, get_store
 
 User = get_user_model()
 
@@ -15,7 +20,9 @@ class Store(models.Model):
     city = models.ForeignKey(City, on_delete=models.CASCADE, related_name='stores')
 
     def __str__(self):
-        return f"{self.name} ({self.city.name})"
+        # Город из справочника процесса (catalog.reference), без запроса к БД
+        city = get_city(self.city_id)
+        return f"{self.name} ({(city or self.city).name})"
 
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
@@ -28,46 +35,202 @@ class UserProfile(models.Model):
     def __str__(self):
         return f"Profile of {self.user.username} - Store: {self.store if self.store else 'None'}"
 
+class ProductQuerySet(models.QuerySet):
+    def with_store_data(self, store):
+        """
+        Подгружает данные, нужные ProductSerializer, одним набором запросов:
+        цены и остатки только для store, изображения для города store + generic.
+        Результат кладётся в store_prices / store_stocks / store_images.
+        """
+        prices = Price.objects.filter(store=store) if store else Price.objects.none()
+        stocks = Stock.objects.filter(store=store) if store else Stock.objects.none()
+
+        images_filter = Q(city__isnull=True)
+        if store:
+            images_filter |= Q(city_id=store.city_id)
+
+        return self.prefetch_related(
+            Prefetch('prices', queryset=prices, to_attr='store_prices'),
+            Prefetch('stocks', queryset=stocks, to_attr='store_stocks'),
+            # Байты изображения в выдачу не нужны: только хэш для URL (и updated_at для ETag)
+            Prefetch('images',
+                     queryset=ProductImage.objects.filter(images_filter)
+                     .only('id', 'product_id', 'city_id', 'content_hash', 'updated_at').order_by('id'),
+                     to_attr='store_images'),
+        )
+
+
 class Product(models.Model):
     name = models.CharField(max_length=255)
     description = models.TextField(blank=True, null=True)
     view_count = models.PositiveIntegerField(default=0)
+    # Заполняется триггером в БД (см. миграцию 0002) при INSERT/UPDATE name, description,
+    # поэтому актуален и после bulk_create / bulk_update / update().
+    search_vector = SearchVectorField(null=True, editable=False)
+    # Изменение данных товара в ответе API (не view_count): валидатор ETag / Last-Modified
+    # (catalog.conditional). Как и у Price / Stock / ProductImage, при UPDATE в обход save()
+    # время проставляет триггер в БД, при INSERT — DEFAULT (см. миграцию 0006).
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = ProductQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'], name='product_search_vector_gin'),
+        ]
 
     def __str__(self):
         return self.name
 
-    def save(self, *args, **kwargs):
-        self.search_vector = SearchVector('name', 'description')
-        super().save(*args, **kwargs)
-
 class ProductImage(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='images')
     city = models.ForeignKey(City, on_delete=models.SET_NULL, null=True, blank=True, related_name='product_images')
-    # Храним изображение в base64 формате для экономии места:
-    image_data = models.TextField()
+    # Изображение приходит в base64; при сохранении декодируется в content (см. catalog.images).
+    # После migrate_image_storage --clear-base64 может быть пустым.
+    image_data = models.TextField(blank=True)
+    content = models.BinaryField(null=True, editable=False)
+    # sha256 содержимого: адрес изображения в /api/v1/images/<hash> и ETag
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True, editable=False)
+    content_type = models.CharField(max_length=100, blank=True, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
-        city_str = f"city: {self.city.name}" if self.city else "generic"
+        city = (get_city(self.city_id) or self.city) if self.city_id else None
+        city_str = f"city: {city.name}" if city else "generic"
         return f"Image of {self.product.name}, {city_str}"
 
+    def save(self, *args, **kwargs):
+        if self.image_data:
+            self.set_content_from_image_data()
+        super().save(*args, **kwargs)
+
+    def set_content_from_image_data(self):
+        content, self.content_type = decode_image_data(self.image_data)
+        self.content = content
+        self.content_hash = content_hash(content)
+
 class Price(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='prices')
     store = models.ForeignKey(Store, on_delete=models.CASCADE, related_name='prices')
     amount = models.DecimalField(max_digits=10, decimal_places=2)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         unique_together = ('product', 'store')
+        indexes = [
+            # Цены магазина для страницы каталога читаются index-only scan-ом
+            models.Index(fields=['store', 'product'], include=['amount'], name='price_store_product_amount'),
+        ]
 
     def __str__(self):
-        return f"Price of {self.product.name} in {self.store.name}: {self.amount}"
+        return f"Price of {self.product.name} in {(get_store(self.store_id) or self.store).name}: {self.amount}"
 
 class Stock(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stocks')
     store = models.ForeignKey(Store, on_delete=models.CASCADE, related_name='stocks')
     quantity = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         unique_together = ('product', 'store')
+        indexes = [
+            # Товары в наличии в магазине: filter(store=..., quantity__gt=0)
+            models.Index(fields=['store', 'product'], condition=Q(quantity__gt=0), name='stock_store_in_stock'),
+        ]
+
+    def __str__(self):
+        return f"Stock of {self.product.name} in {(get_store(self.store_id) or self.store).name}: {self.quantity}"
+
+
+class StoreCatalogEntryQuerySet(models.QuerySet):
+    def with_view_count(self):
+        """
+        view_count из Product тем же запросом: подзапрос по первичному ключу на строку страницы
+        (не join — планировщик не заменит его seq scan-ом товаров для большой страницы).
+        """
+        return self.annotate(
+            view_count=Subquery(Product.objects.filter(pk=OuterRef('product_id')).values('view_count'))
+        )
+
+
+class StoreCatalogEntry(models.Model):
+    """
+    Проекция каталога: товар в магазине с ценой, остатком и изображениями для города магазина
+    (пары [id, content_hash]). Пересчитывается из Product / Price / Stock / ProductImage
+    (catalog.projection), напрямую не редактируется. view_count не копируется: каталог
+    читает его из Product.
+    """
+    store = models.ForeignKey(Store, on_delete=models.CASCADE, related_name='catalog_entries')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='catalog_entries')
+    name = models.CharField(max_length=255)
+    description = models.TextField(blank=True, null=True)
+    price = models.DecimalField(max_digits=10, decimal_places=2, null=True)
+    quantity = models.PositiveIntegerField(default=0)
+    images = models.JSONField(default=list)
+
+    objects = StoreCatalogEntryQuerySet.as_manager()
+
+    class Meta:
+        # Страница каталога магазина — range scan по уникальному индексу (store, product).
+        # quantity намеренно не индексируется: обновления остатков — HOT-апдейты (fillfactor в миграции 0005)
+        unique_together = ('store', 'product')
+
+    def __str__(self):
+        return f"{self.name} in {(get_store(self.store_id) or self.store).name}"
+
+
+class StoreChangeSequence(models.Model):
+    """
+    Последний номер изменения каталога магазина (seq) и граница журнала после сжатия
+    (trimmed_seq: изменения с номером не больше неё удалены). Строка блокируется только
+    короткой транзакцией нумерации (catalog.changes.sequence_changes), поэтому номера одного
+    магазина видны в порядке коммитов.
+    """
+    store = models.OneToOneField(
+        Store, on_delete=models.DO_NOTHING, db_constraint=False, primary_key=True, related_name='change_sequence'
+    )
+    seq = models.BigIntegerField(default=0)
+    trimmed_seq = models.BigIntegerField(default=0)
+
+
+class CatalogChange(models.Model):
+    """
+    Журнал изменений каталога магазина (catalog.changes): строка проекции (store, product)
+    изменилась или удалена под номером seq. Содержимое не хранится — лента изменений отдаёт
+    текущую строку проекции. product_id без внешнего ключа: удаление товара тоже изменение.
+    seq пуст, пока изменение не пронумеровано после коммита записавшей его транзакции.
+    Журнал магазина (и его StoreChangeSequence) удаляется после удаления магазина (catalog.signals):
+    каскад пишет в журнал удаление строк магазина уже после того, как собраны связанные объекты.
+    """
+    store = models.ForeignKey(
+        Store, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False, related_name='catalog_changes'
+    )
+    seq = models.BigIntegerField(null=True)
+    product_id = models.BigIntegerField()
+    created_at = models.DateTimeField()
+
+    class Meta:
+        # Лента — range scan по (store, seq); сжатие по возрасту — BRIN (журнал только дописывается);
+        # нумерация ищет ещё не пронумерованные изменения по частичному индексу
+        unique_together = ('store', 'seq')
+        indexes = [
+            BrinIndex(fields=['created_at'], name='catalog_change_created_brin'),
+            models.Index(fields=['store'], condition=models.Q(seq__isnull=True), name='catalog_change_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f"#{self.seq} product {self.product_id} in store {self.store_id}"
+
+
+class ViewCountFlush(models.Model):
+    """
+    Перенос просмотров в БД (catalog.view_counter.flush_view_counts), уже применённый к Product.
+    Пишется в той же транзакции, что и UPDATE view_count: повтор flush с тем же id
+    (после падения между коммитом и очисткой Redis) ничего не добавляет. Старые строки
+    удаляются самим flush.
+    """
+    flush_id = models.UUIDField(primary_key=True)
+    applied_at = models.DateTimeField()
 
     def __str__(self):
-        return f"Stock of {self.product.name} in {self.store.name}: {self.quantity}"
+        return f"views flush {self.flush_id}"
@@ -0,0 +1,89 @@
+"""
+Кэш сериализованных карточек товара для /api/v1/products/?ids= (несколько товаров за запрос).
+
+Фрагмент — JSON ProductSerializer товара для магазина пользователя без view_count. Ключ включает
+версию карточки (наибольший updated_at товара, его цены, остатка и изображений, catalog.conditional),
+магазин, его город и хост (абсолютные URL изображений): запись даёт новый ключ, старые фрагменты
+истекают по TTL. Фрагменты читаются одним MGET, промахи собираются одним набором запросов
+и пишутся одним pipeline.
+
+Ответ собирается из байтов: view_count (сохранённые и ещё не перенесённые просмотры) меняется
+с каждым просмотром и дописывается последним полем, как в ProductSerializer.
+"""
+from django.conf import settings
+from django_redis import get_redis_connection
+from .renderers import ORJSONRenderer
+
+from .async_redis import get_async_redis
+
+FRAGMENT_KEY = 'catalog:product:{product_id}:{store_id}:{city_id}:v{version}:{host}'
+
+_renderer = ORJSONRenderer()
+
+
+def _redis():
+    return get_redis_connection('default')
+
+
+def fragment_key(product_id, store, version, host):
+    return FRAGMENT_KEY.format(
+        product_id=product_id,
+        store_id=store.pk if store else 0,
+        city_id=store.city_id if store else 0,
+        version=round(version.timestamp() * 1_000_000),
+        host=host,
+    )
+
+
+def render_fragment(data):
+    """
+    Байты фрагмента из данных ProductSerializer (view_count — последнее поле — отбрасывается).
+    """
+    data = dict(data)
+    del data['view_count']
+    return _renderer.render(data)
+
+
+def assemble(fragments, view_counts):
+    """
+    JSON-массив карточек: фрагменты с дописанным view_count, побайтно как рендер ProductSerializer.
+    """
+    return b'[' + b','.join(
+        b'%s,"view_count":%d}' % (fragment[:-1], count) for fragment, count in zip(fragments, view_counts)
+    ) + b']'
+
+
+def _found(keys, values):
+    return {product_id: value for product_id, value in zip(keys, values) if value is not None}
+
+
+def get_many(keys):
+    """
+    {product_id: фрагмент} для найденных в кэше; keys — {product_id: ключ}.
+    """
+    if not keys:
+        return {}
+    return _found(keys, _redis().mget(list(keys.values())))
+
+
+async def aget_many(keys):
+    if not keys:
+        return {}
+    return _found(keys, await get_async_redis().mget(list(keys.values())))
+
+
+def set_many(fragments):
+    """
+    Сохраняет фрагменты {ключ: байты} одним pipeline.
+    """
+    pipe = _redis().pipeline(transaction=False)
+    for key, fragment in fragments.items():
+        pipe.set(key, fragment, ex=settings.PRODUCT_FRAGMENT_CACHE_TIMEOUT)
+    pipe.execute()
+
+
+async def aset_many(fragments):
+    pipe = get_async_redis().pipeline(transaction=False)
+    for key, fragment in fragments.items():
+        pipe.set(key, fragment, ex=settings.PRODUCT_FRAGMENT_CACHE_TIMEOUT)
+    await pipe.execute()
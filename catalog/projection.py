@@ -0,0 +1,163 @@
+"""
+Проекция каталога магазина (StoreCatalogEntry): строка на пару (магазин, товар), у которой есть
+Stock или Price, с уже собранными названием, ценой, остатком и изображениями для города магазина.
+Страница каталога магазина читается одним range scan по (store_id, product_id); view_count
+хранится только в Product и берётся join-ом по первичному ключу (flush просмотров не переписывает
+строки проекции всех магазинов).
+
+Строки пересчитываются set-based запросом по затронутым парам: сигналы ORM (catalog.signals),
+upsert остатков (catalog.stocks), массовая загрузка (catalog.bulk_copy); полная пересборка — manage.py rebuild_catalog_entries.
+Тот же запрос пишет изменившиеся пары в журнал изменений (catalog.changes).
+"""
+from django.db import connection
+
+from .changes import log_changes_sql, schedule_sequencing
+from .models import Price, Product, ProductImage, Stock, Store, StoreCatalogEntry
+
+_tables = {
+    'entry': StoreCatalogEntry._meta.db_table,
+    'product': Product._meta.db_table,
+    'store': Store._meta.db_table,
+    'price': Price._meta.db_table,
+    'stock': Stock._meta.db_table,
+    'image': ProductImage._meta.db_table,
+}
+
+# Пары (store_id, product_id) для пересчёта: все пары с остатком или ценой, а также уже
+# существующие строки проекции (они удаляются, если ни остатка, ни цены больше нет).
+# {where} — условие на store_id / product_id с одним параметром-массивом (или подзапросом).
+_SCOPE_SQL = """
+SELECT store_id, product_id FROM {stock} {where}
+UNION SELECT store_id, product_id FROM {price} {where}
+UNION SELECT store_id, product_id FROM {entry} {where}
+"""
+_PAIRS_SCOPE_SQL = "SELECT DISTINCT * FROM unnest(%s::bigint[], %s::bigint[]) AS d(store_id, product_id)"
+
+# Изображения — как в ProductSerializer.get_images: городские для города магазина, если они есть,
+# иначе общие (city_id IS NULL); порядок по id.
+REFRESH_SQL = """
+WITH scope AS ({scope}),
+source AS (
+    SELECT sc.store_id, sc.product_id, p.name, p.description,
+           pr.amount AS price, coalesce(s.quantity, 0) AS quantity, img.images
+    FROM scope sc
+    JOIN {product} p ON p.id = sc.product_id
+    JOIN {store} st ON st.id = sc.store_id
+    LEFT JOIN {price} pr ON pr.store_id = sc.store_id AND pr.product_id = sc.product_id
+    LEFT JOIN {stock} s ON s.store_id = sc.store_id AND s.product_id = sc.product_id
+    CROSS JOIN LATERAL (
+        SELECT coalesce(
+            jsonb_agg(jsonb_build_array(i.id, i.content_hash) ORDER BY i.id), '[]'::jsonb
+        ) AS images
+        FROM {image} i
+        WHERE i.product_id = sc.product_id
+          AND i.city_id IS NOT DISTINCT FROM (
+              SELECT c.city_id FROM {image} c
+              WHERE c.product_id = sc.product_id AND c.city_id = st.city_id
+              LIMIT 1
+          )
+    ) img
+    WHERE pr.id IS NOT NULL OR s.id IS NOT NULL
+),
+changed AS (
+    -- Пары для журнала: новые и изменившиеся строки и пары без остатка и цены
+    SELECT so.store_id, so.product_id
+    FROM source so
+    LEFT JOIN {entry} e ON e.store_id = so.store_id AND e.product_id = so.product_id
+    WHERE e.id IS NULL
+       OR (e.name, e.description, e.price, e.quantity, e.images)
+          IS DISTINCT FROM (so.name, so.description, so.price, so.quantity, so.images)
+    UNION ALL
+    SELECT sc.store_id, sc.product_id
+    FROM scope sc
+    WHERE NOT EXISTS (
+        SELECT 1 FROM source so WHERE so.store_id = sc.store_id AND so.product_id = sc.product_id
+    )
+),
+{log_changes},
+removed AS (
+    DELETE FROM {entry} e
+    USING scope sc
+    WHERE e.store_id = sc.store_id AND e.product_id = sc.product_id
+      AND NOT EXISTS (SELECT 1 FROM {stock} s WHERE s.store_id = e.store_id AND s.product_id = e.product_id)
+      AND NOT EXISTS (SELECT 1 FROM {price} pr WHERE pr.store_id = e.store_id AND pr.product_id = e.product_id)
+    RETURNING 1
+),
+written AS (
+    INSERT INTO {entry} AS e (store_id, product_id, name, description, price, quantity, images)
+    SELECT store_id, product_id, name, description, price, quantity, images
+    FROM source
+    ORDER BY store_id, product_id
+    ON CONFLICT (store_id, product_id) DO UPDATE
+        SET name = EXCLUDED.name, description = EXCLUDED.description,
+            price = EXCLUDED.price, quantity = EXCLUDED.quantity, images = EXCLUDED.images
+        WHERE (e.name, e.description, e.price, e.quantity, e.images)
+            IS DISTINCT FROM (EXCLUDED.name, EXCLUDED.description,
+                              EXCLUDED.price, EXCLUDED.quantity, EXCLUDED.images)
+    RETURNING 1
+)
+SELECT (SELECT count(*) FROM written), (SELECT count(*) FROM removed)
+"""
+
+_LOG_CHANGES = log_changes_sql('changed')
+
+
+def _refresh(scope, params):
+    with connection.cursor() as cursor:
+        cursor.execute(REFRESH_SQL.format(scope=scope, log_changes=_LOG_CHANGES, **_tables), params)
+        written, removed = cursor.fetchone()
+    schedule_sequencing()
+    return {'written': written, 'removed': removed}
+
+
+def refresh_pairs(pairs):
+    """
+    Пересчитывает строки проекции для пар (store_id, product_id).
+    Возвращает {'written', 'removed'}: записанные (новые и изменившиеся) и удалённые строки.
+    """
+    pairs = list(pairs)
+    if not pairs:
+        return {'written': 0, 'removed': 0}
+    store_ids, product_ids = (list(column) for column in zip(*pairs))
+    return _refresh(_PAIRS_SCOPE_SQL, [store_ids, product_ids])
+
+
+def refresh_products(product_ids):
+    """
+    Пересчитывает строки товаров во всех магазинах (название, описание, изображения).
+    """
+    product_ids = list(product_ids)
+    if not product_ids:
+        return {'written': 0, 'removed': 0}
+    scope = _SCOPE_SQL.format(where='WHERE product_id = ANY(%s)', **_tables)
+    return _refresh(scope, [product_ids] * 3)
+
+
+def refresh_stores(store_ids):
+    """
+    Пересчитывает строки магазинов (например, после смены города: другие изображения).
+    """
+    store_ids = list(store_ids)
+    if not store_ids:
+        return {'written': 0, 'removed': 0}
+    scope = _SCOPE_SQL.format(where='WHERE store_id = ANY(%s)', **_tables)
+    return _refresh(scope, [store_ids] * 3)
+
+
+def refresh_from_table(table, column=None):
+    """
+    Пересчёт по ключам из таблицы table (например, временной таблицы массовой загрузки):
+    пары (store_id, product_id) или, если задан column ('store_id' / 'product_id'),
+    все строки этих магазинов / товаров. Ключи не проходят через Python.
+    """
+    if column is None:
+        return _refresh(f"SELECT DISTINCT store_id, product_id FROM {table}", [])
+    scope = _SCOPE_SQL.format(where=f'WHERE {column} IN (SELECT {column} FROM {table})', **_tables)
+    return _refresh(scope, [])
+
+
+def rebuild_catalog_entries():
+    """
+    Полная пересборка проекции; неизменившиеся строки не переписываются.
+    """
+    return _refresh(_SCOPE_SQL.format(where='', **_tables), [])
@@ -0,0 +1,50 @@
+"""
+Ограничение скорости фоновой работы в строках, а не в задачах: пачка из 5000 строк
+расходует в 5000 раз больше квоты, чем пачка из одной (Celery rate_limit считает только
+задачи и только в пределах одного воркера).
+
+Квота общая для всех воркеров — GCRA в Redis: ключ хранит «теоретическое время» освобождения
+квоты, пачка проходит, если очередь перед ней не длиннее burst секунд, и сдвигает это время
+на rows / rate. Время берётся из Redis (TIME), часы воркеров не важны.
+"""
+from django_redis import get_redis_connection
+
+RATE_KEY = 'catalog:rate:{}'
+
+
+class RateLimited(Exception):
+    """
+    Квота исчерпана; args[0] — через сколько секунд повторить (причина повтора задачи).
+    """
+
+# KEYS[1] — ключ квоты; ARGV: стоимость в секундах, запас в секундах.
+# Возвращает 0 (квота выдана) или сколько секунд подождать до повтора.
+_ACQUIRE = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local cost = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local tat = tonumber(redis.call('GET', KEYS[1]) or now)
+if tat < now then
+    tat = now
+end
+local wait = tat - now - burst
+if wait > 0 then
+    return tostring(wait)
+end
+tat = tat + cost
+redis.call('SET', KEYS[1], tostring(tat), 'PX', math.ceil((tat - now) * 1000) + 1000)
+return '0'
+"""
+
+
+def acquire_rows(name, rows, rate, burst=1.0):
+    """
+    Берёт квоту на rows строк при скорости rate строк в секунду.
+    Возвращает 0.0, если можно работать, иначе через сколько секунд повторить.
+    rate <= 0 — без ограничения.
+    """
+    if rate <= 0 or rows <= 0:
+        return 0.0
+    wait = get_redis_connection('default').eval(_ACQUIRE, 1, RATE_KEY.format(name), rows / rate, burst)
+    return float(wait)
@@ -0,0 +1,159 @@
+"""
+Справочники City и Store в памяти процесса: магазин по id, город по id, магазины города —
+без запросов к БД. Таблицы маленькие и почти не меняются, поэтому процесс держит их целиком.
+
+Актуальность — по версии справочника в Redis: изменения City и Store (catalog.signals)
+увеличивают версию, процесс сверяет её не чаще раза в CATALOG_REFERENCE_CHECK_INTERVAL
+секунд и при расхождении перечитывает обе таблицы (два запроса). Процесс, сделавший
+изменение, видит его сразу. Загружается при старте воркеров gunicorn и Celery (warm_reference)
+или при первом обращении.
+
+Объекты City и Store общие для всех запросов процесса — только для чтения.
+"""
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, transaction
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+
+from .async_redis import get_async_redis
+
+logger = logging.getLogger(__name__)
+
+REFERENCE_VERSION_KEY = 'catalog:reference-version'
+
+
+class ReferenceData:
+    """
+    Снимок справочников на версию version.
+    """
+
+    def __init__(self, version, cities, stores):
+        self.version = version
+        self.cities = {city.pk: city for city in cities}
+        self.stores = {}
+        self.stores_by_city = defaultdict(list)
+        for store in stores:
+            # store.city — тот же объект, что в cities: FK не перечитывается из БД
+            store.city = self.cities[store.city_id]
+            self.stores[store.pk] = store
+            self.stores_by_city[store.city_id].append(store)
+
+
+_snapshot = None
+_checked_at = float('-inf')
+_load_lock = threading.Lock()
+
+
+def _parse_version(version):
+    return int(version) if version else 0
+
+
+def _load(version):
+    # models импортирует этот модуль для __str__
+    from .models import City, Store
+
+    # Только с primary: снимок отстающей реплики остался бы в процессе под новой версией до следующей
+    return ReferenceData(
+        version,
+        City.objects.using(DEFAULT_DB_ALIAS).order_by('pk'),
+        Store.objects.using(DEFAULT_DB_ALIAS).order_by('pk'),
+    )
+
+
+def _stale(force):
+    return _snapshot is None or force or time.monotonic() - _checked_at >= settings.CATALOG_REFERENCE_CHECK_INTERVAL
+
+
+def _install(version):
+    global _snapshot, _checked_at
+    with _load_lock:
+        if _snapshot is None or _snapshot.version != version:
+            _snapshot = _load(version)
+        _checked_at = time.monotonic()
+        return _snapshot
+
+
+def reference_data(force=False):
+    """
+    Текущий снимок справочников; force — сверить версию, не дожидаясь интервала.
+    """
+    if not _stale(force):
+        return _snapshot
+    # Версия читается до таблиц: изменение во время загрузки даст перечитывание при следующей проверке
+    version = _parse_version(get_redis_connection('default').get(REFERENCE_VERSION_KEY))
+    return _install(version)
+
+
+async def areference_data(force=False):
+    if not _stale(force):
+        return _snapshot
+    version = _parse_version(await get_async_redis().get(REFERENCE_VERSION_KEY))
+    if _snapshot is not None and _snapshot.version == version:
+        return _install(version)
+    return await sync_to_async(_install)(version)
+
+
+def get_city(city_id):
+    return reference_data().cities.get(city_id)
+
+
+def get_store(store_id):
+    """
+    Магазин (с city) или None. Неизвестный id сверяется с версией сразу: магазин мог
+    появиться в другом процессе меньше интервала назад.
+    """
+    store = reference_data().stores.get(store_id)
+    if store is None:
+        store = reference_data(force=True).stores.get(store_id)
+    return store
+
+
+async def aget_store(store_id):
+    store = (await areference_data()).stores.get(store_id)
+    if store is None:
+        store = (await areference_data(force=True)).stores.get(store_id)
+    return store
+
+
+def stores_in_city(city_id):
+    return list(reference_data().stores_by_city.get(city_id, ()))
+
+
+def bump_reference_version():
+    """
+    Инвалидирует справочники во всех процессах. Как bump_store_versions: сразу и ещё раз
+    после коммита, чтобы снимок, прочитанный до коммита, не пережил изменение.
+    """
+
+    def bump():
+        global _checked_at
+        get_redis_connection('default').incr(REFERENCE_VERSION_KEY)
+        _checked_at = float('-inf')
+
+    bump()
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(bump)
+
+
+def warm_reference():
+    """
+    Загрузка справочников при старте воркера. Недоступность БД или Redis не мешает
+    старту: справочники загрузятся при первом обращении.
+    """
+    try:
+        reference_data(force=True)
+    except (DatabaseError, RedisError):
+        logger.warning("Reference data was not preloaded", exc_info=True)
+
+
+def reset_reference():
+    global _snapshot, _checked_at
+    with _load_lock:
+        _snapshot = None
+        _checked_at = float('-inf')
@@ -0,0 +1,31 @@
+import orjson
+from rest_framework.renderers import JSONRenderer
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer на orjson: те же байты, что у DRF в настройках по умолчанию (компактный JSON,
+    UTF-8 без \\u-экранирования, экранированные U+2028 / U+2029), в несколько раз быстрее json.dumps.
+
+    Типы, которые orjson пишет иначе, чем DRF JSONEncoder (datetime, date, time), и неизвестные
+    orjson типы (Decimal, lazy-строки, QuerySet, ...) уходят в JSONEncoder.default.
+    Отступы (?indent, browsable API), ensure_ascii, несжатый JSON и целые больше 64 бит —
+    через json.dumps родительского класса. float в ответах API нет: у orjson короче экспонента
+    (1e-05 против 1e-5).
+    """
+    encoder_options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if (self.ensure_ascii or not self.compact
+                or self.get_indent(accepted_media_type, renderer_context or {}) is not None):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            content = orjson.dumps(data, default=self.encoder_class().default, option=self.encoder_options)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Как DRF: JSON остаётся подмножеством JavaScript
+        if b'\xe2\x80\xa8' in content or b'\xe2\x80\xa9' in content:
+            content = content.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return content
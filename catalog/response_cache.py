@@ -0,0 +1,279 @@
+"""
+Кэш отрендеренных страниц каталога в Redis.
+
+Ключ страницы включает версию магазина: любая запись, влияющая на каталог магазина
+(Stock, Price, ProductImage, Product, upsert остатков), увеличивает версию только
+затронутых магазинов — старые страницы перестают читаться и истекают по TTL.
+
+Пересборка страницы идёт под single-flight блокировкой: при промахе страницу собирает
+один запрос, остальные ждут готовый результат.
+
+Рядом со страницей хранятся её сжатые варианты ({ключ}:gzip, {ключ}:br, catalog.compression):
+вариант сжимается при первом запросе с этой кодировкой и дальше отдаётся без сжатия.
+"""
+import asyncio
+import time
+import uuid
+
+from django.conf import settings
+from django.db import transaction
+from django_redis import get_redis_connection
+
+from . import compression
+from .async_redis import get_async_redis
+
+VERSION_KEY = 'catalog:store-version:{}'
+# Время (unix, секунды) последнего увеличения версии: Last-Modified каталога магазина
+MODIFIED_KEY = 'catalog:store-modified:{}'
+# Версия и время изменения каталога в целом (любого магазина): валидатор выдачи поиска
+CATALOG_VERSION_KEY = 'catalog:version'
+CATALOG_MODIFIED_KEY = 'catalog:modified'
+PAGE_KEY = 'catalog:page:{store_id}:{city_id}:v{version}:{host}:{cursor}:{limit}'
+LOCK_SUFFIX = ':lock'
+VARIANT_KEY = '{key}:{encoding}'
+STATS_KEY = 'catalog:page-cache:stats'
+
+LOCK_TIMEOUT_MS = 10000
+LOCK_WAIT_SECONDS = 2.0
+LOCK_POLL_SECONDS = 0.05
+
+
+def _redis():
+    return get_redis_connection('default')
+
+
+def store_version(store_id):
+    version = _redis().get(VERSION_KEY.format(store_id))
+    return int(version) if version else 0
+
+
+def bump_store_versions(store_ids):
+    """
+    Инвалидирует кэш каталога магазинов. Версия увеличивается сразу и ещё раз после коммита:
+    страница, собранная параллельным запросом до коммита, не переживёт второй инкремент.
+    """
+    store_ids = set(store_ids)
+    if not store_ids:
+        return
+
+    def bump():
+        now = int(time.time())
+        pipe = _redis().pipeline()
+        for store_id in store_ids:
+            pipe.incr(VERSION_KEY.format(store_id))
+            pipe.set(MODIFIED_KEY.format(store_id), now)
+        pipe.incr(CATALOG_VERSION_KEY)
+        pipe.set(CATALOG_MODIFIED_KEY, now)
+        pipe.execute()
+
+    bump()
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(bump)
+
+
+def _validators(version, modified):
+    return int(version) if version else 0, int(modified) if modified else None
+
+
+def store_validators(store_id):
+    """
+    (версия, время изменения или None) каталога магазина — одним MGET.
+    """
+    return _validators(*_redis().mget(VERSION_KEY.format(store_id), MODIFIED_KEY.format(store_id)))
+
+
+async def astore_validators(store_id):
+    return _validators(*await get_async_redis().mget(VERSION_KEY.format(store_id), MODIFIED_KEY.format(store_id)))
+
+
+def catalog_validators():
+    """
+    (версия, время изменения или None) каталога в целом.
+    """
+    return _validators(*_redis().mget(CATALOG_VERSION_KEY, CATALOG_MODIFIED_KEY))
+
+
+async def acatalog_validators():
+    return _validators(*await get_async_redis().mget(CATALOG_VERSION_KEY, CATALOG_MODIFIED_KEY))
+
+
+def page_key(store, host, cursor, limit, version=None):
+    """
+    Ключ страницы; version — уже прочитанная версия магазина (иначе читается из Redis).
+    """
+    if version is None:
+        version = store_version(store.pk)
+    return _page_key(store, version, host, cursor, limit)
+
+
+def _page_key(store, version, host, cursor, limit):
+    return PAGE_KEY.format(
+        store_id=store.pk,
+        city_id=store.city_id,
+        version=version,
+        host=host,
+        cursor=cursor or '',
+        limit=limit or '',
+    )
+
+
+def _variant_key(key, encoding):
+    return VARIANT_KEY.format(key=key, encoding=encoding)
+
+
+def _encode(content, encoding):
+    """
+    (тело, кодировка): страница, сжатая encoding для кэша, или как есть (None), если она меньше
+    COMPRESSION_MIN_SIZE или клиент не принимает сжатие.
+    """
+    if encoding and len(content) >= settings.COMPRESSION_MIN_SIZE:
+        return compression.compress(content, encoding, cached=True), encoding
+    return content, None
+
+
+def get_or_build(key, build, encoding=None):
+    """
+    Возвращает (content, hit, content_encoding). build() вызывается не более чем одним процессом
+    на ключ, остальные ждут его результат до LOCK_WAIT_SECONDS.
+    encoding — кодировка, принятая клиентом (compression.accepted_encoding): content отдаётся
+    сжатым ею (content_encoding), если страница не меньше COMPRESSION_MIN_SIZE.
+    """
+    redis = _redis()
+    found = _get_counted(redis, key, encoding)
+    if found is not None:
+        return _cached(redis, key, found, encoding)
+
+    lock_key = key + LOCK_SUFFIX
+    token = uuid.uuid4().hex
+    if not redis.set(lock_key, token, nx=True, px=LOCK_TIMEOUT_MS):
+        deadline = time.monotonic() + LOCK_WAIT_SECONDS
+        while time.monotonic() < deadline:
+            time.sleep(LOCK_POLL_SECONDS)
+            # Сжатый вариант сборщик пишет вместе со страницей: ожидающие его не пересжимают
+            found = _get_counted(redis, key, encoding, hit='wait_hit', miss=None)
+            if found is not None:
+                return _cached(redis, key, found, encoding)
+        # Сборщик не успел: собираем сами, не дожидаясь
+        redis.hincrby(STATS_KEY, 'wait_timeout', 1)
+        content, content_encoding = _encode(build(), encoding)
+        return content, False, content_encoding
+
+    try:
+        content = build()
+        encoded, content_encoding = _encode(content, encoding)
+        pipe = redis.pipeline()
+        pipe.set(key, content, ex=settings.CATALOG_CACHE_TIMEOUT)
+        if content_encoding:
+            pipe.set(_variant_key(key, content_encoding), encoded, ex=settings.CATALOG_CACHE_TIMEOUT)
+        pipe.execute()
+    finally:
+        # Блокировка могла истечь и достаться другому сборщику: удаляется только своя
+        redis.eval(_RELEASE, 1, lock_key, token)
+    return encoded, False, content_encoding
+
+
+def _cached(redis, key, found, encoding):
+    content, encoded = found
+    if encoded:
+        return content, True, encoding
+    content, content_encoding = _encode(content, encoding)
+    if content_encoding:
+        redis.set(_variant_key(key, content_encoding), content, ex=settings.CATALOG_CACHE_TIMEOUT)
+    return content, True, content_encoding
+
+
+async def aget_or_build(key, build, encoding=None):
+    """
+    get_or_build для async views: build — корутина, ожидание чужой пересборки не блокирует event loop.
+    """
+    redis = get_async_redis()
+    found = await _aget_counted(redis, key, encoding)
+    if found is not None:
+        return await _acached(redis, key, found, encoding)
+
+    lock_key = key + LOCK_SUFFIX
+    token = uuid.uuid4().hex
+    if not await redis.set(lock_key, token, nx=True, px=LOCK_TIMEOUT_MS):
+        deadline = time.monotonic() + LOCK_WAIT_SECONDS
+        while time.monotonic() < deadline:
+            await asyncio.sleep(LOCK_POLL_SECONDS)
+            found = await _aget_counted(redis, key, encoding, hit='wait_hit', miss=None)
+            if found is not None:
+                return await _acached(redis, key, found, encoding)
+        await redis.hincrby(STATS_KEY, 'wait_timeout', 1)
+        content, content_encoding = _encode(await build(), encoding)
+        return content, False, content_encoding
+
+    try:
+        content = await build()
+        encoded, content_encoding = _encode(content, encoding)
+        pipe = redis.pipeline()
+        pipe.set(key, content, ex=settings.CATALOG_CACHE_TIMEOUT)
+        if content_encoding:
+            pipe.set(_variant_key(key, content_encoding), encoded, ex=settings.CATALOG_CACHE_TIMEOUT)
+        await pipe.execute()
+    finally:
+        await redis.eval(_RELEASE, 1, lock_key, token)
+    return encoded, False, content_encoding
+
+
+async def _acached(redis, key, found, encoding):
+    content, encoded = found
+    if encoded:
+        return content, True, encoding
+    content, content_encoding = _encode(content, encoding)
+    if content_encoding:
+        await redis.set(_variant_key(key, content_encoding), content, ex=settings.CATALOG_CACHE_TIMEOUT)
+    return content, True, content_encoding
+
+
+# GET страницы (или её сжатого варианта) и учёт hit/miss за один round trip.
+# KEYS: страница, счётчики, сжатый вариант (если клиент принимает сжатие);
+# ARGV: счётчик попадания, счётчик промаха (пустой — промах не учитывается). Ответ — {тело, сжато ли}
+_GET_COUNTED = """
+if KEYS[3] then
+    local encoded = redis.call('GET', KEYS[3])
+    if encoded then
+        redis.call('HINCRBY', KEYS[2], ARGV[1], 1)
+        return {encoded, 1}
+    end
+end
+local content = redis.call('GET', KEYS[1])
+if content then
+    redis.call('HINCRBY', KEYS[2], ARGV[1], 1)
+    return {content, 0}
+end
+if ARGV[2] ~= '' then
+    redis.call('HINCRBY', KEYS[2], ARGV[2], 1)
+end
+return false
+"""
+
+# Снятие блокировки пересборки, только если она всё ещё наша. KEYS: блокировка; ARGV: токен
+_RELEASE = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def _counted_keys(key, encoding):
+    keys = [key, STATS_KEY] + ([_variant_key(key, encoding)] if encoding else [])
+    return (len(keys), *keys)
+
+
+def _get_counted(redis, key, encoding=None, hit='hit', miss='miss'):
+    return redis.eval(_GET_COUNTED, *_counted_keys(key, encoding), hit, miss or '')
+
+
+async def _aget_counted(redis, key, encoding=None, hit='hit', miss='miss'):
+    return await redis.eval(_GET_COUNTED, *_counted_keys(key, encoding), hit, miss or '')
+
+
+def cache_stats():
+    """
+    Счётчики кэша страниц: hit, miss, wait_hit (дождались чужой пересборки), wait_timeout.
+    """
+    stats = _redis().hgetall(STATS_KEY)
+    return {name.decode(): int(value) for name, value in stats.items()}
@@ -0,0 +1,85 @@
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramWordSimilarity
+from django.db import connection
+from django.db.models import BooleanField, Exists, F, FloatField, OuterRef, Q, Value
+from django.db.models.functions import Cast
+
+from .models import Product, Stock
+
+# Должна совпадать с конфигурацией в триггере search_vector (миграция 0002)
+SEARCH_CONFIG = 'simple'
+
+# Порядок выдачи поиска и поля курсора keyset-пагинации: сначала товары в наличии в магазине
+# пользователя, затем релевантность (rank), при равной релевантности — плотность совпадения
+# (proximity, ts_rank_cd: слова запроса рядом и в начале выше); id делает порядок однозначным.
+SEARCH_ORDERING = ('-in_user_store', '-rank', '-proximity', 'id')
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+_trigram_available = None
+
+
+def trigram_available():
+    """
+    Установлено ли расширение pg_trgm (проверяется один раз на процесс).
+    """
+    global _trigram_available
+    if _trigram_available is None:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm')")
+            _trigram_available = cursor.fetchone()[0]
+    return _trigram_available
+
+
+def build_search_query(query_str):
+    """
+    Превращает пользовательский ввод в tsquery с префиксным совпадением по каждому слову:
+    'lap pro' -> 'lap:* & pro:*'. Спецсимволы tsquery отбрасываются.
+    Возвращает None, если в запросе нет ни одного слова.
+    """
+    words = _WORD_RE.findall(query_str.lower())
+    if not words:
+        return None
+    raw = ' & '.join(f'{word}:*' for word in words)
+    return SearchQuery(raw, search_type='raw', config=SEARCH_CONFIG)
+
+
+def search_products(queryset, query_str):
+    """
+    Полнотекстовый поиск по Product.search_vector (GIN) с fallback на триграммное
+    сходство по name для опечаток (GIN gin_trgm_ops, если есть pg_trgm).
+    Аннотирует rank и proximity (double precision) для сортировки.
+    """
+    query = build_search_query(query_str)
+    if query is None:
+        return queryset.none()
+
+    condition = Q(search_vector=query)
+    rank = SearchRank(F('search_vector'), query)
+    if trigram_available():
+        condition |= Q(name__trigram_word_similar=query_str)
+        rank = rank + TrigramWordSimilarity(query_str, 'name')
+
+    # ts_rank возвращает real: приводим к double, чтобы значение из курсора сравнивалось точно.
+    return queryset.filter(condition).annotate(
+        rank=Cast(rank, FloatField()),
+        proximity=Cast(SearchRank(F('search_vector'), query, cover_density=True), FloatField()),
+    )
+
+
+def search_catalog(query_str, store):
+    """
+    Поиск товаров, которые есть в наличии хотя бы в одном магазине, с in_user_store —
+    есть ли товар в наличии в store; порядок — SEARCH_ORDERING.
+
+    Оба условия по остаткам — Exists (semi-join): строка товара не размножается по магазинам,
+    поэтому не нужен DISTINCT, а стоимость сортировки не зависит от числа магазинов.
+    """
+    queryset = search_products(Product.objects.all(), query_str)
+    queryset = queryset.filter(Exists(Stock.objects.filter(product=OuterRef('pk'), quantity__gt=0)))
+    if store:
+        in_user_store = Exists(Stock.objects.filter(product=OuterRef('pk'), store=store, quantity__gt=0))
+    else:
+        # Без магазина приоритет по складу не нужен
+        in_user_store = Value(False, output_field=BooleanField())
+    return queryset.annotate(in_user_store=in_user_store).order_by(*SEARCH_ORDERING)
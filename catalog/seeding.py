@@ -0,0 +1,98 @@
+"""
+Генератор тестового каталога для бенчмарков и нагрузочного тестирования.
+
+Данные детерминированы (random.Random(seed)): одинаковые параметры дают одинаковый каталог,
+поэтому замеры разных ревизий сравнимы между собой.
+"""
+import random
+from dataclasses import dataclass, field
+
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from .images import content_hash
+from .models import City, Price, Product, ProductImage, Stock, Store, UserProfile
+from .projection import rebuild_catalog_entries
+from .reference import bump_reference_version
+
+BATCH_SIZE = 5000
+# Слова в названиях товаров: поиск по любому из них находит ~1/len(WORDS) каталога
+WORDS = ('laptop', 'phone', 'tablet', 'monitor', 'camera', 'speaker', 'router', 'keyboard', 'mouse', 'watch')
+# Сигнатура PNG: изображения отдаются через /api/v1/images/<hash> как image/png
+PNG_HEADER = b'\x89PNG\r\n\x1a\n'
+
+
+@dataclass
+class SeededCatalog:
+    cities: list = field(default_factory=list)
+    stores: list = field(default_factory=list)
+    products: list = field(default_factory=list)
+    users: list = field(default_factory=list)
+    password: str = ''
+
+
+def seed_catalog(cities=3, stores_per_city=3, products=1000, stock_share=0.3, city_image_share=0.2,
+                 users=1, password='benchpass', seed=0):
+    """
+    Создаёт cities * stores_per_city магазинов и products товаров. Каждый товар продаётся
+    (Price + Stock) примерно в stock_share магазинов, ~10% его остатков нулевые;
+    у каждого товара есть общее изображение, у city_image_share товаров — ещё и городское.
+    Пользователи bench-0..N привязаны к магазинам по кругу.
+    """
+    rng = random.Random(seed)
+    result = SeededCatalog(password=password)
+
+    with transaction.atomic():
+        result.cities = City.objects.bulk_create([City(name=f"Bench city {i}") for i in range(cities)])
+        result.stores = Store.objects.bulk_create([
+            Store(name=f"Bench store {city.name} #{i}", city=city)
+            for city in result.cities for i in range(stores_per_city)
+        ])
+        result.products = Product.objects.bulk_create(
+            [
+                Product(
+                    name=f"{rng.choice(WORDS).capitalize()} {rng.choice(WORDS)} {i}",
+                    description=f"Bench product {i}: {' '.join(rng.sample(WORDS, 3))}",
+                )
+                for i in range(products)
+            ],
+            batch_size=BATCH_SIZE,
+        )
+
+        per_product = max(1, round(len(result.stores) * stock_share))
+        prices, stocks = [], []
+        for product in result.products:
+            for store in rng.sample(result.stores, per_product):
+                prices.append(Price(product=product, store=store, amount=rng.randint(100, 100000) / 100))
+                quantity = 0 if rng.random() < 0.1 else rng.randint(1, 500)
+                stocks.append(Stock(product=product, store=store, quantity=quantity))
+        Price.objects.bulk_create(prices, batch_size=BATCH_SIZE)
+        Stock.objects.bulk_create(stocks, batch_size=BATCH_SIZE)
+
+        images = []
+        for product in result.products:
+            images.append(_image(product, None))
+            if rng.random() < city_image_share:
+                images.append(_image(product, rng.choice(result.cities)))
+        ProductImage.objects.bulk_create(images, batch_size=BATCH_SIZE)
+        # bulk_create обходит сигналы: справочники сбрасываются, проекция каталога собирается целиком
+        bump_reference_version()
+        rebuild_catalog_entries()
+
+        for i in range(users):
+            user = User.objects.create_user(username=f'bench-{i}', password=password)
+            UserProfile.objects.create(user=user, store=result.stores[i % len(result.stores)])
+            result.users.append(user)
+
+    return result
+
+
+def _image(product, city):
+    content = PNG_HEADER + f'{product.pk}:{city.pk if city else ""}'.encode()
+    return ProductImage(
+        product=product,
+        city=city,
+        content=content,
+        content_hash=content_hash(content),
+        content_type='image/png',
+    )
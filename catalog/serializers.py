@@ -1,13 +1,118 @@
+from operator import attrgetter
+
+from django.urls import reverse
+from django.utils.functional import cached_property
 from rest_framework import serializers
-from .models import Product, ProductImage, Price, Stock
-from django.db.models import Q
+from rest_framework.fields import SkipField
+from .instrumentation import timing
+from .models import Product, ProductImage, Price, Stock, StoreCatalogEntry
+from .validators import MAX_ID, MAX_QUANTITY
+
+
+class TimedDataMixin:
+    # Время построения .data попадает в профиль запроса как этап serialize (Server-Timing, /metrics)
+    @property
+    def data(self):
+        with timing('serialize'):
+            return super().data
+
+
+class ProductListSerializer(TimedDataMixin, serializers.ListSerializer):
+    pass
+
+
+def _value_accessor(field, convert):
+    getter = attrgetter(field.source_attrs[0])
+
+    def accessor(instance):
+        try:
+            value = getter(instance)
+        except AttributeError:
+            # словарь, отсутствующий атрибут (SkipField / default) — как в Field.get_attribute
+            value = field.get_attribute(instance)
+        else:
+            if callable(value):
+                value = value()
+        return None if value is None else convert(value)
+    return accessor
+
+
+def _field_accessor(field):
+    # Общий путь Serializer.to_representation для одного поля
+    def accessor(instance):
+        attribute = field.get_attribute(instance)
+        check_for_none = attribute.pk if isinstance(attribute, serializers.PKOnlyObject) else attribute
+        return None if check_for_none is None else field.to_representation(attribute)
+    return accessor
+
+
+class CompiledRepresentationMixin:
+    """
+    to_representation без обхода полей DRF на каждый объект: доступ к полям собирается один раз
+    на экземпляр сериализатора (при many=True — один раз на список). Простые IntegerField / CharField
+    по одному атрибуту читаются attrgetter'ом, SerializerMethodField — связанным методом,
+    остальные поля — как в Serializer.to_representation. Результат совпадает с DRF.
+    """
+
+    @cached_property
+    def _accessors(self):
+        accessors = []
+        for field in self._readable_fields:
+            if isinstance(field, serializers.SerializerMethodField):
+                accessor = getattr(self, field.method_name)
+            elif (type(field) in (serializers.IntegerField, serializers.CharField)
+                    and len(field.source_attrs) == 1):
+                accessor = _value_accessor(field, int if type(field) is serializers.IntegerField else str)
+            else:
+                accessor = _field_accessor(field)
+            accessors.append((field.field_name, accessor))
+        return accessors
+
+    def to_representation(self, instance):
+        ret = {}
+        for name, accessor in self._accessors:
+            try:
+                ret[name] = accessor(instance)
+            except SkipField:
+                pass
+        return ret
+
+
+class ProductImageSerializer(CompiledRepresentationMixin, serializers.ModelSerializer):
+    # Вместо base64 в выдаче — ссылка на бинарное изображение и его хэш (ETag)
+    url = serializers.SerializerMethodField()
+    hash = serializers.CharField(source='content_hash', read_only=True)
 
-class ProductImageSerializer(serializers.ModelSerializer):
     class Meta:
         model = ProductImage
-        fields = ['id', 'image_data']
+        fields = ['id', 'url', 'hash']
+
+    @cached_property
+    def _image_url(self):
+        return image_url_builder(self.context.get('request'))
+
+    def get_url(self, obj):
+        return self._image_url(obj.content_hash)
+
 
-class ProductSerializer(serializers.ModelSerializer):
+def image_url(content_hash, request):
+    if not content_hash:
+        return None
+    url = reverse('product-image', args=[content_hash])
+    return request.build_absolute_uri(url) if request else url
+
+
+def image_url_builder(request):
+    """
+    image_url для одного запроса: reverse и build_absolute_uri — один раз, дальше склейка строк.
+    """
+    placeholder = '0' * 64
+    prefix = reverse('product-image', args=[placeholder])[:-len(placeholder)]
+    if request:
+        prefix = request.build_absolute_uri(prefix)
+    return lambda content_hash: prefix + content_hash if content_hash else None
+
+class ProductSerializer(TimedDataMixin, CompiledRepresentationMixin, serializers.ModelSerializer):
     images = serializers.SerializerMethodField()
     price = serializers.SerializerMethodField()
     stock = serializers.SerializerMethodField()
@@ -17,44 +122,68 @@ class ProductSerializer(serializers.ModelSerializer):
     class Meta:
         model = Product
         fields = ['id', 'name', 'description', 'images', 'price', 'stock', 'view_count']
+        list_serializer_class = ProductListSerializer
+
+    @cached_property
+    def _image_serializer(self):
+        return ProductImageSerializer(context=self.context)
 
+    # Данные по store подгружаются заранее через Product.objects.with_store_data(store),
+    # store пользователя приходит из контекста (резолвится один раз на запрос во view).
     def get_images(self, obj):
-        request = self.context.get('request')
-        user = request.user
-        store = getattr(getattr(user, 'profile', None), 'store', None)
-        city = store.city if store else None
+        store = self.context.get('store')
+        images = obj.store_images
 
         # Если есть city-specific изображения, берем их:
-        if city:
-            city_images = obj.images.filter(city=city)
-            if city_images.exists():
-                return ProductImageSerializer(city_images, many=True).data
+        if store:
+            city_images = [image for image in images if image.city_id == store.city_id]
+            if city_images:
+                return [self._image_serializer.to_representation(image) for image in city_images]
 
         # Иначе берем все изображения без указания города
-        generic_images = obj.images.filter(city__isnull=True)
-        return ProductImageSerializer(generic_images, many=True).data
+        return [self._image_serializer.to_representation(image) for image in images if image.city_id is None]
 
     def get_price(self, obj):
-        request = self.context.get('request')
-        user = request.user
-        store = getattr(getattr(user, 'profile', None), 'store', None)
-        if store:
-            price = obj.prices.filter(store=store).first()
-            if price:
-                return str(price.amount)
+        if obj.store_prices:
+            return str(obj.store_prices[0].amount)
         return None
 
     def get_stock(self, obj):
-        request = self.context.get('request')
-        user = request.user
-        store = getattr(getattr(user, 'profile', None), 'store', None)
-        if store:
-            stock = obj.stocks.filter(store=store).first()
-            if stock:
-                return stock.quantity
+        if obj.store_stocks:
+            return obj.store_stocks[0].quantity
         return 0
 
+class StoreCatalogEntrySerializer(TimedDataMixin, CompiledRepresentationMixin, serializers.ModelSerializer):
+    """
+    Строка проекции каталога в том же формате, что ProductSerializer: цена, остаток
+    и изображения уже выбраны для магазина, id — id товара.
+    """
+    id = serializers.IntegerField(source='product_id', read_only=True)
+    images = serializers.SerializerMethodField()
+    price = serializers.SerializerMethodField()
+    stock = serializers.IntegerField(source='quantity', read_only=True)
+    view_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = StoreCatalogEntry
+        fields = ['id', 'name', 'description', 'images', 'price', 'stock', 'view_count']
+        list_serializer_class = ProductListSerializer
+
+    @cached_property
+    def _image_url(self):
+        return image_url_builder(self.context.get('request'))
+
+    def get_images(self, obj):
+        return [
+            {'id': image_id, 'url': self._image_url(content_hash), 'hash': content_hash}
+            for image_id, content_hash in obj.images
+        ]
+
+    def get_price(self, obj):
+        return str(obj.price) if obj.price is not None else None
+
 class StockUpdateSerializer(serializers.Serializer):
-    product_id = serializers.IntegerField()
-    store_id = serializers.IntegerField()
-    quantity = serializers.IntegerField()
+    # Те же правила проверяет быстрый валидатор catalog.validators.validate_stock_rows
+    product_id = serializers.IntegerField(min_value=1, max_value=MAX_ID)
+    store_id = serializers.IntegerField(min_value=1, max_value=MAX_ID)
+    quantity = serializers.IntegerField(min_value=0, max_value=MAX_QUANTITY)
@@ -0,0 +1,90 @@
+"""
+Инвалидация кэшей каталога и пересчёт проекции каталога (catalog.projection)
+при изменении данных через ORM (save / delete).
+Массовые записи остатков делают это сами (catalog.stocks.upsert_stock_rows).
+"""
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import CatalogChange, City, Price, Product, ProductImage, Stock, Store, StoreChangeSequence, User, UserProfile
+from .projection import refresh_pairs, refresh_products, refresh_stores
+from .response_cache import bump_store_versions
+from .reference import bump_reference_version, stores_in_city
+from .user_store import forget_user_stores
+
+
+def touch_product(product_id):
+    # Версия карточки товара — наибольший updated_at его строк (catalog.conditional):
+    # удалённая строка его не сдвинет, поэтому удаление обновляет updated_at товара
+    Product.objects.filter(pk=product_id).update(updated_at=timezone.now())
+
+
+@receiver([post_save, post_delete], sender=Price)
+@receiver([post_save, post_delete], sender=Stock)
+def invalidate_store_catalog(sender, instance, **kwargs):
+    refresh_pairs([(instance.store_id, instance.product_id)])
+    bump_store_versions([instance.store_id])
+    if kwargs['signal'] is post_delete:
+        touch_product(instance.product_id)
+
+
+@receiver([post_save, post_delete], sender=Product)
+def invalidate_product_catalogs(sender, instance, **kwargs):
+    # Строки удалённого товара удаляет каскад
+    if kwargs['signal'] is post_save:
+        refresh_products([instance.pk])
+    # Товар виден в каталогах магазинов, где по нему есть остатки
+    bump_store_versions(Stock.objects.filter(product_id=instance.pk).values_list('store_id', flat=True))
+
+
+@receiver([post_save, post_delete], sender=ProductImage)
+def invalidate_image_catalogs(sender, instance, **kwargs):
+    refresh_products([instance.product_id])
+    if kwargs['signal'] is post_delete:
+        touch_product(instance.product_id)
+    stocks = Stock.objects.filter(product_id=instance.product_id)
+    if instance.city_id:
+        # city-specific изображение влияет только на магазины этого города
+        stocks = stocks.filter(store_id__in=[store.pk for store in stores_in_city(instance.city_id)])
+    bump_store_versions(stocks.values_list('store_id', flat=True))
+
+
+@receiver([post_save, post_delete], sender=UserProfile)
+def invalidate_user_store(sender, instance, **kwargs):
+    forget_user_stores([instance.user_id])
+
+
+@receiver([post_save, pre_delete], sender=Store)
+def invalidate_store_users(sender, instance, **kwargs):
+    # pre_delete: при удалении магазина профили обнуляются через SET_NULL без сигналов
+    forget_user_stores(UserProfile.objects.filter(store=instance).values_list('user_id', flat=True))
+    bump_reference_version()
+    if kwargs['signal'] is post_save:
+        # Смена города меняет изображения в каталоге магазина
+        refresh_stores([instance.pk])
+    bump_store_versions([instance.pk])
+
+
+@receiver(post_delete, sender=Store)
+def forget_store_changes(sender, instance, **kwargs):
+    # Журнал изменений удалённого магазина никому не нужен (catalog.changes)
+    CatalogChange.objects.filter(store_id=instance.pk).delete()
+    StoreChangeSequence.objects.filter(store_id=instance.pk).delete()
+
+
+@receiver([post_save, post_delete], sender=City)
+def invalidate_city_reference(sender, instance, **kwargs):
+    bump_reference_version()
+
+
+# JWT удалённого или деактивированного пользователя снова проверяются по БД
+@receiver(post_save, sender=User)
+def invalidate_inactive_user_claims(sender, instance, **kwargs):
+    if not instance.is_active:
+        forget_user_stores([instance.pk])
+
+
+@receiver(post_delete, sender=User)
+def invalidate_deleted_user_claims(sender, instance, **kwargs):
+    forget_user_stores([instance.pk])
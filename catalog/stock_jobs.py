@@ -0,0 +1,138 @@
+"""
+Учёт заданий на обновление остатков: прогресс по пачкам и ключи идемпотентности.
+
+Задание — Redis-хэш catalog:stock-job:<job_id> с полем на каждую пачку и id отправившего
+его пользователя; пачки (apply_stock_chunk_task) сами отмечают в нём свой статус и результат.
+Задание видно только его автору и staff. Ключ идемпотентности действует в пределах пользователя
+и занимается уже созданным заданием: повтор всегда получает id задания, которое можно прочитать.
+"""
+import json
+
+from django_redis import get_redis_connection
+
+from .authentication import user_is_staff
+
+JOB_KEY = 'catalog:stock-job:{}'
+IDEMPOTENCY_KEY = 'catalog:stock-job:idempotency:{user_id}:{key}'
+JOB_TTL = 60 * 60 * 24
+
+PENDING = 'PENDING'
+STARTED = 'STARTED'
+SUCCESS = 'SUCCESS'
+FAILURE = 'FAILURE'
+
+
+def _redis():
+    return get_redis_connection('default')
+
+
+def claim_idempotency_key(user_id, key, job_id):
+    """
+    Привязывает ключ идемпотентности пользователя к уже созданному заданию (create_job).
+    Возвращает None, если ключ новый, или id задания, уже созданного с этим ключом.
+    """
+    redis = _redis()
+    redis_key = IDEMPOTENCY_KEY.format(user_id=user_id, key=key)
+    if redis.set(redis_key, job_id, nx=True, ex=JOB_TTL):
+        return None
+    existing = redis.get(redis_key)
+    return existing.decode() if existing else None
+
+
+def release_idempotency_key(user_id, key):
+    _redis().delete(IDEMPOTENCY_KEY.format(user_id=user_id, key=key))
+
+
+def chunk_task_id(job_id, index):
+    """
+    id задачи Celery для пачки: по нему статус пачки виден и в результатах Celery (/api/v1/tasks/<id>).
+    """
+    return f'{job_id}.{index}'
+
+
+def create_job(job_id, chunks, user_id):
+    """
+    Регистрирует задание пользователя user_id со списком пачек (до отправки задач в очередь).
+    """
+    fields = {
+        f'chunk:{index}': json.dumps({
+            'rows': len(chunk),
+            'task_id': chunk_task_id(job_id, index),
+            'store_ids': sorted({row[1] for row in chunk}),
+            'state': PENDING,
+            'result': None,
+        })
+        for index, chunk in enumerate(chunks)
+    }
+    fields['chunks_total'] = len(chunks)
+    fields['user_id'] = user_id
+
+    pipe = _redis().pipeline()
+    pipe.hset(JOB_KEY.format(job_id), mapping=fields)
+    pipe.expire(JOB_KEY.format(job_id), JOB_TTL)
+    pipe.execute()
+
+
+def delete_job(job_id):
+    _redis().delete(JOB_KEY.format(job_id))
+
+
+def _visible(owner, user):
+    return (owner is not None and int(owner) == user.pk) or user_is_staff(user)
+
+
+def job_visible(job_id, user):
+    """
+    Задание существует и доступно пользователю: его автору или staff.
+    """
+    owner = _redis().hget(JOB_KEY.format(job_id), 'user_id')
+    return owner is not None and _visible(owner, user)
+
+
+def update_chunk(job_id, index, state, result=None):
+    redis_key = JOB_KEY.format(job_id)
+    redis = _redis()
+    raw = redis.hget(redis_key, f'chunk:{index}')
+    if raw is None:
+        # Задание истекло или не регистрировалось: прогресс не отслеживаем
+        return
+    chunk = json.loads(raw)
+    chunk.update(state=state, result=result)
+    redis.hset(redis_key, f'chunk:{index}', json.dumps(chunk))
+
+
+def get_job(job_id, user):
+    """
+    Статус задания и каждой пачки или None, если задание не найдено или недоступно user.
+    """
+    fields = _redis().hgetall(JOB_KEY.format(job_id))
+    if not fields or not _visible(fields.pop(b'user_id', None), user):
+        return None
+
+    chunks_total = int(fields.pop(b'chunks_total'))
+    chunks = [json.loads(fields[f'chunk:{index}'.encode()]) for index in range(chunks_total)]
+    states = [chunk['state'] for chunk in chunks]
+
+    if FAILURE in states:
+        state = FAILURE
+    elif all(s == SUCCESS for s in states):
+        state = SUCCESS
+    elif all(s == PENDING for s in states):
+        state = PENDING
+    else:
+        state = STARTED
+
+    totals = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'skipped': 0}
+    for chunk in chunks:
+        for name, value in (chunk['result'] or {}).items():
+            if name in totals:
+                totals[name] += value
+
+    return {
+        'task_id': job_id,
+        'state': state,
+        'chunks_total': chunks_total,
+        'chunks_done': states.count(SUCCESS),
+        'totals': totals,
+        'chunks': [dict(chunk, index=index) for index, chunk in enumerate(chunks)],
+    }
@@ -0,0 +1,119 @@
+"""
+Set-based upsert остатков: INSERT ... ON CONFLICT (product_id, store_id) DO UPDATE
+пачками через unnest() массивов вместо построчной загрузки и bulk_update.
+"""
+from django.db import connection, transaction
+
+from .changes import log_changes_sql, schedule_sequencing
+from .models import Product, Stock, Store, StoreCatalogEntry
+from .projection import refresh_pairs
+from .response_cache import bump_store_versions
+
+UPSERT_CHUNK_SIZE = 5000
+
+# - строки с несуществующими product_id / store_id отсекаются join-ами (а не роняют пачку на FK);
+# - строки с тем же quantity не переписываются (WHERE ... IS DISTINCT FROM) и не попадают в RETURNING;
+# - xmax = 0 у строки, вставленной этим запросом, и != 0 у обновлённой;
+# - у обновлённых строк в проекции каталога меняется только quantity — тем же запросом
+#   (и пишется журнал изменений, catalog.changes), новые пары пересчитываются целиком
+#   (catalog.projection.refresh_pairs).
+# Возвращает (валидных строк, вставлено, обновлено, магазины с изменениями,
+# store_id и product_id вставленных строк).
+UPSERT_SQL = f"""
+WITH rows AS (
+    SELECT d.product_id, d.store_id, d.quantity
+    FROM unnest(%s::bigint[], %s::bigint[], %s::integer[]) AS d(product_id, store_id, quantity)
+    JOIN {Product._meta.db_table} p ON p.id = d.product_id
+    JOIN {Store._meta.db_table} st ON st.id = d.store_id
+), written AS (
+    INSERT INTO {Stock._meta.db_table} AS s (product_id, store_id, quantity)
+    SELECT product_id, store_id, quantity FROM rows
+    ON CONFLICT (product_id, store_id) DO UPDATE
+        SET quantity = EXCLUDED.quantity
+        WHERE s.quantity IS DISTINCT FROM EXCLUDED.quantity
+    RETURNING (xmax = 0) AS inserted, s.store_id, s.product_id, s.quantity
+), projected AS (
+    UPDATE {StoreCatalogEntry._meta.db_table} AS e
+    SET quantity = w.quantity
+    FROM written w
+    WHERE NOT w.inserted AND e.store_id = w.store_id AND e.product_id = w.product_id
+), updated AS (
+    SELECT store_id, product_id FROM written WHERE NOT inserted
+),{log_changes_sql('updated')}
+SELECT
+    (SELECT count(*) FROM rows),
+    count(*) FILTER (WHERE inserted),
+    count(*) FILTER (WHERE NOT inserted),
+    coalesce(array_agg(DISTINCT store_id), '{{}}'),
+    coalesce(array_agg(store_id) FILTER (WHERE inserted), '{{}}'),
+    coalesce(array_agg(product_id) FILTER (WHERE inserted), '{{}}')
+FROM written
+"""
+
+
+def deduplicate_stock_rows(rows):
+    """
+    Убирает повторы пар (product_id, store_id) в строках (product_id, store_id, quantity) —
+    побеждает последнее значение. Результат отсортирован по (store_id, product_id):
+    одинаковый порядок блокировок у параллельных upsert-ов исключает взаимные блокировки.
+    """
+    latest = {(product_id, store_id): quantity for product_id, store_id, quantity in rows}
+    return sorted(
+        ((product_id, store_id, quantity) for (product_id, store_id), quantity in latest.items()),
+        key=lambda row: (row[1], row[0]),
+    )
+
+
+def plan_stock_chunks(rows, chunk_size):
+    """
+    Делит строки (product_id, store_id, quantity) на пачки не больше chunk_size для параллельной
+    обработки. Пары уникальны и отсортированы по магазину, поэтому пачки не пересекаются
+    по строкам Stock, а строки одного магазина идут подряд.
+    Пачка — список [product_id, store_id, quantity].
+    """
+    unique_rows = deduplicate_stock_rows(rows)
+    return [
+        [list(row) for row in unique_rows[start:start + chunk_size]]
+        for start in range(0, len(unique_rows), chunk_size)
+    ]
+
+
+def upsert_stocks(rows, chunk_size=UPSERT_CHUNK_SIZE):
+    """
+    Применяет список {product_id, store_id, quantity} к Stock, один запрос на пачку.
+    Возвращает {'inserted', 'updated', 'unchanged', 'skipped'}, где skipped —
+    строки с несуществующим товаром или магазином.
+    """
+    unique_rows = deduplicate_stock_rows(
+        (row['product_id'], row['store_id'], row['quantity']) for row in rows
+    )
+    return upsert_stock_rows(unique_rows, chunk_size)
+
+
+def upsert_stock_rows(unique_rows, chunk_size=UPSERT_CHUNK_SIZE):
+    """
+    То же, что upsert_stocks, для уже дедуплицированных строк (product_id, store_id, quantity).
+    Проекция каталога пересчитывается только для изменившихся строк, кэш каталога
+    сбрасывается только для магазинов, где что-то изменилось.
+    """
+    result = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'skipped': 0}
+    changed_store_ids = set()
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        for start in range(0, len(unique_rows), chunk_size):
+            chunk = unique_rows[start:start + chunk_size]
+            product_ids, store_ids, quantities = (list(column) for column in zip(*chunk))
+            cursor.execute(UPSERT_SQL, [product_ids, store_ids, quantities])
+            valid, inserted, updated, written_store_ids, *inserted_pairs = cursor.fetchone()
+            changed_store_ids.update(written_store_ids)
+            refresh_pairs(zip(*inserted_pairs))
+
+            result['inserted'] += inserted
+            result['updated'] += updated
+            result['unchanged'] += valid - inserted - updated
+            result['skipped'] += len(chunk) - valid
+
+        bump_store_versions(changed_store_ids)
+        schedule_sequencing()
+
+    return result
@@ -1,26 +1,138 @@
 # catalog/tasks.py
+import logging
+import time
+
 from celery import shared_task
-from django.db import transaction
-from django.db.models import Q
-from catalog.models import Stock
+from celery.signals import task_postrun, task_prerun, task_retry
+from django.conf import settings
+from django.db import OperationalError
+from redis.exceptions import RedisError
 
-@shared_task
-def bulk_update_stocks_task(validated_data):
+from catalog import metrics, stock_jobs
+from catalog.changes import compact_changes
+from catalog.db_routing import use_primary
+from catalog.rate_limits import RateLimited, acquire_rows
+from catalog.stocks import upsert_stock_rows, upsert_stocks
+from catalog.view_counter import flush_view_counts
+
+logger = logging.getLogger(__name__)
+
+# Повторы пачки при ошибке соединения с БД (ожидание квоты в них не входит)
+STOCK_DB_RETRIES = 3
+
+
+def _acquire_stock_rows(rows):
+    """
+    Квота на обновление rows строк остатков, общая для всех воркеров (catalog.rate_limits).
+    """
+    return acquire_rows('stock-update', rows, settings.STOCK_UPDATE_ROWS_PER_SECOND,
+                        settings.STOCK_UPDATE_RATE_BURST)
+
+
+@shared_task(bind=True)
+def bulk_update_stocks_task(self, validated_data):
     """
     Асинхронная задача для обновления остатков.
     validated_data — список словарей вида [{product_id, store_id, quantity}, ...]
+    Отсутствующие пары создаются, повторы в списке схлопываются (побеждает последняя).
+    Возвращает {'inserted', 'updated', 'unchanged', 'skipped'}.
+    Все запросы задачи, включая чтения, идут на primary (catalog.db_routing).
+    """
+    wait = _acquire_stock_rows(len(validated_data))
+    if wait:
+        raise self.retry(exc=RateLimited(wait), countdown=wait, max_retries=None)
+    with use_primary():
+        return upsert_stocks(validated_data)
+
+
+@shared_task(bind=True)
+def apply_stock_chunk_task(self, job_id, index, rows, db_retries=0):
+    """
+    Одна пачка задания на обновление остатков (см. StockUpdateView).
+    rows — [[product_id, store_id, quantity], ...], уже без повторов.
+    Статус пачки пишется в задание job_id (catalog.stock_jobs).
+
+    Пачка ждёт квоту STOCK_UPDATE_ROWS_PER_SECOND (повтор с countdown, воркер не блокируется),
+    при потере соединения с БД повторяется до STOCK_DB_RETRIES раз с экспоненциальной паузой.
+    Как и bulk_update_stocks_task, работает только с primary.
+    """
+    wait = _acquire_stock_rows(len(rows))
+    if wait:
+        raise self.retry(exc=RateLimited(wait), countdown=wait, max_retries=None)
+
+    stock_jobs.update_chunk(job_id, index, stock_jobs.STARTED)
+    try:
+        with use_primary():
+            result = upsert_stock_rows([tuple(row) for row in rows])
+    except OperationalError as exc:
+        if db_retries < STOCK_DB_RETRIES:
+            stock_jobs.update_chunk(job_id, index, stock_jobs.PENDING)
+            raise self.retry(
+                exc=exc, countdown=2 ** db_retries, max_retries=None,
+                kwargs={'db_retries': db_retries + 1},
+            )
+        stock_jobs.update_chunk(job_id, index, stock_jobs.FAILURE, {'error': repr(exc)})
+        raise
+    except Exception as exc:
+        stock_jobs.update_chunk(job_id, index, stock_jobs.FAILURE, {'error': repr(exc)})
+        raise
+    stock_jobs.update_chunk(job_id, index, stock_jobs.SUCCESS, result)
+    return result
+
+
+@shared_task(ignore_result=True)
+def flush_view_counts_task():
+    """
+    Периодическая задача: переносит накопленные в Redis просмотры товаров в БД.
+    """
+    return flush_view_counts()
+
+
+@shared_task
+def compact_catalog_changes_task():
     """
-    updates_map = {(item['product_id'], item['store_id']): item['quantity'] for item in validated_data}
+    Периодическая задача: удаляет из журнала изменений каталога записи старше
+    CATALOG_CHANGES_RETENTION секунд (catalog.changes). Возвращает число удалённых записей.
+    """
+    return compact_changes(settings.CATALOG_CHANGES_RETENTION)
+
+
+# Метрики задач (catalog.metrics). Обработчики подключаются при импорте модуля:
+# в воркере — через autodiscover_tasks, в веб-процессе — вместе с views (eager-режим).
+_started = {}
+
+
+def _result_rows(retval):
+    # Результат upsert остатков: {'inserted', 'updated', 'unchanged', 'skipped'}
+    if isinstance(retval, dict) and 'skipped' in retval:
+        return sum(retval.get(name, 0) for name in ('inserted', 'updated', 'unchanged', 'skipped'))
+    return None
+
+
+@task_prerun.connect
+def _task_started(task_id=None, **kwargs):
+    _started[task_id] = time.perf_counter()
+
 
-    with transaction.atomic():
-        stocks_to_update = Stock.objects.filter(
-            Q(product_id__in=[i['product_id'] for i in validated_data]),
-            Q(store_id__in=[i['store_id'] for i in validated_data])
-        )
-        for s in stocks_to_update:
-            key = (s.product_id, s.store_id)
-            s.quantity = updates_map[key]
+@task_postrun.connect
+def _task_finished(task_id=None, task=None, retval=None, state=None, **kwargs):
+    started = _started.pop(task_id, None)
+    if started is None or not settings.PERF_METRICS_ENABLED:
+        return
+    rows = _result_rows(retval) if state == 'SUCCESS' else None
+    try:
+        metrics.record_task(task.name, state, time.perf_counter() - started, rows)
+    except RedisError:
+        # Метрики не должны ронять задачу
+        logger.warning("Failed to record task metrics", exc_info=True)
 
-        Stock.objects.bulk_update(stocks_to_update, ['quantity'])
 
-    return len(stocks_to_update)  # Можно вернуть число обновлённых записей
+@task_retry.connect
+def _task_retried(sender=None, reason=None, **kwargs):
+    if not settings.PERF_METRICS_ENABLED:
+        return
+    exc = getattr(reason, 'exc', None) or reason
+    try:
+        metrics.record_task_retry(sender.name, type(exc).__name__)
+    except RedisError:
+        logger.warning("Failed to record task metrics", exc_info=True)
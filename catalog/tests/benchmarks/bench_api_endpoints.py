@@ -0,0 +1,111 @@
+"""
+Латентность (p50/p95/p99), SQL-запросы и размер ответа по эндпоинтам API на сгенерированном каталоге.
+Падает, если любая метрика превышает порог из THRESHOLDS.
+
+    pytest -m benchmark -s catalog/tests/benchmarks/bench_api_endpoints.py
+
+BENCH_API_PRODUCTS — размер каталога, BENCH_API_ITERATIONS — запросов на эндпоинт,
+BENCH_LATENCY_FACTOR — множитель порогов латентности для медленных машин.
+Нагрузка на запущенный сервер по HTTP: manage.py seed_catalog && manage.py load_catalog
+"""
+import gc
+import os
+import time
+from itertools import cycle
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from catalog.loadtest import check_thresholds, format_summary, summarize
+from catalog.response_cache import bump_store_versions
+from catalog.seeding import seed_catalog
+from catalog.tasks import bulk_update_stocks_task
+
+PRODUCTS = int(os.environ.get('BENCH_API_PRODUCTS', 5000))
+ITERATIONS = int(os.environ.get('BENCH_API_ITERATIONS', 50))
+LATENCY_FACTOR = float(os.environ.get('BENCH_LATENCY_FACTOR', 1.0))
+STOCK_FEED_ROWS = 1000
+
+# Пороги для PRODUCTS=5000 (seed=0): латентность ~2x от замеров на машине разработчика,
+# запросы совпадают с test_query_budgets, байты — с запасом ~20%
+THRESHOLDS = {
+    'catalog': {'p95_ms': 400, 'p99_ms': 600, 'queries': 1, 'bytes': 650_000},
+    'catalog-page': {'p95_ms': 60, 'p99_ms': 100, 'queries': 1, 'bytes': 40_000},
+    'catalog-cached': {'p95_ms': 10, 'p99_ms': 20, 'queries': 0, 'bytes': 40_000},
+    'product-detail': {'p95_ms': 20, 'p99_ms': 40, 'queries': 4, 'bytes': 1_000},
+    'search': {'p95_ms': 100, 'p99_ms': 250, 'queries': 4, 'bytes': 10_000},
+    'stock-update': {'p95_ms': 450, 'p99_ms': 600, 'queries': 4, 'bytes': 1_000},
+    'stock-task': {'p95_ms': 800, 'p99_ms': 1000, 'queries': 4},
+}
+
+
+def measure(call, iterations, before=None):
+    """
+    Выполняет call() iterations раз: латентность, байты ответа и SQL-запросы на каждый вызов.
+    before() вызывается перед каждым замером и в него не входит. Мусор предыдущих вызовов
+    собирается до замера: полная сборка не должна попадать в латентность случайного запроса.
+    """
+    latencies, sizes, queries = [], [], []
+    for _ in range(iterations):
+        if before:
+            before()
+        gc.collect()
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            result = call()
+            latencies.append(time.perf_counter() - started)
+        queries.append(len(captured))
+        sizes.append(len(result.content) if hasattr(result, 'content') else 0)
+    return summarize(latencies, sizes, queries)
+
+
+@pytest.mark.benchmark
+@pytest.mark.django_db
+def bench_api_endpoints():
+    catalog = seed_catalog(products=PRODUCTS)
+    store = catalog.users[0].profile.store
+    client = APIClient()
+    token_resp = client.post(
+        '/api/v1/token/', {'username': catalog.users[0].username, 'password': catalog.password}, format='json'
+    )
+    client.credentials(HTTP_AUTHORIZATION='Bearer ' + token_resp.data['access'])
+
+    product_ids = cycle(p.id for p in catalog.products)
+    feed = [
+        {'product_id': p.id, 'store_id': s.id, 'quantity': 1}
+        for p in catalog.products[:STOCK_FEED_ROWS // len(catalog.stores)] for s in catalog.stores
+    ]
+    quantities = cycle(range(1, 1000))
+
+    def stock_feed():
+        # Каждый прогон меняет остатки, иначе upsert пропустит неизменённые строки
+        quantity = next(quantities)
+        return [dict(row, quantity=quantity) for row in feed]
+
+    def invalidate_pages():
+        bump_store_versions([store.id])
+
+    scenarios = {
+        'catalog': (lambda: client.get('/api/v1/catalog/'), invalidate_pages),
+        'catalog-page': (lambda: client.get('/api/v1/catalog/?limit=100'), invalidate_pages),
+        'catalog-cached': (lambda: client.get('/api/v1/catalog/?limit=100'), None),
+        'product-detail': (lambda: client.get(f'/api/v1/product/{next(product_ids)}/'), None),
+        'search': (lambda: client.get('/api/v1/search/?q=laptop&limit=20'), None),
+        'stock-update': (lambda: client.post('/api/v1/catalog/update/stocks', stock_feed(), format='json'), None),
+        'stock-task': (lambda: bulk_update_stocks_task(stock_feed()), None),
+    }
+
+    # Прогрев: кэши процесса и Redis, первая сборка страниц
+    for call, _ in scenarios.values():
+        call()
+
+    violations = []
+    print(f"\n{PRODUCTS} products, {len(catalog.stores)} stores, {ITERATIONS} requests per endpoint")
+    for name, (call, before) in scenarios.items():
+        summary = measure(call, ITERATIONS, before)
+        print(format_summary(name, summary))
+        violations.extend(check_thresholds(name, summary, THRESHOLDS[name], LATENCY_FACTOR))
+
+    assert not violations, '\n'.join(violations)
@@ -0,0 +1,94 @@
+"""
+Масштабирование по числу одновременных запросов: gunicorn с sync-воркерами (WSGI)
+против gunicorn с uvicorn-воркерами (ASGI) при одинаковом числе процессов.
+
+    pytest -m benchmark -s catalog/tests/benchmarks/bench_asgi_vs_wsgi.py
+
+BENCH_SERVER_WORKERS — воркеров на сервер, BENCH_CONCURRENCY — уровни конкурентности
+через запятую, BENCH_SERVER_REQUESTS — запросов на уровень.
+"""
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+import pytest
+from django.db import connection
+
+from catalog.loadtest import format_summary, obtain_token, run_load
+from catalog.seeding import seed_catalog
+
+WORKERS = int(os.environ.get('BENCH_SERVER_WORKERS', 2))
+CONCURRENCY = [int(c) for c in os.environ.get('BENCH_CONCURRENCY', '1,4,16,64').split(',')]
+REQUESTS = int(os.environ.get('BENCH_SERVER_REQUESTS', 400))
+PRODUCTS = int(os.environ.get('BENCH_SERVER_PRODUCTS', 5000))
+METRICS_TOKEN = 'bench-metrics'
+
+SERVERS = {
+    'wsgi': ['testProject.wsgi:application'],
+    'asgi': ['testProject.asgi:application', '-k', 'uvicorn_worker.UvicornWorker'],
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(args, port):
+    # Сервер ходит в тестовую БД, куда seed_catalog закоммитил данные (transaction=True)
+    env = dict(os.environ, POSTGRES_DB=connection.settings_dict['NAME'], PERF_SAMPLE_RATE='0',
+               METRICS_TOKEN=METRICS_TOKEN)
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', *args, '--workers', str(WORKERS), '--bind', f'127.0.0.1:{port}',
+         '--log-level', 'warning'],
+        env=env,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(urllib.request.Request(
+                f'http://127.0.0.1:{port}/metrics', headers={'Authorization': f'Bearer {METRICS_TOKEN}'}
+            ), timeout=1)
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"Server {args[0]} did not start")
+
+
+@pytest.mark.benchmark
+@pytest.mark.django_db(transaction=True)
+def bench_asgi_vs_wsgi():
+    pytest.importorskip('gunicorn')
+    pytest.importorskip('uvicorn_worker')
+    catalog = seed_catalog(products=PRODUCTS)
+    product_ids = [p.id for p in catalog.products[:200]]
+
+    print(f"\n{PRODUCTS} products, {WORKERS} workers per server, {REQUESTS} requests per level")
+    for name, args in SERVERS.items():
+        port = free_port()
+        process = start_server(args, port)
+        try:
+            base_url = f'http://127.0.0.1:{port}'
+            headers = {'Authorization': 'Bearer ' + obtain_token(base_url, catalog.users[0].username, catalog.password)}
+            scenarios = {
+                'search': [f'{base_url}/api/v1/search/?q=laptop&limit=20'] * REQUESTS,
+                'product-detail': [
+                    f'{base_url}/api/v1/product/{product_ids[i % len(product_ids)]}/' for i in range(REQUESTS)
+                ],
+            }
+            for scenario, urls in scenarios.items():
+                run_load(urls[:WORKERS * 4], headers, WORKERS)  # прогрев подключений и кэшей воркеров
+                for concurrency in CONCURRENCY:
+                    started = time.perf_counter()
+                    summary, errors = run_load(urls, headers, concurrency)
+                    rps = len(urls) / (time.perf_counter() - started)
+                    print(f"{name} c={concurrency:<3} {format_summary(scenario, summary)} rps={rps:.0f}")
+                    assert errors == 0
+        finally:
+            process.terminate()
+            process.wait(timeout=10)
@@ -0,0 +1,72 @@
+"""
+Сжатие ответов каталога: экономия трафика против затрат CPU по кодировкам и уровням,
+и попадание в кэш страниц со сжатым вариантом против сжатия на лету.
+
+    BENCH_COMPRESSION_PRODUCTS=5000 pytest -m benchmark -s catalog/tests/benchmarks/bench_compression.py
+"""
+import os
+import time
+
+import pytest
+from rest_framework.test import APIClient
+
+from catalog import compression
+from catalog.seeding import seed_catalog
+
+PRODUCTS = int(os.environ.get('BENCH_COMPRESSION_PRODUCTS', 5000))
+ROUNDS = int(os.environ.get('BENCH_COMPRESSION_ROUNDS', 20))
+
+
+def best_of(call, rounds=ROUNDS):
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        result = call()
+        timings.append(time.perf_counter() - started)
+    return min(timings), result
+
+
+@pytest.mark.benchmark
+@pytest.mark.django_db
+def bench_compression(settings):
+    catalog = seed_catalog(products=PRODUCTS)
+    client = APIClient()
+    token_resp = client.post(
+        '/api/v1/token/', {'username': catalog.users[0].username, 'password': catalog.password}, format='json'
+    )
+    client.credentials(HTTP_AUTHORIZATION='Bearer ' + token_resp.data['access'])
+
+    bodies = {
+        'catalog-page': client.get('/api/v1/catalog/?limit=100').content,
+        'catalog': client.get('/api/v1/catalog/').content,
+        'search': client.get('/api/v1/search/?q=laptop&limit=100').content,
+    }
+    levels = [('gzip', {'COMPRESSION_GZIP_LEVEL': level}) for level in (1, 6, 9)]
+    if compression.brotli is not None:
+        levels += [('br', {'COMPRESSION_BROTLI_QUALITY': quality}) for quality in (4, 9, 11)]
+
+    print(f"\n{PRODUCTS} products")
+    for name, body in bodies.items():
+        print(f"{name}: {len(body)} bytes")
+        for encoding, options in levels:
+            for setting, value in options.items():
+                setattr(settings, setting, value)
+            seconds, compressed = best_of(lambda: compression.compress(body, encoding), rounds=5)
+            saved = 1 - len(compressed) / len(body)
+            print(f"  {encoding} {value:>2}: {len(compressed):>8} bytes, saved {saved:.0%}, "
+                  f"{seconds * 1000:.2f}ms ({len(body) / seconds / 2 ** 20:.0f} MiB/s)")
+            assert len(compressed) < len(body)
+
+    # Страница из кэша: сжатый вариант хранится рядом — попадание не тратит CPU на сжатие
+    url = '/api/v1/catalog/?limit=100'
+    client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+    plain_time, plain = best_of(lambda: client.get(url))
+    cached_time, cached = best_of(lambda: client.get(url, HTTP_ACCEPT_ENCODING='gzip'))
+    settings.COMPRESSION_GZIP_LEVEL = 6
+    dynamic_time, dynamic = best_of(lambda: compression.compress(plain.content, 'gzip'))
+    print(
+        f"catalog-cached: plain {plain_time * 1000:.2f}ms {len(plain.content)} bytes, "
+        f"precompressed gzip {cached_time * 1000:.2f}ms {len(cached.content)} bytes; "
+        f"on-the-fly gzip would add {dynamic_time * 1000:.2f}ms"
+    )
+    assert cached['Content-Encoding'] == 'gzip' and len(cached.content) <= len(dynamic)
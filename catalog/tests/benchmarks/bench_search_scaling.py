@@ -0,0 +1,81 @@
+"""
+Латентность поиска при росте числа магазинов: search_catalog (Exists) против прежнего
+запроса с join-ом stocks и DISTINCT. Число товаров постоянно, остатков — пропорционально
+числу магазинов.
+
+    pytest -m benchmark -s catalog/tests/benchmarks/bench_search_scaling.py
+
+BENCH_SEARCH_STORES — числа магазинов через запятую, BENCH_SEARCH_PRODUCTS — товаров,
+BENCH_SEARCH_REPEATS — замеров на запрос.
+"""
+import os
+import statistics
+import time
+
+import pytest
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+
+from catalog.models import Product, Stock
+from catalog.search import search_catalog, search_products
+from catalog.seeding import seed_catalog
+
+STORES = [int(s) for s in os.environ.get('BENCH_SEARCH_STORES', '10,100,1000').split(',')]
+PRODUCTS = int(os.environ.get('BENCH_SEARCH_PRODUCTS', 2000))
+REPEATS = int(os.environ.get('BENCH_SEARCH_REPEATS', 30))
+QUERY = 'laptop'
+PAGE = 20
+
+
+def legacy_search(query_str, store):
+    """
+    Прежний ProductSearchView.get_queryset: наличие через join stocks + DISTINCT.
+    """
+    queryset = search_products(Product.objects.all(), query_str)
+    queryset = queryset.filter(stocks__quantity__gt=0).distinct()
+    queryset = queryset.annotate(
+        in_user_store=Exists(Stock.objects.filter(product=OuterRef('pk'), store=store, quantity__gt=0))
+    )
+    return queryset.order_by('-in_user_store', '-rank', 'id')
+
+
+def p50_ms(fn):
+    timings = []
+    for _ in range(REPEATS):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+@pytest.mark.benchmark
+@pytest.mark.django_db
+def bench_search_scaling():
+    print(f"\n{PRODUCTS} products, query {QUERY!r}, p50 of {REPEATS} runs")
+    results = {}
+    for stores in STORES:
+        # Каждый размер — в своей точке сохранения, откатывается после замеров
+        with transaction.atomic():
+            catalog = seed_catalog(cities=max(1, stores // 100), stores_per_city=min(stores, 100),
+                                   products=PRODUCTS, users=0)
+            store = catalog.stores[0]
+            new_ids = [p.id for p in search_catalog(QUERY, store)]
+            assert sorted(new_ids) == sorted(p.id for p in legacy_search(QUERY, store))
+
+            timings = {
+                'legacy-page': p50_ms(lambda: list(legacy_search(QUERY, store)[:PAGE])),
+                'exists-page': p50_ms(lambda: list(search_catalog(QUERY, store)[:PAGE])),
+                'legacy-all': p50_ms(lambda: list(legacy_search(QUERY, store))),
+                'exists-all': p50_ms(lambda: list(search_catalog(QUERY, store))),
+            }
+            results[stores] = timings
+            print(f"stores={stores:<5} results={len(new_ids):<5} "
+                  + ' '.join(f"{name}={value:.1f}ms" for name, value in timings.items()))
+            transaction.set_rollback(True)
+
+    smallest, largest = results[min(STORES)], results[max(STORES)]
+    print(f"exists-page x{largest['exists-page'] / smallest['exists-page']:.1f}, "
+          f"legacy-page x{largest['legacy-page'] / smallest['legacy-page']:.1f} "
+          f"from {min(STORES)} to {max(STORES)} stores")
+    # Латентность Exists-запроса почти не зависит от числа магазинов
+    assert largest['exists-page'] < smallest['exists-page'] * 4
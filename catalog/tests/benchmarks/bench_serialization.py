@@ -0,0 +1,82 @@
+"""
+Сериализация и рендер ProductSerializer на 1000 товаров: обход полей DRF + json.dumps
+против скомпилированного to_representation + orjson. Ответы должны совпадать побайтно.
+
+    BENCH_SERIALIZATION_PRODUCTS=5000 pytest -m benchmark -s catalog/tests/benchmarks/bench_serialization.py
+"""
+import os
+import time
+
+import pytest
+from django.test import RequestFactory
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from catalog.models import Product
+from catalog.renderers import ORJSONRenderer
+from catalog.seeding import seed_catalog
+from catalog.serializers import ProductImageSerializer, ProductSerializer, image_url
+
+PRODUCTS = int(os.environ.get('BENCH_SERIALIZATION_PRODUCTS', 5000))
+ROUNDS = int(os.environ.get('BENCH_SERIALIZATION_ROUNDS', 5))
+
+
+class DRFImageSerializer(serializers.ModelSerializer):
+    # Сериализаторы до компиляции полей: обход полей DRF, reverse на каждое изображение
+    url = serializers.SerializerMethodField()
+    hash = serializers.CharField(source='content_hash', read_only=True)
+
+    class Meta(ProductImageSerializer.Meta):
+        pass
+
+    def get_url(self, obj):
+        return image_url(obj.content_hash, self.context.get('request'))
+
+
+class DRFProductSerializer(ProductSerializer):
+    def to_representation(self, instance):
+        return serializers.Serializer.to_representation(self, instance)
+
+    def get_images(self, obj):
+        store = self.context.get('store')
+        images = obj.store_images
+        if store:
+            city_images = [image for image in images if image.city_id == store.city_id]
+            if city_images:
+                return DRFImageSerializer(city_images, many=True, context=self.context).data
+        generic_images = [image for image in images if image.city_id is None]
+        return DRFImageSerializer(generic_images, many=True, context=self.context).data
+
+
+def best_of(call):
+    timings = []
+    for _ in range(ROUNDS):
+        started = time.perf_counter()
+        result = call()
+        timings.append(time.perf_counter() - started)
+    return min(timings), result
+
+
+@pytest.mark.benchmark
+@pytest.mark.django_db
+def bench_product_serialization():
+    catalog = seed_catalog(products=PRODUCTS)
+    store = catalog.users[0].profile.store
+    products = list(Product.objects.with_store_data(store).order_by('id'))
+    context = {'request': Request(RequestFactory().get('/api/v1/catalog/')), 'store': store}
+    per_1000 = 1000 / len(products) * 1000
+
+    drf_time, drf_data = best_of(lambda: DRFProductSerializer(products, many=True, context=context).data)
+    lean_time, lean_data = best_of(lambda: ProductSerializer(products, many=True, context=context).data)
+    json_time, json_bytes = best_of(lambda: JSONRenderer().render(lean_data))
+    orjson_time, orjson_bytes = best_of(lambda: ORJSONRenderer().render(lean_data))
+
+    print(
+        f"\n{len(products)} products, ms per 1000: "
+        f"serialize DRF {drf_time * per_1000:.1f}, compiled {lean_time * per_1000:.1f} (x{drf_time / lean_time:.1f}); "
+        f"render json {json_time * per_1000:.1f}, orjson {orjson_time * per_1000:.1f} (x{json_time / orjson_time:.1f}); "
+        f"total x{(drf_time + json_time) / (lean_time + orjson_time):.1f}"
+    )
+    assert JSONRenderer().render(drf_data) == json_bytes == orjson_bytes
+    assert lean_time < drf_time and orjson_time < json_time
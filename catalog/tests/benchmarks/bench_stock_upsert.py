@@ -0,0 +1,73 @@
+"""
+Сравнение upsert_stocks (INSERT ... ON CONFLICT пачками) с прежним путём
+через загрузку строк + bulk_update.
+
+    BENCH_STOCK_ROWS=100000 pytest -m benchmark -s catalog/tests/benchmarks/bench_stock_upsert.py
+"""
+import os
+import time
+
+import pytest
+from django.db import transaction
+
+from catalog.models import City, Product, Stock, Store
+from catalog.stocks import upsert_stocks
+
+ROWS = int(os.environ.get('BENCH_STOCK_ROWS', 20000))
+STORES = 20
+
+
+def legacy_bulk_update(validated_data):
+    """
+    Прежняя реализация bulk_update_stocks_task (без KeyError на парах не из payload):
+    загрузка Stock по product_id__in и store_id__in, затем bulk_update.
+    """
+    updates_map = {(item['product_id'], item['store_id']): item['quantity'] for item in validated_data}
+    with transaction.atomic():
+        stocks = Stock.objects.filter(
+            product_id__in={i['product_id'] for i in validated_data},
+            store_id__in={i['store_id'] for i in validated_data},
+        )
+        to_update = []
+        for s in stocks:
+            key = (s.product_id, s.store_id)
+            if key in updates_map:
+                s.quantity = updates_map[key]
+                to_update.append(s)
+        Stock.objects.bulk_update(to_update, ['quantity'], batch_size=1000)
+    return len(to_update)
+
+
+@pytest.mark.benchmark
+@pytest.mark.django_db
+def bench_stock_upsert_vs_bulk_update():
+    city = City.objects.create(name="BenchCity")
+    stores = Store.objects.bulk_create([Store(name=f"Bench {i}", city=city) for i in range(STORES)])
+    products = Product.objects.bulk_create([Product(name=f"Bench {i}") for i in range(ROWS // STORES)])
+    Stock.objects.bulk_create(
+        [Stock(product=p, store=s, quantity=1) for p in products for s in stores],
+        batch_size=5000,
+    )
+    payload = [
+        {'product_id': p.id, 'store_id': s.id, 'quantity': 2 + (p.id + s.id) % 7}
+        for p in products for s in stores
+    ]
+
+    started = time.perf_counter()
+    legacy_rows = legacy_bulk_update(payload)
+    legacy_time = time.perf_counter() - started
+
+    # Возвращаем исходные значения, чтобы upsert обновлял столько же строк
+    Stock.objects.update(quantity=1)
+
+    started = time.perf_counter()
+    result = upsert_stocks(payload)
+    upsert_time = time.perf_counter() - started
+
+    print(
+        f"\n{len(payload)} rows: bulk_update {legacy_time:.2f}s ({len(payload) / legacy_time:,.0f} rows/s), "
+        f"upsert {upsert_time:.2f}s ({len(payload) / upsert_time:,.0f} rows/s), "
+        f"speedup x{legacy_time / upsert_time:.1f}"
+    )
+    assert legacy_rows == len(payload)
+    assert result['updated'] + result['unchanged'] == len(payload)
@@ -0,0 +1,45 @@
+"""
+Сравнение быстрого валидатора фида остатков со StockUpdateSerializer(many=True).
+
+    BENCH_VALIDATION_ROWS=100000 pytest -m benchmark -s catalog/tests/benchmarks/bench_stock_validation.py
+"""
+import os
+import time
+
+import pytest
+
+from catalog.serializers import StockUpdateSerializer
+from catalog.validators import validate_stock_columns, validate_stock_rows
+
+ROWS = int(os.environ.get('BENCH_VALIDATION_ROWS', 100000))
+
+
+@pytest.mark.benchmark
+def bench_stock_validation_vs_serializer():
+    payload = [{'product_id': i, 'store_id': i % 50, 'quantity': i % 100} for i in range(ROWS)]
+    columns = {
+        'product_id': [item['product_id'] for item in payload],
+        'store_id': [item['store_id'] for item in payload],
+        'quantity': [item['quantity'] for item in payload],
+    }
+
+    started = time.perf_counter()
+    serializer = StockUpdateSerializer(data=payload, many=True)
+    assert serializer.is_valid()
+    serializer_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    rows = validate_stock_rows(payload)
+    rows_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    column_rows = validate_stock_columns(columns)
+    columns_time = time.perf_counter() - started
+
+    print(
+        f"\n{ROWS} rows: serializer {serializer_time * 1000:.0f}ms, "
+        f"validate_stock_rows {rows_time * 1000:.0f}ms (x{serializer_time / rows_time:.0f}), "
+        f"validate_stock_columns {columns_time * 1000:.0f}ms (x{serializer_time / columns_time:.0f})"
+    )
+    assert rows == column_rows
+    assert len(rows) == ROWS
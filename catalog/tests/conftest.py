@@ -0,0 +1,34 @@
+import pytest
+from django.core.cache import cache
+
+from catalog.metrics import reset_buffer
+from catalog.reference import reset_reference
+from testProject.celery import app as celery_app
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    """
+    Redis общий для всех тестов: чистим кэш и счётчики, чтобы тесты не влияли друг на друга.
+    Справочники и несброшенные метрики в памяти процесса — тоже.
+    """
+    cache.clear()
+    reset_reference()
+    reset_buffer()
+    yield
+    cache.clear()
+    reset_reference()
+    reset_buffer()
+
+
+@pytest.fixture(autouse=True)
+def celery_eager():
+    """
+    Задачи Celery выполняются синхронно; брокер — в памяти (без RabbitMQ).
+    """
+    celery_app.conf.broker_url = 'memory://'
+    celery_app.conf.task_always_eager = True
+    celery_app.conf.task_eager_propagates = True
+    yield
+    celery_app.conf.task_always_eager = False
+    celery_app.conf.task_eager_propagates = False
@@ -0,0 +1,141 @@
+import asyncio
+from unittest import mock
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import AsyncClient
+from django.urls import resolve
+from rest_framework.test import APIClient
+
+from catalog import async_redis
+from catalog.async_views import AsyncReadView
+from catalog.models import City, Store, Product, Stock, Price, UserProfile, ProductImage
+from catalog.views import CatalogListView, ProductDetailView, ProductSearchView
+
+
+@pytest.fixture
+def catalog_user(db):
+    user = User.objects.create_user(username='async', password='asyncpass')
+    city = City.objects.create(name="AsyncCity")
+    store = Store.objects.create(name="AsyncStore", city=city)
+    UserProfile.objects.create(user=user, store=store)
+    products = []
+    for i in range(5):
+        product = Product.objects.create(name=f"Async laptop {i}", description="Fast")
+        Price.objects.create(product=product, store=store, amount=100 + i)
+        Stock.objects.create(product=product, store=store, quantity=i + 1)
+        ProductImage.objects.create(product=product, image_data='aGVsbG8=')
+        products.append(product)
+
+    client = APIClient()
+    token_resp = client.post('/api/v1/token/', {'username': 'async', 'password': 'asyncpass'}, format='json')
+    return products, token_resp.data['access']
+
+
+def test_read_endpoints_are_async():
+    for url in ('/api/v1/catalog/', '/api/v1/search/', '/api/v1/product/1/', '/api/v1/products/'):
+        assert asyncio.iscoroutinefunction(resolve(url).func)
+
+
+@pytest.mark.django_db
+def test_async_views_match_drf_views(catalog_user):
+    """
+    Быстрый путь не вызывает DRF view и отдаёт те же байты, что DRF view на том же запросе.
+    """
+    products, token = catalog_user
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION='Bearer ' + token)
+
+    for url in ('/api/v1/catalog/', '/api/v1/catalog/?limit=2', '/api/v1/search/?q=laptop&limit=2'):
+        with mock.patch.object(CatalogListView, 'list', side_effect=AssertionError), \
+                mock.patch.object(ProductSearchView, 'list', side_effect=AssertionError):
+            fast = client.get(url)
+        cache.clear()
+        with mock.patch.object(AsyncReadView, 'accepts_json', return_value=False):
+            drf = client.get(url)
+        cache.clear()
+        assert fast.status_code == drf.status_code == 200
+        assert fast['Content-Type'] == drf['Content-Type']
+        assert fast.content == drf.content, url
+
+    detail_url = f'/api/v1/product/{products[0].pk}/'
+    with mock.patch.object(ProductDetailView, 'retrieve', side_effect=AssertionError):
+        fast = client.get(detail_url).json()
+    with mock.patch.object(AsyncReadView, 'accepts_json', return_value=False):
+        drf = client.get(detail_url).json()
+    # каждый запрос засчитывает просмотр
+    assert drf.pop('view_count') == fast.pop('view_count') + 1
+    assert fast == drf
+
+
+@pytest.mark.django_db
+def test_async_views_fall_back_to_drf(catalog_user):
+    products, token = catalog_user
+    client = APIClient()
+
+    resp = client.get('/api/v1/catalog/')
+    assert resp.status_code == 401
+    assert resp.json() == {'detail': 'Authentication credentials were not provided.'}
+
+    # Ошибки быстрого пути отдаются сразу, без повтора запроса через DRF view, в том же виде
+    client.credentials(HTTP_AUTHORIZATION='Bearer broken')
+    with mock.patch.object(ProductSearchView, 'list', side_effect=AssertionError):
+        fast = client.get('/api/v1/search/?q=laptop')
+    with mock.patch.object(AsyncReadView, 'accepts_json', return_value=False):
+        drf = client.get('/api/v1/search/?q=laptop')
+    assert fast.json()['code'] == 'token_not_valid'
+    assert fast.status_code == drf.status_code == 401 and fast.content == drf.content
+    assert fast['WWW-Authenticate'] == drf['WWW-Authenticate']
+    assert fast['Vary'] == drf['Vary'] and fast['Allow'] == drf['Allow']
+
+    client.credentials(HTTP_AUTHORIZATION='Bearer ' + token)
+    for url, view in [('/api/v1/product/999999/', ProductDetailView),
+                      ('/api/v1/catalog/?cursor=broken', CatalogListView)]:
+        with mock.patch.object(view, 'get', side_effect=AssertionError):
+            fast = client.get(url)
+        with mock.patch.object(AsyncReadView, 'accepts_json', return_value=False):
+            drf = client.get(url)
+        assert fast.status_code == drf.status_code == 404 and fast.content == drf.content, url
+    assert client.post('/api/v1/catalog/').status_code == 405
+
+    streamed = client.get('/api/v1/search/?q=laptop&stream=1')
+    assert streamed.streaming
+    assert len(b''.join(streamed.streaming_content)) > 2
+
+
+@pytest.mark.django_db(transaction=True, databases='__all__')
+def test_async_views_under_asgi_handler(catalog_user):
+    # ASGIHandler выполняет SQL в своём потоке (отдельное подключение): данные должны быть закоммичены
+    products, token = catalog_user
+    client = AsyncClient()
+
+    @async_to_sync
+    async def get(url):
+        return await client.get(url, headers={'Authorization': 'Bearer ' + token})
+
+    resp = get('/api/v1/catalog/?limit=2')
+    assert resp.status_code == 200
+    assert resp['X-Cache'] == 'MISS'
+    assert len(resp.json()['results']) == 2
+    assert get('/api/v1/catalog/?limit=2')['X-Cache'] == 'HIT'
+
+    resp = get(f'/api/v1/product/{products[1].pk}/')
+    assert resp.json()['view_count'] == 1
+    assert resp.json()['images'][0]['url'].startswith('http://testserver/api/v1/images/')
+
+
+@pytest.mark.parametrize('run', [lambda use: asyncio.run(use()), lambda use: async_to_sync(use)()])
+def test_async_redis_client_closed_with_its_loop(run):
+    async def use():
+        client = async_redis.get_async_redis()
+        assert client is async_redis.get_async_redis()
+        await client.ping()
+        return client
+
+    client = run(use)
+    # Loop закрыт — его клиент закрыт и забыт
+    pool = client.connection_pool
+    assert pool._available_connections and not any(c.is_connected for c in pool._available_connections)
+    assert client not in async_redis._clients.values()
@@ -0,0 +1,75 @@
+import pytest
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from catalog.async_views import authenticate
+from catalog.authentication import CatalogTokenUser
+from catalog.models import City, Store, Product, Stock, Price, UserProfile
+
+
+def obtain(client, username, password):
+    resp = client.post('/api/v1/token/', {'username': username, 'password': password}, format='json')
+    assert resp.status_code == 200
+    return resp.data
+
+
+def catalog_names(token):
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION='Bearer ' + token)
+    with CaptureQueriesContext(connection) as queries:
+        resp = client.get('/api/v1/catalog/')
+    assert resp.status_code == 200
+    tables = {table for query in queries.captured_queries
+              for table in ('auth_user', 'catalog_userprofile', 'catalog_store', 'catalog_city')
+              if f'"{table}"' in query['sql']}
+    return [item['name'] for item in resp.json()], tables
+
+
+@pytest.mark.django_db
+def test_store_claims_skip_user_and_profile_queries():
+    user = User.objects.create_user(username='claims', password='claimspass')
+    city = City.objects.create(name="ClaimsCity")
+    store = Store.objects.create(name="ClaimsStore", city=city)
+    other_store = Store.objects.create(name="OtherStore", city=city)
+    profile = UserProfile.objects.create(user=user, store=store)
+    for target, name in ((store, "First product"), (other_store, "Second product")):
+        product = Product.objects.create(name=name, description="Test")
+        Price.objects.create(product=product, store=target, amount=10)
+        Stock.objects.create(product=product, store=target, quantity=1)
+
+    client = APIClient()
+    tokens = obtain(client, 'claims', 'claimspass')
+    claims = AccessToken(tokens['access'])
+    assert (claims['store_id'], claims['city_id']) == (store.pk, city.pk)
+
+    # Пользователь и магазин — из claims и справочника процесса
+    assert catalog_names(tokens['access']) == (["First product"], set())
+    token_user = async_to_sync(authenticate)(
+        RequestFactory().get('/', HTTP_AUTHORIZATION='Bearer ' + tokens['access'])
+    )
+    assert isinstance(token_user, CatalogTokenUser)
+    assert token_user.store_id == store.pk
+
+    # Смена магазина: старый токен проверяется по БД и видит новый магазин
+    profile.store = other_store
+    profile.save()
+    names, tables = catalog_names(tokens['access'])
+    assert names == ["Second product"]
+    assert 'auth_user' in tables
+
+    # refresh выдаёт токен с новым магазином
+    resp = client.post('/api/v1/token/refresh/', {'refresh': tokens['refresh']}, format='json')
+    assert resp.status_code == 200
+    assert AccessToken(resp.data['access'])['store_id'] == other_store.pk
+    assert catalog_names(resp.data['access']) == (["Second product"], set())
+
+    # Деактивированный пользователь не проходит аутентификацию по ранее выданным токенам
+    user.is_active = False
+    user.save()
+    client.credentials(HTTP_AUTHORIZATION='Bearer ' + resp.data['access'])
+    assert client.get('/api/v1/catalog/').status_code == 401
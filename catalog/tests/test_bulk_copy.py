@@ -0,0 +1,161 @@
+from io import StringIO
+
+import pytest
+from django.core.management import CommandError, call_command
+
+from catalog.bulk_copy import ENTITIES
+from catalog.models import City, Store, Product, Stock, Price, ProductImage, StoreCatalogEntry
+from catalog.projection import rebuild_catalog_entries
+
+
+def export_all(directory, fmt):
+    files = {}
+    for entity in ENTITIES:
+        path = directory / f'{entity}.{fmt}'
+        call_command('catalog_export', entity, str(path), stdout=StringIO())
+        files[entity] = path
+    return files
+
+
+def import_all(files):
+    results = {}
+    for entity, path in files.items():
+        out = StringIO()
+        call_command('catalog_import', entity, str(path), stdout=out)
+        results[entity] = out.getvalue()
+    return results
+
+
+@pytest.fixture
+def catalog(db):
+    city = City.objects.create(name="CopyCity")
+    other_city = City.objects.create(name="Copy, \"quoted\" city")
+    store = Store.objects.create(name="CopyStore", city=city)
+    other_store = Store.objects.create(name="CopyStore", city=other_city)
+    products = [
+        Product.objects.create(name="Copy product 0", description=None),
+        Product.objects.create(name="Copy product 1", description=""),
+        Product.objects.create(name="Copy, \"product\"\n2", description="Line 1\nLine 2\\n"),
+    ]
+    for i, product in enumerate(products):
+        Stock.objects.create(product=product, store=store, quantity=i)
+        Stock.objects.create(product=product, store=other_store, quantity=10 + i)
+        Price.objects.create(product=product, store=store, amount=f"{i}.50")
+        ProductImage.objects.create(product=product, image_data="Z2VuZXJpYw==")
+    ProductImage.objects.create(product=products[1], city=other_city, image_data="iVBORw0KGgo=")
+    return products
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('fmt', ['csv', 'ndjson'])
+def test_export_import_round_trip(catalog, tmp_path, fmt):
+    (tmp_path / 'original').mkdir()
+    original = export_all(tmp_path / 'original', fmt)
+    exported = {entity: path.read_bytes() for entity, path in original.items()}
+    assert exported['stocks'].count(b'\n') == 6 + (fmt == 'csv')
+
+    City.objects.all().delete()
+    Product.objects.all().delete()
+    assert not StoreCatalogEntry.objects.exists()
+
+    results = import_all(original)
+    assert "6 rows read, 6 written, 0 skipped" in results['stocks']
+    assert "4 rows read, 4 written, 0 skipped" in results['images']
+
+    (tmp_path / 'again').mkdir()
+    again = export_all(tmp_path / 'again', fmt)
+    assert {entity: path.read_bytes() for entity, path in again.items()} == exported
+    assert list(Product.objects.order_by('id').values_list('id', flat=True)) == [p.id for p in catalog]
+    # Проекция пересчитана по загруженным строкам
+    assert StoreCatalogEntry.objects.count() == 6
+    assert rebuild_catalog_entries() == {'written': 0, 'removed': 0}
+
+    # Повторная загрузка ничего не переписывает
+    for entity, output in import_all(original).items():
+        assert " 0 written" in output, entity
+    # Последовательность id сдвинута за загруженные товары
+    assert Product.objects.create(name="After import").id > catalog[-1].id
+
+
+@pytest.mark.django_db
+def test_import_resolves_natural_keys(catalog, tmp_path):
+    product = catalog[0]
+    path = tmp_path / 'stocks.csv'
+    path.write_text(
+        "store,city,quantity,product_id\n"
+        f"CopyStore,CopyCity,5,{product.id}\n"
+        f"CopyStore,CopyCity,7,{product.id}\n"  # повтор ключа: побеждает последняя строка
+        f"Unknown,CopyCity,1,{product.id}\n"
+        f"CopyStore,Unknown,1,{product.id}\n"
+        "CopyStore,CopyCity,1,999999\n"
+    )
+    out = StringIO()
+    call_command('catalog_import', 'stocks', str(path), stdout=out)
+    assert "5 rows read, 1 written, 4 skipped" in out.getvalue()
+    store = Store.objects.get(city__name="CopyCity")
+    assert Stock.objects.get(product=product, store=store).quantity == 7
+    assert StoreCatalogEntry.objects.get(product=product, store=store).quantity == 7
+
+    path.write_text("product_id,store,quantity\n1,CopyStore,1\n")
+    with pytest.raises(CommandError, match="Invalid CSV header"):
+        call_command('catalog_import', 'stocks', str(path))
+
+
+@pytest.mark.django_db
+def test_import_skips_malformed_values(catalog, tmp_path):
+    product = catalog[0]
+    store = Store.objects.get(city__name="CopyCity")
+    path = tmp_path / 'stocks.csv'
+    path.write_text(
+        "product_id,city,store,quantity\n"
+        f"{product.id},CopyCity,CopyStore,many\n"
+        f"{product.id},CopyCity,CopyStore,-1\n"
+        f"{product.id},CopyCity,CopyStore,99999999999\n"
+        f"x{product.id},CopyCity,CopyStore,3\n"
+        f"{product.id}1234567890123456789012,CopyCity,CopyStore,3\n"
+        f"{catalog[1].id},CopyCity,CopyStore, 42 \n"
+    )
+    out = StringIO()
+    call_command('catalog_import', 'stocks', str(path), stdout=out)
+    # Некорректные строки пропущены, корректная загружена той же загрузкой
+    assert "6 rows read, 1 written, 5 skipped" in out.getvalue()
+    assert Stock.objects.get(product=product, store=store).quantity == 0
+    assert Stock.objects.get(product=catalog[1], store=store).quantity == 42
+
+    path = tmp_path / 'prices.ndjson'
+    path.write_text(
+        f'{{"product_id": "{product.id}", "city": "CopyCity", "store": "CopyStore", "amount": "1e5"}}\n'
+        f'{{"product_id": "{product.id}", "city": "CopyCity", "store": "CopyStore", "amount": "100000000"}}\n'
+        f'{{"product_id": "{product.id}", "city": "CopyCity", "store": "CopyStore", "amount": "12.345"}}\n'
+    )
+    out = StringIO()
+    call_command('catalog_import', 'prices', str(path), '--format', 'ndjson', stdout=out)
+    assert "3 rows read, 1 written, 2 skipped" in out.getvalue()
+    assert str(Price.objects.get(product=product, store=store).amount) == '12.35'
+
+    path = tmp_path / 'images.csv'
+    path.write_text(f"product_id,content\n{product.id},not base64!\n{product.id},Z2Vu\n{product.id},Z2VuZ\n")
+    out = StringIO()
+    call_command('catalog_import', 'images', str(path), stdout=out)
+    assert "3 rows read, 1 written, 2 skipped" in out.getvalue()
+
+
+@pytest.mark.django_db
+def test_ndjson_import_skips_malformed_lines(catalog, tmp_path):
+    product = catalog[0]
+    store = Store.objects.get(city__name="CopyCity")
+    path = tmp_path / 'stocks.ndjson'
+    path.write_text(
+        f'{{"product_id": {product.id}, "city": "CopyCity", "store": "CopyStore", "quantity": 7}}\n'
+        '{"product_id": 1, "city": \n'
+        '[1, 2]\n'
+        '"x"\n'
+        '\n'
+        f'{{"product_id": {catalog[1].id}, "city": "CopyCity", "store": "CopyStore", "quantity": 8}}\n'
+    )
+    out = StringIO()
+    call_command('catalog_import', 'stocks', str(path), '--format', 'ndjson', stdout=out)
+    # Некорректный JSON и строки-не объекты пропущены, пустая строка не считается
+    assert "5 rows read, 2 written, 3 skipped" in out.getvalue()
+    assert Stock.objects.get(product=product, store=store).quantity == 7
+    assert Stock.objects.get(product=catalog[1], store=store).quantity == 8
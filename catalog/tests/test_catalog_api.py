@@ -1,8 +1,23 @@
+import base64
+import hashlib
+import io
+import json
+from unittest import mock
 import pytest
 from django.contrib.auth.models import User
+from rest_framework.exceptions import ValidationError
 from rest_framework.test import APIClient
+from catalog import stock_jobs, view_counter
 from catalog.models import City, Store, Product, Stock, Price, UserProfile, ProductImage
+from catalog.response_cache import cache_stats
+from catalog.search import search_catalog, search_products, trigram_available
+from catalog.serializers import StockUpdateSerializer
+from catalog.tasks import bulk_update_stocks_task, flush_view_counts_task
+from catalog.validators import validate_stock_rows
 from django.urls import reverse
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
 
 @pytest.mark.django_db
@@ -63,11 +78,57 @@ def test_product_detail_view_count():
     assert resp.status_code == 200
     data = resp.json()
 
-    # Проверяем, что в ответе вернулся view_count=1
-    # (т.к. в коде после get_object() мы инкрементируем)
-    updated_product = Product.objects.get(pk=product.pk)
-    assert updated_product.view_count == 1
+    # В ответе view_count=1 сразу, хотя в БД просмотр ещё не записан:
+    # он копится в Redis до flush_view_counts_task
     assert data['view_count'] == 1
+    assert Product.objects.get(pk=product.pk).view_count == 0
+
+    # Повторные просмотры тоже учитываются в ответе
+    resp = client.get(detail_url)
+    assert resp.json()['view_count'] == 2
+
+    # После flush просмотры переносятся в БД, ответ не меняется
+    assert flush_view_counts_task() == 1
+    updated_product = Product.objects.get(pk=product.pk)
+    assert updated_product.view_count == 2
+    resp = client.get(detail_url)
+    assert resp.json()['view_count'] == 3
+    assert flush_view_counts_task() == 1
+    assert Product.objects.get(pk=product.pk).view_count == 3
+    assert flush_view_counts_task() == 0
+
+
+@pytest.mark.django_db
+def test_view_count_flush_is_idempotent():
+    """
+    Повтор переноса просмотров (падение после коммита до очистки Redis) не прибавляет
+    их второй раз, а уже перенесённые просмотры не прибавляются к ответу поверх БД.
+    """
+    product = Product.objects.create(name="Viewed", description="Desc")
+    redis = view_counter._redis()
+    view_counter.record_views([product.pk])
+    view_counter.record_views([product.pk])
+
+    # Падение после коммита: дельты остались в Redis под применённым id
+    with mock.patch.object(view_counter, '_FORGET', "return 0"):
+        assert view_counter.flush_view_counts() == 1
+    assert Product.objects.get(pk=product.pk).view_count == 2
+    assert view_counter.pending_views([product.pk]) == {product.pk: 0}
+    assert view_counter.record_view(product.pk) == 1
+
+    # Следующий запуск удаляет их, не прибавляя, и переносит новый просмотр
+    assert view_counter.flush_view_counts() == 1
+    assert Product.objects.get(pk=product.pk).view_count == 3
+    assert not redis.exists(view_counter.FLUSHED_KEY, view_counter.FLUSH_ID_KEY)
+
+    # Исход коммита неизвестен: дельты возвращены в FLUSHING_KEY с тем же id
+    view_counter.record_view(product.pk)
+    with mock.patch.object(view_counter, '_FORGET', "return 0"):
+        view_counter.flush_view_counts()
+    redis.rename(view_counter.FLUSHED_KEY, view_counter.FLUSHING_KEY)
+    assert view_counter.flush_view_counts() == 0
+    assert Product.objects.get(pk=product.pk).view_count == 4
+    assert view_counter.pending_views([product.pk]) == {product.pk: 0}
 
 
 @pytest.mark.django_db
@@ -151,8 +212,9 @@ def test_stock_update_view():
         {"product_id": product.id, "store_id": store2.id, "quantity": 555},
     ]
     resp = client.post('/api/v1/catalog/update/stocks', update_data, format='json')
-    assert resp.status_code == 200
-    assert resp.json()["detail"] == "Stocks updated"
+    assert resp.status_code == 202
+    assert resp.json()["detail"] == "Stocks update task queued"
+    task_id = resp.json()["task_id"]
 
     # Проверяем, что значения обновились
     stock1.refresh_from_db()
@@ -160,6 +222,96 @@ def test_stock_update_view():
     assert stock1.quantity == 999
     assert stock2.quantity == 555
 
+    # Статус задания по task_id
+    resp = client.get(f'/api/v1/catalog/update/stocks/{task_id}')
+    assert resp.status_code == 200
+    job = resp.json()
+    assert job["state"] == "SUCCESS"
+    assert job["chunks_total"] == job["chunks_done"] == 1
+    assert job["totals"]["updated"] == 2
+
+    resp = client.get('/api/v1/catalog/update/stocks/unknown-task')
+    assert resp.status_code == 404
+
+
+@pytest.mark.django_db
+def test_stock_update_chunks_and_idempotency(settings):
+    """
+    Большой фид делится на пачки по магазинам; повтор с тем же Idempotency-Key
+    не применяется второй раз.
+    """
+    settings.STOCK_UPDATE_CHUNK_SIZE = 2
+    user = User.objects.create_user(username='feeder', password='feederpass')
+    city = City.objects.create(name="CityFeed")
+    stores = [Store.objects.create(name=f"Feed {i}", city=city) for i in range(2)]
+    products = [Product.objects.create(name=f"Feed product {i}") for i in range(3)]
+
+    client = APIClient()
+    token_resp = client.post('/api/v1/token/', {'username': 'feeder', 'password': 'feederpass'}, format='json')
+    access_token = token_resp.data['access']
+    client.credentials(HTTP_AUTHORIZATION='Bearer ' + access_token)
+
+    update_data = [
+        {"product_id": p.id, "store_id": s.id, "quantity": 7}
+        for p in products for s in stores
+    ]
+    resp = client.post('/api/v1/catalog/update/stocks', update_data, format='json', HTTP_IDEMPOTENCY_KEY='feed-1')
+    assert resp.status_code == 202
+    task_id = resp.json()["task_id"]
+    assert resp.json()["chunks"] == 3
+
+    job = client.get(f'/api/v1/catalog/update/stocks/{task_id}').json()
+    assert job["state"] == "SUCCESS"
+    assert job["totals"]["inserted"] == 6
+    # строки отсортированы по магазину: магазин занимает соседние пачки
+    assert [chunk["store_ids"] for chunk in job["chunks"]] == [
+        [stores[0].id], [stores[0].id, stores[1].id], [stores[1].id]
+    ]
+
+    # Повтор с тем же ключом не применяется, даже если данные изменились
+    Stock.objects.update(quantity=1)
+    resp = client.post('/api/v1/catalog/update/stocks', update_data, format='json', HTTP_IDEMPOTENCY_KEY='feed-1')
+    assert resp.status_code == 200
+    assert resp.json()["task_id"] == task_id
+    assert set(Stock.objects.values_list('quantity', flat=True)) == {1}
+
+
+@pytest.mark.django_db
+def test_idempotency_key_scoped_per_user_and_claimed_by_existing_job(settings):
+    """
+    Ключ идемпотентности свой у каждого пользователя и занимается уже созданным заданием.
+    """
+    city = City.objects.create(name="CityKeys")
+    store = Store.objects.create(name="Keys", city=city)
+    product = Product.objects.create(name="Key product")
+    update_data = [{"product_id": product.id, "store_id": store.id, "quantity": 3}]
+
+    clients = []
+    for username in ('keys-a', 'keys-b'):
+        User.objects.create_user(username=username, password='keyspass')
+        client = APIClient()
+        token_resp = client.post('/api/v1/token/', {'username': username, 'password': 'keyspass'}, format='json')
+        client.credentials(HTTP_AUTHORIZATION='Bearer ' + token_resp.data['access'])
+        clients.append(client)
+
+    claim = stock_jobs.claim_idempotency_key
+
+    def claim_existing_job(user_id, key, job_id):
+        # Ключ указывает только на задание, статус которого уже можно прочитать
+        assert stock_jobs.get_job(job_id, User.objects.get(pk=user_id)) is not None
+        return claim(user_id, key, job_id)
+
+    with mock.patch.object(stock_jobs, 'claim_idempotency_key', side_effect=claim_existing_job):
+        first = clients[0].post('/api/v1/catalog/update/stocks', update_data, format='json',
+                                HTTP_IDEMPOTENCY_KEY='shared')
+        other = clients[1].post('/api/v1/catalog/update/stocks', update_data, format='json',
+                                HTTP_IDEMPOTENCY_KEY='shared')
+        retry = clients[0].post('/api/v1/catalog/update/stocks', update_data, format='json',
+                                HTTP_IDEMPOTENCY_KEY='shared')
+    assert first.status_code == other.status_code == 202
+    assert other.json()["task_id"] != first.json()["task_id"]
+    assert retry.status_code == 200 and retry.json()["task_id"] == first.json()["task_id"]
+
 
 @pytest.mark.django_db
 def test_city_specific_images():
@@ -177,13 +329,13 @@ def test_city_specific_images():
 
     product = Product.objects.create(name="PhotoProduct", description="Check images")
     # city-specific фото
-    ProductImage.objects.create(product=product, city=city1, image_data="base64_city1")
+    city_image = ProductImage.objects.create(product=product, city=city1, image_data="base64_city1")
     # общее фото
     ProductImage.objects.create(product=product, city=None, image_data="base64_generic")
 
     # Добавим второй товар с только generic фото
     product2 = Product.objects.create(name="NoCityPhoto", description="Only generic images")
-    ProductImage.objects.create(product=product2, city=None, image_data="base64_generic_2")
+    generic_image_2 = ProductImage.objects.create(product=product2, city=None, image_data="base64_generic_2")
 
     # Пропишем какую-нибудь цену/остаток, чтобы товар был виден в каталоге
     Price.objects.create(product=product, store=store, amount=100)
@@ -210,8 +362,476 @@ def test_city_specific_images():
 
     # Для p1_data должно отдаваться city-specific фото (т.к. user.store.city = city1)
     assert len(p1_data['images']) == 1
-    assert p1_data['images'][0]['image_data'] == "base64_city1"
+    assert p1_data['images'][0]['id'] == city_image.id
+    assert p1_data['images'][0]['hash'] == city_image.content_hash
+    assert p1_data['images'][0]['url'] == f"http://testserver/api/v1/images/{city_image.content_hash}"
 
     # Для p2_data нет city-specific фото, должны вернуться все generic (1 шт.)
     assert len(p2_data['images']) == 1
-    assert p2_data['images'][0]['image_data'] == "base64_generic_2"
+    assert p2_data['images'][0]['id'] == generic_image_2.id
+
+
+@pytest.mark.django_db
+def test_catalog_query_count_is_constant():
+    """
+    Количество SQL-запросов к /api/v1/catalog/ не должно зависеть
+    от числа товаров в выдаче (нет N+1 в ProductSerializer).
+    """
+    user = User.objects.create_user(username='bob', password='bobpass')
+    city = City.objects.create(name="CityQueries")
+    other_city = City.objects.create(name="OtherCityQueries")
+    store = Store.objects.create(name="StoreQueries", city=city)
+    UserProfile.objects.create(user=user, store=store)
+
+    def create_products(count):
+        for i in range(count):
+            product = Product.objects.create(name=f"Product {i}", description="Desc")
+            Price.objects.create(product=product, store=store, amount=10 + i)
+            Stock.objects.create(product=product, store=store, quantity=1 + i)
+            ProductImage.objects.create(product=product, city=city, image_data=f"city_{i}")
+            ProductImage.objects.create(product=product, city=other_city, image_data=f"other_{i}")
+            ProductImage.objects.create(product=product, city=None, image_data=f"generic_{i}")
+
+    client = APIClient()
+    token_resp = client.post('/api/v1/token/', {'username': 'bob', 'password': 'bobpass'}, format='json')
+    access_token = token_resp.data['access']
+    client.credentials(HTTP_AUTHORIZATION='Bearer ' + access_token)
+
+    # Первый запрос прогревает кэш профиля пользователя, дальше сравниваем сборку страниц
+    client.get('/api/v1/catalog/')
+
+    create_products(2)
+    with CaptureQueriesContext(connection) as small:
+        resp = client.get('/api/v1/catalog/')
+    assert resp.status_code == 200
+    assert resp['X-Cache'] == 'MISS'
+    assert len(resp.json()) == 2
+
+    create_products(20)
+    with CaptureQueriesContext(connection) as large:
+        resp = client.get('/api/v1/catalog/')
+    assert resp.status_code == 200
+    assert resp['X-Cache'] == 'MISS'
+    data = resp.json()
+    assert len(data) == 22
+
+    assert len(large) == len(small)
+    # city-specific изображение выбирается без дополнительных запросов
+    assert all(len(item['images']) == 1 for item in data)
+    city_hashes = set(ProductImage.objects.filter(city=city).values_list('content_hash', flat=True))
+    assert all(item['images'][0]['hash'] in city_hashes for item in data)
+
+
+@pytest.mark.django_db
+def test_catalog_keyset_pagination_and_streaming():
+    """
+    ?limit= включает keyset-пагинацию по id: страницы не пересекаются и покрывают весь каталог.
+    ?stream=1 отдаёт тот же список потоком.
+    """
+    user = User.objects.create_user(username='pager', password='pagerpass')
+    city = City.objects.create(name="CityPages")
+    store = Store.objects.create(name="StorePages", city=city)
+    UserProfile.objects.create(user=user, store=store)
+
+    product_ids = []
+    for i in range(7):
+        product = Product.objects.create(name=f"Paged {i}", description="Desc")
+        Price.objects.create(product=product, store=store, amount=1 + i)
+        Stock.objects.create(product=product, store=store, quantity=1 + i)
+        product_ids.append(product.id)
+
+    client = APIClient()
+    token_resp = client.post('/api/v1/token/', {'username': 'pager', 'password': 'pagerpass'}, format='json')
+    access_token = token_resp.data['access']
+    client.credentials(HTTP_AUTHORIZATION='Bearer ' + access_token)
+
+    seen = []
+    url = '/api/v1/catalog/?limit=3'
+    while url:
+        resp = client.get(url)
+        assert resp.status_code == 200
+        page = resp.json()
+        assert len(page['results']) <= 3
+        seen.extend(item['id'] for item in page['results'])
+        url = page['next']
+    assert seen == product_ids
+
+    resp = client.get('/api/v1/catalog/?cursor=not-a-cursor')
+    assert resp.status_code == 404
+    # Подделанный курсор: позиция не того типа — тоже 404, а не 500
+    for raw in (b'["abc"]', b'[{"a":1}]', b'[[1]]', b'[Infinity]', b'[NaN]'):
+        cursor = base64.urlsafe_b64encode(raw).decode('ascii')
+        resp = client.get(f'/api/v1/catalog/?cursor={cursor}')
+        assert resp.status_code == 404, raw
+
+    resp = client.get('/api/v1/catalog/?stream=1')
+    assert resp.status_code == 200
+    assert resp.streaming
+    streamed = json.loads(b''.join(resp.streaming_content))
+    assert streamed == client.get('/api/v1/catalog/').json()
+
+
+@pytest.mark.django_db
+def test_search_keyset_pagination():
+    """
+    Keyset-пагинация поиска по (in_user_store, rank, proximity, id): товары из store пользователя идут первыми,
+    порядок между страницами сохраняется.
+    """
+    user = User.objects.create_user(username='seeker', password='seekerpass')
+    city = City.objects.create(name="CitySeek")
+    store = Store.objects.create(name="StoreSeek", city=city)
+    another_store = Store.objects.create(name="AnotherSeek", city=city)
+    UserProfile.objects.create(user=user, store=store)
+
+    local_ids, remote_ids = [], []
+    for i in range(3):
+        product = Product.objects.create(name=f"Phone local {i}", description="Phone")
+        Stock.objects.create(product=product, store=store, quantity=1)
+        Stock.objects.create(product=product, store=another_store, quantity=1)
+        local_ids.append(product.id)
+    for i in range(3):
+        product = Product.objects.create(name=f"Phone remote {i}", description="Phone")
+        Stock.objects.create(product=product, store=another_store, quantity=1)
+        remote_ids.append(product.id)
+
+    client = APIClient()
+    token_resp = client.post('/api/v1/token/', {'username': 'seeker', 'password': 'seekerpass'}, format='json')
+    access_token = token_resp.data['access']
+    client.credentials(HTTP_AUTHORIZATION='Bearer ' + access_token)
+
+    seen = []
+    url = '/api/v1/search/?q=Phone&limit=2'
+    while url:
+        resp = client.get(url)
+        assert resp.status_code == 200
+        page = resp.json()
+        seen.extend(item['id'] for item in page['results'])
+        url = page['next']
+
+    assert len(seen) == len(set(seen)) == 6
+    assert set(seen[:3]) == set(local_ids)
+    assert set(seen[3:]) == set(remote_ids)
+    assert seen == [item['id'] for item in client.get('/api/v1/search/?q=Phone').json()]
+
+
+@pytest.mark.django_db
+def test_search_catalog_uses_semi_joins():
+    """
+    Наличие проверяется через Exists: товар в наличии в нескольких магазинах попадает в выдачу
+    один раз без DISTINCT, товары без остатков не попадают; при равной релевантности
+    выше товар, где слова запроса стоят рядом.
+    """
+    city = City.objects.create(name="CitySemi")
+    stores = [Store.objects.create(name=f"StoreSemi {i}", city=city) for i in range(3)]
+    spread = Product.objects.create(name="Gaming desk for laptop", description="Desk")
+    close = Product.objects.create(name="Gaming laptop", description="Laptop")
+    sold_out = Product.objects.create(name="Gaming laptop sold out", description="Laptop")
+    for store in stores:
+        Stock.objects.create(product=spread, store=store, quantity=1)
+        Stock.objects.create(product=sold_out, store=store, quantity=0)
+    Stock.objects.create(product=close, store=stores[1], quantity=1)
+
+    queryset = search_catalog("gaming laptop", stores[0])
+    assert 'DISTINCT' not in str(queryset.query)
+    assert [(p.id, p.in_user_store) for p in queryset] == [(spread.id, True), (close.id, False)]
+    assert [p.id for p in search_catalog("gaming laptop", stores[1])] == [close.id, spread.id]
+    assert [p.id for p in search_catalog("gaming laptop", None)] == [close.id, spread.id]
+
+
+@pytest.mark.django_db
+def test_search_vector_maintained_for_bulk_writes():
+    """
+    search_vector заполняется триггером в БД, в том числе при bulk_create / bulk_update,
+    поиск работает по префиксу слова.
+    """
+    products = Product.objects.bulk_create([
+        Product(name="Wireless Keyboard", description="Bluetooth"),
+        Product(name="Gaming Mouse", description="RGB"),
+    ])
+    keyboard, mouse = products
+
+    assert list(search_products(Product.objects.all(), "keyb").values_list('id', flat=True)) == [keyboard.id]
+    assert list(search_products(Product.objects.all(), "bluet").values_list('id', flat=True)) == [keyboard.id]
+
+    mouse.name = "Gaming Trackball"
+    Product.objects.bulk_update([mouse], ['name'])
+    assert list(search_products(Product.objects.all(), "trackb").values_list('id', flat=True)) == [mouse.id]
+    assert not search_products(Product.objects.all(), "-- & |").exists()
+
+
+@pytest.mark.django_db
+def test_search_trigram_fallback_for_typos():
+    if not trigram_available():
+        pytest.skip("pg_trgm is not installed")
+
+    product = Product.objects.create(name="Headphones", description="Noise cancelling")
+    assert list(search_products(Product.objects.all(), "headphnes").values_list('id', flat=True)) == [product.id]
+
+
+@pytest.mark.django_db
+def test_bulk_update_stocks_task_upsert():
+    """
+    bulk_update_stocks_task: обновляет существующие пары, создаёт отсутствующие,
+    не трогает неизменившиеся, пропускает несуществующие товары/магазины
+    и не путает пары при пересечении списков товаров и магазинов.
+    """
+    city = City.objects.create(name="CityUpsert")
+    store1 = Store.objects.create(name="Upsert1", city=city)
+    store2 = Store.objects.create(name="Upsert2", city=city)
+    product1 = Product.objects.create(name="Upsert product 1")
+    product2 = Product.objects.create(name="Upsert product 2")
+
+    Stock.objects.create(product=product1, store=store1, quantity=10)
+    Stock.objects.create(product=product2, store=store2, quantity=20)
+    # Пара (product1, store2) не входит в payload и не должна измениться
+    Stock.objects.create(product=product1, store=store2, quantity=30)
+
+    result = bulk_update_stocks_task([
+        {"product_id": product1.id, "store_id": store1.id, "quantity": 1},
+        {"product_id": product1.id, "store_id": store1.id, "quantity": 11},  # повтор: побеждает последний
+        {"product_id": product2.id, "store_id": store2.id, "quantity": 20},  # без изменений
+        {"product_id": product2.id, "store_id": store1.id, "quantity": 5},   # новая пара
+        {"product_id": 10 ** 9, "store_id": store1.id, "quantity": 5},       # нет такого товара
+    ])
+
+    assert result == {'inserted': 1, 'updated': 1, 'unchanged': 1, 'skipped': 1}
+    quantities = {(s.product_id, s.store_id): s.quantity for s in Stock.objects.all()}
+    assert quantities == {
+        (product1.id, store1.id): 11,
+        (product2.id, store2.id): 20,
+        (product1.id, store2.id): 30,
+        (product2.id, store1.id): 5,
+    }
+
+
+def test_stock_validator_matches_serializer_errors():
+    """
+    Быстрый валидатор отдаёт те же ошибки, что StockUpdateSerializer(many=True).
+    """
+    payload = [
+        {"product_id": 1, "store_id": 2, "quantity": 3},
+        {"product_id": "4", "store_id": 5.0, "quantity": "6.00"},
+        {"product_id": None, "store_id": True, "quantity": -1},
+        {"store_id": "x" * 1001, "quantity": 1.5},
+        {"product_id": 1, "store_id": 1, "quantity": 2 ** 31},
+        {"product_id": 2 ** 63, "store_id": 0, "quantity": 1},
+        {"product_id": str(2 ** 63), "store_id": -1, "quantity": 1},
+        ["not", "a", "dict"],
+    ]
+    serializer = StockUpdateSerializer(data=payload, many=True)
+    assert not serializer.is_valid()
+
+    with pytest.raises(ValidationError) as exc_info:
+        validate_stock_rows(payload)
+    assert json.loads(json.dumps(exc_info.value.detail)) == json.loads(json.dumps(serializer.errors))
+
+    valid = payload[:2]
+    serializer = StockUpdateSerializer(data=valid, many=True)
+    assert serializer.is_valid()
+    expected = [(item['product_id'], item['store_id'], item['quantity']) for item in serializer.validated_data]
+    assert validate_stock_rows(valid) == expected == [(1, 2, 3), (4, 5, 6)]
+
+
+@pytest.mark.django_db
+def test_stock_update_columnar_and_ndjson():
+    """
+    /api/v1/catalog/update/stocks принимает колоночный JSON и NDJSON,
+    ошибки колоночного формата отдаются по индексу строки.
+    """
+    user = User.objects.create_user(username='columns', password='columnspass')
+    city = City.objects.create(name="CityColumns")
+    store = Store.objects.create(name="StoreColumns", city=city)
+    product1 = Product.objects.create(name="Column product 1")
+    product2 = Product.objects.create(name="Column product 2")
+
+    client = APIClient()
+    token_resp = client.post('/api/v1/token/', {'username': 'columns', 'password': 'columnspass'}, format='json')
+    access_token = token_resp.data['access']
+    client.credentials(HTTP_AUTHORIZATION='Bearer ' + access_token)
+
+    columns = {"product_id": [product1.id, product2.id], "store_id": [store.id, store.id], "quantity": [3, 4]}
+    resp = client.post('/api/v1/catalog/update/stocks', columns, format='json')
+    assert resp.status_code == 202
+    assert dict(Stock.objects.values_list('product_id', 'quantity')) == {product1.id: 3, product2.id: 4}
+
+    body = "\n".join(
+        json.dumps({"product_id": p.id, "store_id": store.id, "quantity": q})
+        for p, q in ((product1, 30), (product2, 40))
+    ) + "\n"
+    resp = client.post('/api/v1/catalog/update/stocks', body, content_type='application/x-ndjson')
+    assert resp.status_code == 202
+    assert dict(Stock.objects.values_list('product_id', 'quantity')) == {product1.id: 30, product2.id: 40}
+
+    resp = client.post('/api/v1/catalog/update/stocks', '{"product_id": 1\n', content_type='application/x-ndjson')
+    assert resp.status_code == 400
+
+    columns["quantity"] = [5, -5]
+    resp = client.post('/api/v1/catalog/update/stocks', columns, format='json')
+    assert resp.status_code == 400
+    assert resp.json() == [{}, {"quantity": ["Ensure this value is greater than or equal to 0."]}]
+
+    # id вне bigint — 400, а не ошибка БД
+    columns["quantity"] = [5, 5]
+    columns["product_id"] = [product1.id, 2 ** 63]
+    resp = client.post('/api/v1/catalog/update/stocks', columns, format='json')
+    assert resp.status_code == 400
+    assert resp.json() == [{}, {"product_id": [f"Ensure this value is less than or equal to {2 ** 63 - 1}."]}]
+
+    columns["quantity"] = [5]
+    resp = client.post('/api/v1/catalog/update/stocks', columns, format='json')
+    assert resp.status_code == 400
+    assert resp.json() == {"non_field_errors": ["All columns must have the same length."]}
+
+
+@pytest.mark.django_db
+def test_product_image_endpoint():
+    """
+    /api/v1/images/<hash> отдаёт декодированные байты с ETag и Cache-Control,
+    повтор с If-None-Match — 304, повторная отдача идёт из кэша без запросов к БД.
+    """
+    png = b'\x89PNG\r\n\x1a\n' + b'pixels'
+    product = Product.objects.create(name="Image product")
+    image = ProductImage.objects.create(product=product, image_data=base64.b64encode(png).decode())
+    assert image.content_hash == hashlib.sha256(png).hexdigest()
+    assert image.content_type == 'image/png'
+
+    client = APIClient()
+    url = f'/api/v1/images/{image.content_hash}'
+    resp = client.get(url)
+    assert resp.status_code == 200
+    assert resp.content == png
+    assert resp['Content-Type'] == 'image/png'
+    assert resp['ETag'] == f'"{image.content_hash}"'
+    assert 'immutable' in resp['Cache-Control']
+    assert resp['X-Content-Type-Options'] == 'nosniff'
+
+    with CaptureQueriesContext(connection) as queries:
+        resp = client.get(url)
+    assert resp.status_code == 200
+    assert len(queries) == 0
+
+    resp = client.get(url, HTTP_IF_NONE_MATCH=f'"{image.content_hash}"')
+    assert resp.status_code == 304
+    assert resp.content == b''
+
+    resp = client.get('/api/v1/images/' + '0' * 64)
+    assert resp.status_code == 404
+
+
+@pytest.mark.django_db
+def test_product_image_endpoint_serves_only_image_types():
+    """
+    Тип из data URI, который не является изображением (text/html, svg), не отдаётся:
+    вместо него — тип по сигнатуре байтов или application/octet-stream.
+    """
+    product = Product.objects.create(name="Hostile image product")
+    html = b'<script>alert(document.cookie)</script>'
+    png = b'\x89PNG\r\n\x1a\n' + b'pixels'
+    hostile = ProductImage.objects.create(
+        product=product, image_data='data:text/html;base64,' + base64.b64encode(html).decode())
+    disguised = ProductImage.objects.create(
+        product=product, image_data='data:image/svg+xml;base64,' + base64.b64encode(png).decode())
+    assert hostile.content_type == 'application/octet-stream'
+    assert disguised.content_type == 'image/png'
+
+    # Строка, сохранённая до ограничения типов
+    legacy = ProductImage.objects.create(product=product, image_data=base64.b64encode(b'legacy <html>').decode())
+    ProductImage.objects.filter(pk=legacy.pk).update(content_type='text/html')
+
+    client = APIClient()
+    for image, content_type in ((hostile, 'application/octet-stream'), (disguised, 'image/png'),
+                                (legacy, 'application/octet-stream')):
+        resp = client.get(f'/api/v1/images/{image.content_hash}')
+        assert resp.status_code == 200
+        assert resp['Content-Type'] == content_type
+        assert resp['X-Content-Type-Options'] == 'nosniff'
+
+
+@pytest.mark.django_db
+def test_migrate_image_storage_command():
+    """
+    migrate_image_storage переносит base64 старых строк в бинарное хранение.
+    """
+    product = Product.objects.create(name="Legacy image product")
+    jpeg = b'\xff\xd8\xff' + b'jpeg'
+    # bulk_create не вызывает save(): так выглядят строки, созданные до бинарного хранения
+    legacy = ProductImage.objects.bulk_create([
+        ProductImage(product=product, image_data='data:image/jpeg;base64,' + base64.b64encode(jpeg).decode()),
+        ProductImage(product=product, image_data=base64.b64encode(b'second').decode()),
+    ])
+
+    call_command('migrate_image_storage', '--batch-size=1', '--clear-base64', stdout=io.StringIO())
+
+    first, second = (ProductImage.objects.get(pk=image.pk) for image in legacy)
+    assert bytes(first.content) == jpeg
+    assert first.content_type == 'image/jpeg'
+    assert first.content_hash == hashlib.sha256(jpeg).hexdigest()
+    assert bytes(second.content) == b'second'
+    assert first.image_data == second.image_data == ''
+
+
+@pytest.mark.django_db
+def test_catalog_page_cache_invalidation():
+    """
+    Страница каталога отдаётся из кэша без запросов к каталогу; записи Stock / Price /
+    ProductImage / Product и upsert остатков сбрасывают кэш только затронутых магазинов.
+    """
+    user = User.objects.create_user(username='cached', password='cachedpass')
+    city = City.objects.create(name="CityCache")
+    other_city = City.objects.create(name="OtherCityCache")
+    store = Store.objects.create(name="StoreCache", city=city)
+    other_store = Store.objects.create(name="OtherStoreCache", city=other_city)
+    UserProfile.objects.create(user=user, store=store)
+
+    product = Product.objects.create(name="Cached product", description="Desc")
+    price = Price.objects.create(product=product, store=store, amount=10)
+    Stock.objects.create(product=product, store=store, quantity=5)
+    Stock.objects.create(product=product, store=other_store, quantity=5)
+
+    client = APIClient()
+    token_resp = client.post('/api/v1/token/', {'username': 'cached', 'password': 'cachedpass'}, format='json')
+    access_token = token_resp.data['access']
+    client.credentials(HTTP_AUTHORIZATION='Bearer ' + access_token)
+
+    def get_catalog():
+        resp = client.get('/api/v1/catalog/')
+        assert resp.status_code == 200
+        return resp
+
+    assert get_catalog()['X-Cache'] == 'MISS'
+    with CaptureQueriesContext(connection) as queries:
+        resp = get_catalog()
+    assert resp['X-Cache'] == 'HIT'
+    # пользователь и магазин берутся из claims JWT
+    assert len(queries) == 0
+
+    price.amount = 12
+    price.save()
+    resp = get_catalog()
+    assert resp['X-Cache'] == 'MISS'
+    assert resp.json()[0]['price'] == "12.00"
+
+    # изменения в другом магазине / городе не сбрасывают кэш
+    Price.objects.create(product=product, store=other_store, amount=99)
+    ProductImage.objects.create(product=product, city=other_city, image_data="other_city")
+    assert get_catalog()['X-Cache'] == 'HIT'
+
+    ProductImage.objects.create(product=product, city=None, image_data="generic")
+    resp = get_catalog()
+    assert resp['X-Cache'] == 'MISS'
+    assert len(resp.json()[0]['images']) == 1
+
+    product.name = "Renamed product"
+    product.save()
+    assert get_catalog().json()[0]['name'] == "Renamed product"
+
+    bulk_update_stocks_task([{"product_id": product.id, "store_id": other_store.id, "quantity": 1}])
+    assert get_catalog()['X-Cache'] == 'HIT'
+    bulk_update_stocks_task([{"product_id": product.id, "store_id": store.id, "quantity": 0}])
+    resp = get_catalog()
+    assert resp['X-Cache'] == 'MISS'
+    assert resp.json() == []
+
+    stats = cache_stats()
+    assert stats['hit'] >= 3
+    assert stats['miss'] >= 5
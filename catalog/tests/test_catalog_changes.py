@@ -0,0 +1,181 @@
+from datetime import timedelta
+
+import pytest
+from django.contrib.auth.models import User
+from django.db import connection, connections
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from catalog.changes import compact_changes, sequence_changes
+from catalog.models import CatalogChange, City, Price, Product, ProductImage, Stock, Store, UserProfile
+from catalog.stocks import UPSERT_SQL, upsert_stocks
+from catalog.view_counter import flush_view_counts, record_view
+
+
+@pytest.fixture
+def sync_client():
+    city = City.objects.create(name="SyncCity")
+    store = Store.objects.create(name="SyncStore", city=city)
+    other_store = Store.objects.create(name="OtherSyncStore", city=city)
+    user = User.objects.create_user(username='syncer', password='syncpass')
+    UserProfile.objects.create(user=user, store=store)
+
+    client = APIClient()
+    token_resp = client.post('/api/v1/token/', {'username': 'syncer', 'password': 'syncpass'}, format='json')
+    client.credentials(HTTP_AUTHORIZATION='Bearer ' + token_resp.data['access'])
+    return client, store, other_store
+
+
+def changes(client, since, **params):
+    resp = client.get('/api/v1/catalog/changes', {'since': since, **params})
+    assert resp.status_code == 200, resp.content
+    return resp.json()
+
+
+@pytest.mark.django_db
+def test_changes_feed_follows_catalog_writes(sync_client, django_capture_on_commit_callbacks):
+    client, store, other_store = sync_client
+    products = [Product.objects.create(name=f"Sync product {i}") for i in range(3)]
+    # Номера изменениям выдаются после коммита записи
+    with django_capture_on_commit_callbacks(execute=True):
+        for product in products:
+            Stock.objects.create(product=product, store=store, quantity=5)
+            Price.objects.create(product=product, store=store, amount=10)
+
+    # Позиция до полной синхронизации
+    start = client.get('/api/v1/catalog/changes').json()
+    assert start['results'] == [] and start['seq'] > 0
+    catalog = client.get('/api/v1/catalog/').json()
+    assert len(catalog) == 3
+
+    # Нет изменений — пустая лента, та же позиция
+    assert changes(client, start['seq']) == {'seq': start['seq'], 'has_more': False, 'next': None, 'results': []}
+
+    # Запись через ORM, массовый upsert, изображение, удаление товара
+    with django_capture_on_commit_callbacks(execute=True):
+        Price.objects.filter(product=products[0], store=store).update(amount=12)
+        Price.objects.get(product=products[0], store=store).save()
+        upsert_stocks([
+            {'product_id': products[1].id, 'store_id': store.id, 'quantity': 9},
+            {'product_id': products[2].id, 'store_id': other_store.id, 'quantity': 4},
+        ])
+        ProductImage.objects.create(product=products[1], image_data="Z2VuZXJpYw==")
+        deleted_id = products[2].id
+        products[2].delete()
+        # Просмотры изменением не считаются
+        record_view(products[0].id)
+        flush_view_counts()
+
+    feed = changes(client, start['seq'])
+    assert [(item['id'], item['op']) for item in feed['results']] == [
+        (products[0].id, 'upsert'), (products[1].id, 'upsert'), (deleted_id, 'delete'),
+    ]
+    assert [item['seq'] for item in feed['results']] == sorted(item['seq'] for item in feed['results'])
+    assert feed['seq'] == feed['results'][-1]['seq']
+
+    # Элемент ленты — та же строка, что в /catalog/
+    catalog = {item['id']: item for item in client.get('/api/v1/catalog/').json()}
+    assert feed['results'][0]['item'] == catalog[products[0].id]
+    assert feed['results'][1]['item'] == catalog[products[1].id]
+    assert feed['results'][1]['item']['stock'] == 9
+    assert feed['results'][1]['item']['images']
+
+    # Номера у каждого магазина свои: в другом магазине — новый остаток и удаление товара
+    other = CatalogChange.objects.filter(store=other_store).order_by('seq').values_list('seq', 'product_id')
+    assert list(other) == [(1, deleted_id), (2, deleted_id)]
+    assert changes(client, feed['seq'])['results'] == []
+
+
+@pytest.mark.django_db
+def test_changes_feed_pagination(sync_client, django_capture_on_commit_callbacks):
+    client, store, _ = sync_client
+    head = client.get('/api/v1/catalog/changes').json()['seq']
+    products = [Product.objects.create(name=f"Page product {i}") for i in range(5)]
+    with django_capture_on_commit_callbacks(execute=True):
+        upsert_stocks([{'product_id': p.id, 'store_id': store.id, 'quantity': 1} for p in products])
+        # Повторное изменение товара: в пределах страницы — одна запись под последним номером,
+        # на разных страницах — две
+        upsert_stocks([{'product_id': products[4].id, 'store_id': store.id, 'quantity': 2}])
+        upsert_stocks([{'product_id': products[0].id, 'store_id': store.id, 'quantity': 2}])
+
+    seen, since, pages = [], head, 0
+    while True:
+        page = changes(client, since, limit=2)
+        seen += [item['id'] for item in page['results']]
+        since, pages = page['seq'], pages + 1
+        if not page['has_more']:
+            assert page['next'] is None
+            break
+        assert f"since={since}" in page['next']
+    assert pages == 4
+    assert seen == [p.id for p in products] + [products[0].id]
+
+
+@pytest.mark.django_db
+def test_changes_compaction_and_expired_positions(sync_client, django_capture_on_commit_callbacks):
+    client, store, _ = sync_client
+    products = [Product.objects.create(name=f"Old product {i}") for i in range(3)]
+    with django_capture_on_commit_callbacks(execute=True):
+        upsert_stocks([{'product_id': p.id, 'store_id': store.id, 'quantity': 1} for p in products])
+    CatalogChange.objects.update(created_at=timezone.now() - timedelta(days=30))
+    # Номер последнему изменению выдаёт само сжатие
+    upsert_stocks([{'product_id': products[0].id, 'store_id': store.id, 'quantity': 2}])
+
+    assert compact_changes(retention=60 * 60 * 24, batch_size=1) == 3
+    assert CatalogChange.objects.filter(store=store).count() == 1
+
+    # Позиции до сжатия больше нет — клиент перечитывает каталог
+    resp = client.get('/api/v1/catalog/changes', {'since': 0})
+    assert resp.status_code == 410
+    head = resp.json()['seq']
+    assert head == 4
+    assert [item['id'] for item in changes(client, 3)['results']] == [products[0].id]
+    assert client.get('/api/v1/catalog/changes', {'since': head + 1}).status_code == 410
+    assert client.get('/api/v1/catalog/changes', {'since': 'x'}).status_code == 400
+
+
+@pytest.fixture
+def concurrent_writer():
+    """
+    Второе соединение к тестовой базе — параллельная пачка остатков в своей транзакции.
+    """
+    connections.settings['writer'] = dict(connections.settings['default'])
+    writer = connections['writer']
+    yield writer
+    writer.close()
+    del connections['writer']
+    del connections.settings['writer']
+
+
+@pytest.mark.django_db(transaction=True)
+def test_parallel_stock_chunks_of_one_store_do_not_wait(sync_client, concurrent_writer):
+    client, store, _ = sync_client
+    products = [Product.objects.create(name=f"Parallel product {i}") for i in range(2)]
+    for product in products:
+        Stock.objects.create(product=product, store=store, quantity=1)
+    head = client.get('/api/v1/catalog/changes').json()['seq']
+
+    with concurrent_writer.cursor() as cursor:
+        cursor.execute('BEGIN')
+        cursor.execute(UPSERT_SQL, [[products[0].id], [store.id], [5]])
+    try:
+        # Пачка того же магазина не ждёт коммита первой: счётчик магазина не заблокирован
+        with connection.cursor() as cursor:
+            cursor.execute("SET lock_timeout = '2s'")
+        try:
+            upsert_stocks([{'product_id': products[1].id, 'store_id': store.id, 'quantity': 7}])
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute('RESET lock_timeout')
+        assert [item['id'] for item in changes(client, head)['results']] == [products[1].id]
+    finally:
+        with concurrent_writer.cursor() as cursor:
+            cursor.execute('COMMIT')
+
+    # Изменение первой пачки нумеруется после её коммита — после уже прочитанного
+    seen = changes(client, head)['seq']
+    assert changes(client, seen)['results'] == []
+    sequence_changes()
+    feed = changes(client, seen)
+    assert [(item['id'], item['item']['stock']) for item in feed['results']] == [(products[0].id, 5)]
+    assert feed['seq'] == seen + 1
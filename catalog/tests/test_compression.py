@@ -0,0 +1,148 @@
+import gzip
+import zlib
+from unittest import mock
+
+import pytest
+from django.contrib.auth.models import User
+from django.test import RequestFactory
+from rest_framework.test import APIClient
+
+from catalog import compression, response_cache
+from catalog.async_views import AsyncReadView
+from catalog.models import City, Price, Product, ProductImage, Stock, Store, UserProfile
+
+
+@pytest.fixture
+def big_catalog(db, settings):
+    settings.COMPRESSION_MIN_SIZE = 512
+    city = City.objects.create(name="GzipCity")
+    store = Store.objects.create(name="GzipStore", city=city)
+    user = User.objects.create_user(username='gzip', password='gzippass')
+    UserProfile.objects.create(user=user, store=store)
+    for i in range(20):
+        product = Product.objects.create(name=f"Compressed laptop {i}", description="Very long description " * 5)
+        Price.objects.create(product=product, store=store, amount=100 + i)
+        Stock.objects.create(product=product, store=store, quantity=i + 1)
+        ProductImage.objects.create(product=product, image_data='aGVsbG8=')
+
+    client = APIClient()
+    token_resp = client.post('/api/v1/token/', {'username': 'gzip', 'password': 'gzippass'}, format='json')
+    client.credentials(HTTP_AUTHORIZATION='Bearer ' + token_resp.data['access'])
+    return client
+
+
+def gunzip(resp):
+    assert resp['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in resp['Vary']
+    return gzip.decompress(resp.content)
+
+
+@pytest.mark.parametrize('header, expected', [
+    ('', None),
+    ('gzip, deflate', 'gzip'),
+    ('deflate;q=1.0, gzip;q=0.5', 'gzip'),
+    ('gzip;q=0', None),
+    ('*', compression.ENCODINGS[0]),
+    ('identity', None),
+])
+def test_accepted_encoding(header, expected):
+    request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING=header)
+    assert compression.accepted_encoding(request) == expected
+
+
+def test_accepted_encoding_prefers_brotli():
+    pytest.importorskip('brotli')
+    request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip, br')
+    assert compression.accepted_encoding(request) == 'br'
+    request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip, br;q=0.5')
+    assert compression.accepted_encoding(request) == 'gzip'
+
+
+@pytest.mark.parametrize('path', ['async', 'drf'])
+def test_cached_catalog_page_stored_compressed(big_catalog, path):
+    client = big_catalog
+    with mock.patch.object(AsyncReadView, 'accepts_json', return_value=path == 'async'):
+        plain = client.get('/api/v1/catalog/')
+        assert 'Content-Encoding' not in plain and 'Accept-Encoding' in plain['Vary']
+
+        # Страница уже в кэше, её сжатого варианта ещё нет
+        first = client.get('/api/v1/catalog/', HTTP_ACCEPT_ENCODING='gzip')
+        assert first['X-Cache'] == 'HIT'
+        assert gunzip(first) == plain.content
+        # ETag каталога слабый и для сжатого ответа остаётся прежним
+        assert first['ETag'] == plain['ETag'] and first['ETag'].startswith('W/')
+        assert int(first['Content-Length']) == len(first.content) < len(plain.content)
+
+        # Повторное попадание отдаёт сохранённый сжатый вариант без сжатия
+        with mock.patch.object(compression, 'compress', side_effect=AssertionError):
+            hit = client.get('/api/v1/catalog/', HTTP_ACCEPT_ENCODING='gzip')
+        assert hit['X-Cache'] == 'HIT'
+        assert hit.content == first.content
+
+        # Слабый ETag сжатого ответа подходит для If-None-Match
+        assert client.get('/api/v1/catalog/', HTTP_ACCEPT_ENCODING='gzip',
+                          HTTP_IF_NONE_MATCH=hit['ETag']).status_code == 304
+
+
+def test_dynamic_responses_compressed_above_threshold(big_catalog, settings):
+    client = big_catalog
+    plain = client.get('/api/v1/search/?q=laptop')
+    resp = client.get('/api/v1/search/?q=laptop', HTTP_ACCEPT_ENCODING='gzip')
+    assert gunzip(resp) == plain.content
+
+    settings.COMPRESSION_MIN_SIZE = len(plain.content) + 1
+    resp = client.get('/api/v1/search/?q=laptop', HTTP_ACCEPT_ENCODING='gzip')
+    assert 'Content-Encoding' not in resp and resp.content == plain.content
+
+    # Изображения (не JSON) не сжимаются
+    url = plain.json()[0]['images'][0]['url']
+    assert 'Content-Encoding' not in client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+
+
+def test_streaming_responses_compressed_by_chunk(big_catalog, settings):
+    client = big_catalog
+    plain = b''.join(client.get('/api/v1/catalog/?stream=1').streaming_content)
+
+    resp = client.get('/api/v1/catalog/?stream=1', HTTP_ACCEPT_ENCODING='gzip')
+    assert resp.streaming and resp['Content-Encoding'] == 'gzip'
+    chunks = list(resp.streaming_content)
+    # Каждый фрагмент сброшен: начало потока разжимается до прихода конца
+    head = zlib.decompressobj(31).decompress(chunks[0])
+    assert head and plain.startswith(head)
+    assert gzip.decompress(b''.join(chunks)) == plain
+
+    settings.COMPRESSION_STREAMING = False
+    resp = client.get('/api/v1/catalog/?stream=1', HTTP_ACCEPT_ENCODING='gzip')
+    assert 'Content-Encoding' not in resp
+    assert b''.join(resp.streaming_content) == plain
+
+
+def test_page_cache_waiter_gets_builder_variant_and_lock_is_not_stolen(settings):
+    settings.COMPRESSION_MIN_SIZE = 16
+    redis = response_cache._redis()
+    key = 'catalog:page:test'
+    lock_key = key + response_cache.LOCK_SUFFIX
+    page = b'[{"name": "waited page"}]' * 10
+    encoded = compression.compress(page, 'gzip', cached=True)
+
+    # Страницу собирает другой процесс: ожидающий получает его сжатый вариант без пересжатия
+    redis.set(lock_key, 'other')
+
+    def builder_done(seconds):
+        redis.set(key, page)
+        redis.set(response_cache._variant_key(key, 'gzip'), encoded)
+
+    with mock.patch.object(response_cache.time, 'sleep', side_effect=builder_done), \
+            mock.patch.object(compression, 'compress', side_effect=AssertionError):
+        assert response_cache.get_or_build(key, build=None, encoding='gzip') == (encoded, True, 'gzip')
+    assert response_cache.cache_stats()['wait_hit'] == 1
+
+    # Блокировка истекла и досталась другому сборщику: своя пересборка её не снимает
+    redis.delete(key, response_cache._variant_key(key, 'gzip'), lock_key)
+
+    def build():
+        redis.set(lock_key, 'other')
+        return page
+
+    assert response_cache.get_or_build(key, build, encoding='gzip') == (encoded, False, 'gzip')
+    assert redis.get(lock_key) == b'other'
@@ -0,0 +1,111 @@
+from unittest import mock
+
+import pytest
+from django.contrib.auth.models import User
+from rest_framework.test import APIClient
+
+from catalog.async_views import AsyncReadView
+from catalog.models import City, Store, Product, Stock, Price, UserProfile, ProductImage
+from catalog.stocks import upsert_stocks
+from catalog.view_counter import pending_views
+
+
+@pytest.fixture(params=['async', 'drf'])
+def conditional_client(request, db):
+    """
+    Клиент с JWT пользователя магазина; 'drf' — в обход быстрого async-пути.
+    """
+    user = User.objects.create_user(username='poller', password='pollerpass')
+    city = City.objects.create(name="PollCity")
+    store = Store.objects.create(name="PollStore", city=city)
+    other_store = Store.objects.create(name="OtherPollStore", city=city)
+    UserProfile.objects.create(user=user, store=store)
+    products = []
+    for i in range(3):
+        product = Product.objects.create(name=f"Poll laptop {i}", description="Poll")
+        Price.objects.create(product=product, store=store, amount=10 + i)
+        Stock.objects.create(product=product, store=store, quantity=1 + i)
+        Stock.objects.create(product=product, store=other_store, quantity=1)
+        ProductImage.objects.create(product=product, image_data='aGVsbG8=')
+        products.append(product)
+
+    client = APIClient()
+    token_resp = client.post('/api/v1/token/', {'username': 'poller', 'password': 'pollerpass'}, format='json')
+    client.credentials(HTTP_AUTHORIZATION='Bearer ' + token_resp.data['access'])
+    if request.param == 'drf':
+        with mock.patch.object(AsyncReadView, 'accepts_json', return_value=False):
+            yield client, store, other_store, products
+    else:
+        yield client, store, other_store, products
+
+
+def assert_not_modified(client, url, response):
+    assert response.status_code == 200
+    etag = response['ETag']
+    assert etag.startswith('W/"')
+    cached = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert cached.status_code == 304
+    assert cached['ETag'] == etag
+    assert cached.content == b''
+    return etag
+
+
+@pytest.mark.django_db
+def test_catalog_and_search_not_modified(conditional_client, django_assert_max_num_queries):
+    client, store, other_store, products = conditional_client
+    for i, url in enumerate(('/api/v1/catalog/', '/api/v1/catalog/?limit=2', '/api/v1/search/?q=laptop')):
+        response = client.get(url)
+        # Версия — одно чтение Redis: 304 без запросов к Postgres
+        with django_assert_max_num_queries(0):
+            etag = assert_not_modified(client, url, response)
+        modified_since = response['Last-Modified']
+        assert client.get(url, HTTP_IF_MODIFIED_SINCE=modified_since).status_code == 304
+
+        # Изменение каталога магазина — новый ETag
+        upsert_stocks([{'product_id': products[0].id, 'store_id': store.id, 'quantity': 50 + i}])
+        changed = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert changed.status_code == 200
+        assert changed['ETag'] != etag
+
+    # Каталог чужого магазина на каталог пользователя не влияет, а на поиск — влияет
+    catalog_etag = client.get('/api/v1/catalog/')['ETag']
+    search_etag = client.get('/api/v1/search/?q=laptop')['ETag']
+    Stock.objects.filter(product=products[1], store=other_store).get().delete()
+    assert client.get('/api/v1/catalog/', HTTP_IF_NONE_MATCH=catalog_etag).status_code == 304
+    assert client.get('/api/v1/search/?q=laptop', HTTP_IF_NONE_MATCH=search_etag).status_code == 200
+
+
+@pytest.mark.django_db
+def test_product_not_modified(conditional_client, django_assert_max_num_queries):
+    client, store, other_store, products = conditional_client
+    product = products[0]
+    url = f'/api/v1/product/{product.pk}/'
+
+    response = client.get(url)
+    # Версия карточки — один запрос; просмотр засчитывается и при 304
+    with django_assert_max_num_queries(1):
+        etag = assert_not_modified(client, url, response)
+    assert pending_views([product.pk])[product.pk] == 2
+    assert client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code == 304
+
+    def changes_etag(change):
+        nonlocal etag
+        change()
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 200, change
+        assert response['ETag'] != etag
+        etag = response['ETag']
+
+    changes_etag(lambda: Price.objects.filter(product=product, store=store).update(amount=99))
+    changes_etag(lambda: upsert_stocks([{'product_id': product.id, 'store_id': store.id, 'quantity': 9}]))
+    changes_etag(lambda: ProductImage.objects.create(product=product, city=store.city, image_data='Y2l0eQ=='))
+    changes_etag(lambda: ProductImage.objects.filter(product=product, city=store.city).get().delete())
+    changes_etag(lambda: Stock.objects.filter(product=product, store=store).get().delete())
+    changes_etag(lambda: Product.objects.filter(pk=product.pk).update(name="Renamed poll laptop"))
+
+    # Остатки в других магазинах и просмотры карточку пользователя не меняют
+    Stock.objects.filter(product=product, store=other_store).update(quantity=7)
+    Product.objects.filter(pk=product.pk).update(view_count=100)
+    assert client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 304
+
+    assert client.get('/api/v1/product/999999/', HTTP_IF_NONE_MATCH=etag).status_code == 404
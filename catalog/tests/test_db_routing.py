@@ -0,0 +1,152 @@
+from unittest import mock
+
+import pytest
+from django.conf import settings as django_settings
+from django.contrib.auth.models import User
+from django.db import connections
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from catalog import db_routing, tasks
+from catalog.reference import bump_reference_version, get_store
+from catalog.user_store import forget_user_stores, get_user_store
+from catalog.async_views import AsyncReadView
+from catalog.db_routing import PrimaryReplicaRouter, use_primary
+from catalog.models import City, Product, Stock, Store, UserProfile
+
+REPLICA_ALIASES = [alias for alias in django_settings.DATABASES if alias != 'default']
+
+
+def test_router_sends_reads_to_replicas(settings):
+    router = PrimaryReplicaRouter()
+    settings.DATABASE_REPLICAS = []
+    assert router.db_for_read(Product) == 'default'
+
+    settings.DATABASE_REPLICAS = ['replica_1', 'replica_2']
+    # Вне HTTP-запроса (Celery, команды) — primary
+    assert router.db_for_read(Product) == 'default'
+    assert router.db_for_write(Product) == 'default'
+    assert router.allow_migrate('default', 'catalog') and not router.allow_migrate('replica_1', 'catalog')
+
+    token = db_routing.start_request('GET')
+    assert router.db_for_read(Product) in ('replica_1', 'replica_2')
+    with use_primary():
+        assert router.db_for_read(Product) == 'default'
+    db_routing.finish_request(token)
+
+    token = db_routing.start_request('POST')
+    assert router.db_for_read(Product) == 'default'
+    db_routing.finish_request(token)
+
+
+@pytest.mark.django_db
+def test_reads_inside_transaction_stay_on_primary(settings):
+    # pytest-django оборачивает тест в транзакцию на primary
+    settings.DATABASE_REPLICAS = ['replica_1']
+    assert PrimaryReplicaRouter().db_for_read(Product) == 'default'
+
+
+def test_stock_task_pinned_to_primary(settings):
+    settings.DATABASE_REPLICAS = ['replica_1']
+
+    def upsert(rows):
+        assert PrimaryReplicaRouter().db_for_read(Stock) == 'default'
+        return {'inserted': 0, 'updated': 0, 'unchanged': 0, 'skipped': len(rows)}
+
+    with mock.patch.object(tasks, 'upsert_stocks', side_effect=upsert) as upsert_stocks:
+        tasks.bulk_update_stocks_task([{'product_id': 1, 'store_id': 1, 'quantity': 1}])
+    assert upsert_stocks.called
+
+
+@pytest.fixture
+def writer():
+    city = City.objects.create(name="ReplicaCity")
+    store = Store.objects.create(name="ReplicaStore", city=city)
+    user = User.objects.create_user(username='writer', password='writerpass')
+    UserProfile.objects.create(user=user, store=store)
+    product = Product.objects.create(name="Replica product")
+    Stock.objects.create(product=product, store=store, quantity=1)
+
+    client = APIClient()
+    token_resp = client.post('/api/v1/token/', {'username': 'writer', 'password': 'writerpass'}, format='json')
+    client.credentials(HTTP_AUTHORIZATION='Bearer ' + token_resp.data['access'])
+    return client, user, store, product
+
+
+@pytest.mark.django_db(transaction=True, databases='__all__')
+@pytest.mark.parametrize('path', ['async', 'drf'])
+def test_reads_stick_to_primary_after_own_write(writer, settings, path):
+    client, user, store, product = writer
+    # Реплику заменяет сам primary: проверяется только выбор реплики роутером
+    settings.DATABASE_REPLICAS = ['default']
+    with mock.patch.object(AsyncReadView, 'accepts_json', return_value=path == 'async'), \
+            mock.patch('catalog.db_routing.random.choice', return_value='default') as replica_reads:
+        assert client.get(f'/api/v1/product/{product.pk}/').status_code == 200
+        assert replica_reads.call_count > 0
+
+        replica_reads.reset_mock()
+        resp = client.post('/api/v1/catalog/update/stocks',
+                           [{'product_id': product.pk, 'store_id': store.pk, 'quantity': 7}], format='json')
+        assert resp.status_code == 202, resp.content
+        # Свою запись пользователь читает с primary
+        assert client.get(f'/api/v1/product/{product.pk}/').json()['stock'] == 7
+        assert replica_reads.call_count == 0
+
+        # Окно закрепления истекло — снова реплика
+        db_routing.get_redis_connection('default').delete(db_routing.STICKY_KEY.format(user_id=user.pk))
+        assert client.get(f'/api/v1/product/{product.pk}/').status_code == 200
+        assert replica_reads.call_count > 0
+
+
+@pytest.mark.skipif(not REPLICA_ALIASES, reason="POSTGRES_REPLICA_HOSTS is not set")
+@pytest.mark.django_db(transaction=True, databases='__all__')
+def test_catalog_reads_use_replica_connection(writer):
+    client, _, _, product = writer
+    replica = connections[REPLICA_ALIASES[0]]
+    with mock.patch('catalog.db_routing.random.choice', return_value=replica.alias), \
+            CaptureQueriesContext(replica) as replica_queries:
+        assert client.get(f'/api/v1/product/{product.pk}/').json()['name'] == "Replica product"
+    assert len(replica_queries) > 0
+
+
+@pytest.fixture
+def lagging_replica():
+    """
+    Отстающая реплика: отдельное соединение к тестовой базе со снимком REPEATABLE READ,
+    взятым до записей теста.
+    """
+    connections.settings['lagging'] = dict(connections.settings['default'])
+    replica = connections['lagging']
+    with replica.cursor() as cursor:
+        cursor.execute('BEGIN ISOLATION LEVEL REPEATABLE READ')
+        cursor.execute('SELECT 1 FROM catalog_store LIMIT 1')
+    yield replica
+    with replica.cursor() as cursor:
+        cursor.execute('ROLLBACK')
+    replica.close()
+    del connections['lagging']
+    del connections.settings['lagging']
+
+
+@pytest.mark.django_db(transaction=True)
+def test_reference_and_user_store_ignore_lagging_replica(writer, lagging_replica):
+    client, user, store, product = writer
+    get_store(store.pk)
+    assert get_user_store(user.pk) == store
+    new_store = Store.objects.create(name="Fresh store", city=store.city)
+    UserProfile.objects.filter(user=user).update(store=new_store)
+    # update() сигналов не вызывает
+    forget_user_stores([user.pk])
+    bump_reference_version()
+
+    with override_settings(DATABASE_REPLICAS=['lagging']):
+        token = db_routing.start_request('GET')
+        try:
+            # Реплика действительно отстаёт
+            assert not Store.objects.filter(pk=new_store.pk).exists()
+            # Справочник и магазин пользователя — с primary, под новой версией
+            assert get_store(new_store.pk) == new_store
+            assert get_user_store(user.pk) == new_store
+        finally:
+            db_routing.finish_request(token)
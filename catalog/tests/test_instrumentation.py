@@ -0,0 +1,145 @@
+import json
+import logging
+
+from unittest import mock
+
+import pytest
+from django.contrib.auth.models import User
+from django.test import Client
+from django_redis import get_redis_connection
+from rest_framework.test import APIClient
+
+from catalog import metrics
+from catalog.instrumentation import fingerprint, profile_request, timing
+from catalog.models import City, Store, Product, Stock, Price, UserProfile
+
+
+def make_client():
+    user = User.objects.create_user(username='perf', password='perfpass')
+    city = City.objects.create(name="PerfCity")
+    store = Store.objects.create(name="PerfStore", city=city)
+    UserProfile.objects.create(user=user, store=store)
+    for i in range(3):
+        product = Product.objects.create(name=f"Perf product {i}")
+        Price.objects.create(product=product, store=store, amount=10)
+        Stock.objects.create(product=product, store=store, quantity=5)
+
+    client = APIClient()
+    token_resp = client.post('/api/v1/token/', {'username': 'perf', 'password': 'perfpass'}, format='json')
+    client.credentials(HTTP_AUTHORIZATION='Bearer ' + token_resp.data['access'])
+    return client
+
+
+@pytest.mark.django_db
+def test_performance_middleware_profiles_sampled_requests(settings, caplog):
+    settings.PERF_SAMPLE_RATE = 1.0
+    settings.METRICS_TOKEN = 'metrics-secret'
+    client = make_client()
+
+    with caplog.at_level(logging.INFO, logger='catalog.perf'):
+        resp = client.get('/api/v1/catalog/')
+    assert resp.status_code == 200
+
+    timings = resp['Server-Timing']
+    assert 'db;dur=' in timings and 'queries"' in timings
+    assert 'serialize;dur=' in timings
+    assert 'total;dur=' in timings
+
+    record = json.loads(caplog.records[-1].getMessage())
+    assert record['route'] == 'catalog'
+    assert record['status'] == 200
+    assert record['db_queries'] > 0
+    assert record['bytes'] == len(resp.content)
+    assert 'serialize_ms' in record
+
+    scrape = Client().get('/metrics', HTTP_AUTHORIZATION='Bearer metrics-secret')
+    assert scrape['Content-Type'].startswith('text/plain')
+    text = scrape.content.decode()
+    assert 'catalog_http_requests_total{route="catalog",method="GET",status="200"} 1' in text
+    assert 'catalog_http_request_duration_seconds_bucket{route="catalog",method="GET",le="+Inf"} 1' in text
+    assert f'catalog_http_response_bytes_total{{route="catalog",method="GET"}} {len(resp.content)}' in text
+    assert 'catalog_http_profiled_requests_total{route="catalog",method="GET"} 1' in text
+    assert '# TYPE catalog_http_request_duration_seconds histogram' in text
+    # сам /metrics в метрики не попадает
+    assert 'route="metrics"' not in text
+
+
+@pytest.mark.django_db
+def test_performance_middleware_unsampled_requests(settings):
+    settings.PERF_SAMPLE_RATE = 0
+    client = make_client()
+
+    resp = client.get('/api/v1/catalog/')
+    assert 'Server-Timing' not in resp
+
+    staff = User.objects.create_user(username='perf-staff', password='staffpass', is_staff=True)
+    metrics_client = Client()
+    metrics_client.force_login(staff)
+    text = metrics_client.get('/metrics').content.decode()
+    assert 'catalog_http_requests_total{route="catalog",method="GET",status="200"} 1' in text
+    assert 'catalog_http_profiled_requests_total' not in text
+
+
+@pytest.mark.django_db
+def test_metrics_endpoint_requires_token_or_staff(settings):
+    settings.METRICS_TOKEN = 'metrics-secret'
+    client = make_client()
+    resp = Client().get('/metrics')
+    assert resp.status_code == 401 and resp['WWW-Authenticate'].startswith('Bearer')
+    assert Client().get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code == 401
+    # JWT обычного пользователя не подходит
+    assert client.get('/metrics').status_code == 401
+
+    user = User.objects.get(username='perf')
+    session = Client()
+    session.force_login(user)
+    assert session.get('/metrics').status_code == 403
+
+    settings.METRICS_TOKEN = ''
+    assert Client().get('/metrics', HTTP_AUTHORIZATION='Bearer ').status_code == 401
+
+
+@pytest.mark.django_db
+def test_request_metrics_buffered_per_process(settings):
+    settings.PERF_SAMPLE_RATE = 0
+    settings.METRICS_FLUSH_INTERVAL = 60
+    client = make_client()
+    metrics.flush()
+    redis = get_redis_connection('default')
+    series = 'catalog_http_requests_total{route="catalog",method="GET",status="200"}'
+
+    with mock.patch.object(metrics, '_redis', side_effect=AssertionError("request touched Redis")):
+        for _ in range(3):
+            assert client.get('/api/v1/catalog/').status_code == 200
+    assert redis.hget(metrics.METRICS_KEY, series) is None
+
+    # Сброс — одно приращение на серию; /metrics сначала сбрасывает счётчики своего процесса
+    metrics.flush()
+    assert redis.hget(metrics.METRICS_KEY, series) == b'3'
+    assert f'{series} 3' in metrics.render_metrics()
+
+    # Интервал истёк — запрос сам переносит накопленное
+    settings.METRICS_FLUSH_INTERVAL = 0
+    client.get('/api/v1/catalog/')
+    assert redis.hget(metrics.METRICS_KEY, series) == b'4'
+
+
+@pytest.mark.django_db
+def test_profile_detects_repeated_queries():
+    products = [Product.objects.create(name=f"N+1 {i}") for i in range(4)]
+
+    with profile_request() as profile:
+        for product in products:
+            Stock.objects.filter(product=product).count()
+        with timing('serialize'):
+            list(Product.objects.filter(id__in=[p.id for p in products]))
+
+    assert profile.db_queries == 5
+    assert 'serialize' in profile.timings
+    duplicates = profile.duplicate_queries(3)
+    assert list(duplicates.values()) == [4]
+    assert 'catalog_stock' in next(iter(duplicates))
+
+    # списки параметров разной длины — один отпечаток
+    assert fingerprint('SELECT 1 WHERE id IN (%s, %s, %s)') == fingerprint('SELECT 1 WHERE id IN (%s)')
+    assert fingerprint('INSERT INTO t VALUES (%s, %s), (%s, %s)') == fingerprint('INSERT INTO t VALUES (%s, %s)')
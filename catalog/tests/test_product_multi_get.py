@@ -0,0 +1,88 @@
+import json
+from unittest import mock
+
+import pytest
+from django.contrib.auth.models import User
+from rest_framework.test import APIClient
+
+from catalog.async_views import AsyncReadView
+from catalog.models import City, Price, Product, ProductImage, Stock, Store, UserProfile
+from catalog.view_counter import flush_view_counts
+
+
+@pytest.fixture
+def cart(db):
+    city = City.objects.create(name="CartCity")
+    store = Store.objects.create(name="CartStore", city=city)
+    user = User.objects.create_user(username='cart', password='cartpass')
+    UserProfile.objects.create(user=user, store=store)
+    products = []
+    for i in range(4):
+        product = Product.objects.create(name=f"Cart product {i}", description="In cart")
+        Price.objects.create(product=product, store=store, amount=10 + i)
+        Stock.objects.create(product=product, store=store, quantity=i)
+        ProductImage.objects.create(product=product, image_data='aGVsbG8=')
+        products.append(product)
+    ProductImage.objects.create(product=products[0], city=city, image_data='Y2l0eQ==')
+
+    client = APIClient()
+    token_resp = client.post('/api/v1/token/', {'username': 'cart', 'password': 'cartpass'}, format='json')
+    client.credentials(HTTP_AUTHORIZATION='Bearer ' + token_resp.data['access'])
+    return client, products
+
+
+def multi_get(client, ids):
+    resp = client.get('/api/v1/products/', {'ids': ','.join(str(i) for i in ids)})
+    assert resp.status_code == 200, resp.content
+    return resp
+
+
+@pytest.mark.parametrize('path', ['async', 'drf'])
+def test_multi_get_matches_product_detail(cart, path):
+    client, products = cart
+    ids = [products[2].id, products[0].id, 10 ** 9, products[2].id, products[1].id]
+    with mock.patch.object(AsyncReadView, 'accepts_json', return_value=path == 'async'):
+        first = multi_get(client, ids)
+        second = multi_get(client, ids)
+
+    # Порядок запроса, без повторов и несуществующих товаров; каждый просмотр засчитан
+    items = json.loads(second.content)
+    assert [item['id'] for item in items] == [products[2].id, products[0].id, products[1].id]
+    assert [item['view_count'] for item in json.loads(first.content)] == [1, 1, 1]
+    assert [item['view_count'] for item in items] == [2, 2, 2]
+
+    # Карточка — та же, что /product/<pk>/ (который засчитывает ещё один просмотр)
+    for item in items:
+        detail = client.get(f'/api/v1/product/{item["id"]}/').json()
+        assert dict(item, view_count=item['view_count'] + 1) == detail
+    assert len(items[1]['images']) == 1
+
+    # Сохранённые в БД просмотры складываются с ещё не перенесёнными
+    flush_view_counts()
+    assert [item['view_count'] for item in json.loads(multi_get(client, ids).content)] == [4, 4, 4]
+
+
+def test_multi_get_fragments_follow_writes(cart, django_assert_num_queries):
+    client, products = cart
+    ids = [product.id for product in products]
+    multi_get(client, ids)
+
+    # Все карточки из кэша фрагментов: только запрос версий
+    with django_assert_num_queries(1):
+        multi_get(client, ids)
+
+    Price.objects.filter(product=products[1]).update(amount=99)
+    Stock.objects.filter(product=products[3]).update(quantity=42)
+    items = {item['id']: item for item in json.loads(multi_get(client, ids).content)}
+    assert items[products[1].id]['price'] == '99.00'
+    assert items[products[3].id]['stock'] == 42
+    assert items[products[0].id]['price'] == '10.00'
+
+
+def test_multi_get_validates_ids(cart, settings):
+    client, products = cart
+    settings.PRODUCTS_MULTI_GET_MAX = 3
+    assert client.get('/api/v1/products/').status_code == 400
+    assert client.get('/api/v1/products/', {'ids': '1,x'}).status_code == 400
+    assert client.get('/api/v1/products/', {'ids': '1,2,3,4'}).status_code == 400
+    assert APIClient().get('/api/v1/products/', {'ids': '1'}).status_code == 401
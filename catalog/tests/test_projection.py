@@ -0,0 +1,86 @@
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.test import RequestFactory
+
+from catalog.models import City, Store, Product, Stock, Price, ProductImage, StoreCatalogEntry
+from catalog.projection import rebuild_catalog_entries
+from catalog.serializers import ProductSerializer, StoreCatalogEntrySerializer
+from catalog.stocks import upsert_stocks
+from catalog.view_counter import flush_view_counts, record_view
+
+
+def catalog_from_projection(store, request):
+    entries = StoreCatalogEntry.objects.filter(store=store, quantity__gt=0).with_view_count().order_by('product_id')
+    return StoreCatalogEntrySerializer(entries, many=True, context={'request': request}).data
+
+
+def catalog_from_products(store, request):
+    in_stock = Stock.objects.filter(store=store, quantity__gt=0).values_list('product_id', flat=True)
+    products = Product.objects.filter(id__in=in_stock).order_by('id').with_store_data(store)
+    return ProductSerializer(products, many=True, context={'request': request, 'store': store}).data
+
+
+def assert_projection_consistent(stores, request):
+    for store in stores:
+        assert catalog_from_projection(store, request) == catalog_from_products(store, request), store
+    # Инкрементальные обновления дают то же, что полная пересборка
+    assert rebuild_catalog_entries() == {'written': 0, 'removed': 0}
+
+
+@pytest.mark.django_db
+def test_projection_follows_catalog_writes():
+    request = RequestFactory().get('/api/v1/catalog/')
+    city = City.objects.create(name="ProjCity")
+    other_city = City.objects.create(name="OtherProjCity")
+    store = Store.objects.create(name="ProjStore", city=city)
+    other_store = Store.objects.create(name="OtherProjStore", city=other_city)
+    stores = [store, other_store]
+
+    products = [Product.objects.create(name=f"Proj product {i}", description="Test") for i in range(4)]
+    for i, product in enumerate(products):
+        Stock.objects.create(product=product, store=store, quantity=i)
+        Stock.objects.create(product=product, store=other_store, quantity=5)
+        if i != 2:
+            Price.objects.create(product=product, store=store, amount=10 + i)
+        ProductImage.objects.create(product=product, image_data="Z2VuZXJpYw==")
+    ProductImage.objects.create(product=products[1], city=city, image_data="Y2l0eQ==")
+    assert_projection_consistent(stores, request)
+    assert [item['id'] for item in catalog_from_projection(store, request)] == [p.id for p in products[1:]]
+
+    # Остатки и цены через ORM и массовый upsert
+    Stock.objects.filter(product=products[2], store=store).get().delete()
+    Price.objects.filter(product=products[1], store=store).update(amount=99)
+    Price.objects.get(product=products[1], store=store).save()
+    upsert_stocks([
+        {'product_id': products[0].id, 'store_id': store.id, 'quantity': 7},
+        {'product_id': products[2].id, 'store_id': other_store.id, 'quantity': 0},
+    ])
+    assert_projection_consistent(stores, request)
+    # Строки без остатка и цены в проекции не хранятся
+    assert not StoreCatalogEntry.objects.filter(product=products[2], store=store).exists()
+
+    # Товар, изображения и город магазина
+    products[0].name = "Renamed proj product"
+    products[0].save()
+    ProductImage.objects.create(product=products[0], city=other_city, image_data="b3RoZXI=")
+    ProductImage.objects.filter(product=products[1], city=city).get().delete()
+    store.city = other_city
+    store.save()
+    assert_projection_consistent(stores, request)
+
+    # Просмотры проекция не хранит: каталог читает их из Product
+    record_view(products[0].id)
+    flush_view_counts()
+    assert catalog_from_projection(store, request)[0]['view_count'] == 1
+    assert_projection_consistent(stores, request)
+
+    # Полная пересборка восстанавливает проекцию после записей в обход сигналов
+    Stock.objects.filter(store=store).update(quantity=3)
+    StoreCatalogEntry.objects.filter(store=other_store).delete()
+    out = StringIO()
+    call_command('rebuild_catalog_entries', stdout=out)
+    assert 'entries written' in out.getvalue()
+    for target in stores:
+        assert catalog_from_projection(target, request) == catalog_from_products(target, request)
@@ -0,0 +1,78 @@
+"""
+Бюджет SQL-запросов на запрос к каждому эндпоинту. Число запросов не должно зависеть
+от размера каталога: превышение бюджета — это N+1 или лишний round trip, а не рост данных.
+Латентность и размер ответа меряются бенчмарками: pytest -m benchmark -s catalog/tests/benchmarks
+"""
+import pytest
+from rest_framework.test import APIClient
+
+from catalog.search import trigram_available
+from catalog.seeding import seed_catalog
+from catalog.tasks import bulk_update_stocks_task
+
+# Пользователь и магазин — из claims JWT (без запросов), каталог — из проекции одним запросом,
+# товар и поиск — товары + префетчи цен, остатков и изображений, лента изменений — позиция магазина,
+# страница журнала и строки проекции; несколько карточек — версии карточек и для промахов кэша
+# фрагментов товары с префетчами
+QUERY_BUDGETS = {
+    'catalog': 1,
+    'catalog-page': 1,
+    'catalog-cached': 0,
+    'product-detail': 4,
+    'search': 4,
+    'stock-update': 4,
+    'stock-task': 4,
+    'catalog-changes': 3,
+    'products': 5,
+    'products-cached': 1,
+}
+
+
+@pytest.fixture
+def seeded_client(db):
+    catalog = seed_catalog(products=200)
+    client = APIClient()
+    token_resp = client.post(
+        '/api/v1/token/', {'username': catalog.users[0].username, 'password': catalog.password}, format='json'
+    )
+    client.credentials(HTTP_AUTHORIZATION='Bearer ' + token_resp.data['access'])
+    # Прогрев кэшей процесса и Redis (магазин пользователя, наличие pg_trgm) — их стоимость не входит в бюджет
+    client.get('/api/v1/catalog/?limit=1')
+    trigram_available()
+    return catalog, client
+
+
+@pytest.mark.parametrize('endpoint', QUERY_BUDGETS)
+def test_endpoint_query_budget(endpoint, seeded_client, django_assert_max_num_queries):
+    catalog, client = seeded_client
+    product = catalog.products[0]
+    payload = [
+        {'product_id': p.id, 'store_id': s.id, 'quantity': 3}
+        for p in catalog.products[:50] for s in catalog.stores[:2]
+    ]
+    calls = {
+        'catalog': lambda: client.get('/api/v1/catalog/'),
+        'catalog-page': lambda: client.get('/api/v1/catalog/?limit=100'),
+        'catalog-cached': lambda: client.get('/api/v1/catalog/?limit=100'),
+        'product-detail': lambda: client.get(f'/api/v1/product/{product.id}/'),
+        'search': lambda: client.get('/api/v1/search/?q=laptop&limit=20'),
+        'stock-update': lambda: client.post('/api/v1/catalog/update/stocks', payload, format='json'),
+        'stock-task': lambda: bulk_update_stocks_task(payload),
+        'catalog-changes': lambda: client.get('/api/v1/catalog/changes?since=0'),
+        'products': lambda: client.get('/api/v1/products/', {'ids': ','.join(str(p.id) for p in catalog.products)}),
+        'products-cached': lambda: client.get('/api/v1/products/', {'ids': ','.join(str(p.id) for p in catalog.products)}),
+    }
+    if endpoint == 'catalog-cached':
+        # Первый запрос собирает страницу, замеряется попадание в кэш
+        assert calls[endpoint]()['X-Cache'] == 'MISS'
+    if endpoint == 'products-cached':
+        # Первый запрос собирает фрагменты карточек, замеряется чтение из кэша
+        calls[endpoint]()
+
+    with django_assert_max_num_queries(QUERY_BUDGETS[endpoint]):
+        result = calls[endpoint]()
+
+    if endpoint == 'stock-task':
+        assert result['unchanged'] + result['updated'] + result['inserted'] == len(payload)
+    else:
+        assert result.status_code in (200, 202)
@@ -0,0 +1,139 @@
+import json
+
+import pytest
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from catalog.models import City, Store, Product, Stock, Price, UserProfile, ProductImage, StoreCatalogEntry
+from catalog.projection import rebuild_catalog_entries
+
+# Таблицы, которые растут с каталогом; маленькие справочники (город, магазин) читать целиком нормально
+LARGE_TABLES = {'catalog_product', 'catalog_stock', 'catalog_price', 'catalog_productimage', 'catalog_storecatalogentry'}
+
+
+def seed_catalog(stores=20, products=5000):
+    """
+    Каталог, в котором у каждого магазина ~10% товаров в наличии, а поиск по 'laptop'
+    находит ~1% товаров: на таких данных индексы должны быть выгоднее полного чтения.
+    """
+    cities = [City.objects.create(name=f"Plan city {i}") for i in range(4)]
+    store_objs = Store.objects.bulk_create([
+        Store(name=f"Plan store {i}", city=cities[i % len(cities)]) for i in range(stores)
+    ])
+    product_objs = Product.objects.bulk_create([
+        Product(name=f"Plan {'laptop' if i % 100 == 0 else 'phone'} {i}", description=f"Model {i}")
+        for i in range(products)
+    ])
+    stocks, prices = [], []
+    for i, product in enumerate(product_objs):
+        for k in range(4):
+            store = store_objs[(i + k * 5) % stores]
+            stocks.append(Stock(product=product, store=store, quantity=5 if k == 0 and i % 100 < 40 else 0))
+            prices.append(Price(product=product, store=store, amount=10))
+    Stock.objects.bulk_create(stocks, batch_size=5000)
+    Price.objects.bulk_create(prices, batch_size=5000)
+    ProductImage.objects.bulk_create(
+        [ProductImage(product=p, city=None, content_hash=f'{p.id:064x}') for p in product_objs]
+        + [ProductImage(product=p, city=cities[0], content_hash=f'{p.id + 1:064x}') for p in product_objs[::2]],
+        batch_size=5000,
+    )
+    rebuild_catalog_entries()
+    with connection.cursor() as cursor:
+        # В проде pending list GIN-индекса разбирает autovacuum; здесь делаем это явно,
+        # иначе планировщик завышает стоимость поиска по свежезаписанному индексу
+        cursor.execute("SELECT gin_clean_pending_list('product_search_vector_gin'::regclass)")
+        cursor.execute('ANALYZE')
+    return store_objs[0]
+
+
+def full_scans(plan):
+    """
+    Узлы плана, читающие большую таблицу целиком: Seq Scan или обход индекса с фильтром,
+    но без условия по индексу.
+    """
+    found = []
+    if plan.get('Relation Name') in LARGE_TABLES and 'Scan' in plan['Node Type']:
+        has_condition = 'Index Cond' in plan or 'Recheck Cond' in plan
+        if plan['Node Type'] == 'Seq Scan' or ('Filter' in plan and not has_condition):
+            found.append(f"{plan['Node Type']} on {plan['Relation Name']}: {plan.get('Filter', '')}")
+    for child in plan.get('Plans', []):
+        found.extend(full_scans(child))
+    return found
+
+
+def used_indexes(plan):
+    names = {plan['Index Name']} if 'Index Name' in plan else set()
+    for child in plan.get('Plans', []):
+        names |= used_indexes(child)
+    return names
+
+
+def index_name(model, columns):
+    """
+    Имя индекса (или ограничения уникальности) по колонкам — для индексов с автоматическими именами.
+    """
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(cursor, model._meta.db_table)
+    return next(
+        name for name, constraint in constraints.items()
+        if constraint['columns'] == columns and (constraint['index'] or constraint['unique'])
+    )
+
+
+@pytest.mark.django_db
+def test_catalog_and_search_queries_use_indexes():
+    """
+    Регрессия по планам (EXPLAIN) с настройками планировщика по умолчанию: ни один запрос
+    каталога, поиска и карточки товара не читает большие таблицы целиком, и каждый
+    эндпоинт использует свои индексы — проекцию каталога, GIN поиска, частичный индекс
+    остатков в наличии, покрывающий индекс цен и индекс изображений по товару.
+    """
+    store = seed_catalog()
+    user = User.objects.create_user(username='planner', password='plannerpass')
+    UserProfile.objects.create(user=user, store=store)
+
+    client = APIClient()
+    token_resp = client.post('/api/v1/token/', {'username': 'planner', 'password': 'plannerpass'}, format='json')
+    client.credentials(HTTP_AUTHORIZATION='Bearer ' + token_resp.data['access'])
+    product = Product.objects.first()
+
+    # Для каждого эндпоинта — индексы, которые он должен использовать (любой из набора)
+    entries_by_store = {
+        index_name(StoreCatalogEntry, ['store_id', 'product_id']), index_name(StoreCatalogEntry, ['store_id']),
+    }
+    images = {index_name(ProductImage, ['product_id'])}
+    search = [{'product_search_vector_gin'}, {'stock_store_in_stock'}, images]
+    expected = {
+        '/api/v1/catalog/': [entries_by_store],
+        '/api/v1/catalog/?limit=20': [entries_by_store],
+        '/api/v1/search/?q=laptop': search,
+        '/api/v1/search/?q=laptop&limit=20': search,
+        f'/api/v1/product/{product.id}/': [{'price_store_product_amount'}, images],
+    }
+
+    problems, missing = {}, {}
+    for url, required in expected.items():
+        with CaptureQueriesContext(connection) as queries:
+            assert client.get(url).status_code == 200
+        statements = [query['sql'] for query in queries.captured_queries
+                      if query['sql'].startswith('SELECT') and 'catalog_' in query['sql']]
+        assert statements, url
+
+        indexes = set()
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute('EXPLAIN (FORMAT JSON) ' + sql)
+                plan = cursor.fetchone()[0]
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                scans = full_scans(plan[0]['Plan'])
+                if scans:
+                    problems[sql[:200]] = scans
+                indexes |= used_indexes(plan[0]['Plan'])
+        absent = [names for names in required if not names & indexes]
+        if absent:
+            missing[url] = (absent, indexes)
+    assert not problems, problems
+    assert not missing, missing
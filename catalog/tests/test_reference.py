@@ -0,0 +1,41 @@
+import pytest
+from asgiref.sync import async_to_sync
+from django_redis import get_redis_connection
+
+from catalog import reference
+from catalog.models import City, Store, Product, Price
+
+
+@pytest.mark.django_db
+def test_reference_data_serves_cities_and_stores_from_memory(settings, django_assert_num_queries):
+    settings.CATALOG_REFERENCE_CHECK_INTERVAL = 60
+    city = City.objects.create(name="RefCity")
+    other_city = City.objects.create(name="OtherRefCity")
+    store = Store.objects.create(name="RefStore", city=city)
+    Store.objects.create(name="OtherRefStore", city=other_city)
+    price = Price.objects.create(product=Product.objects.create(name="Ref product"), store=store, amount=5)
+
+    with django_assert_num_queries(2):
+        assert reference.get_store(store.pk).city.name == "RefCity"
+    with django_assert_num_queries(0):
+        assert reference.get_city(other_city.pk).name == "OtherRefCity"
+        assert [s.name for s in reference.stores_in_city(city.pk)] == ["RefStore"]
+        assert async_to_sync(reference.aget_store)(store.pk).pk == store.pk
+        assert str(Store(name="Unsaved", city_id=city.pk)) == "Unsaved (RefCity)"
+        assert str(price) == "Price of Ref product in RefStore: 5"
+
+    # Изменение в этом процессе видно сразу
+    new_store = Store.objects.create(name="NewRefStore", city=city)
+    assert [s.name for s in reference.stores_in_city(city.pk)] == ["RefStore", "NewRefStore"]
+
+    # Изменение в другом процессе: версия сверяется раз в интервал, неизвестный id — сразу
+    Store.objects.filter(pk=new_store.pk).update(name="Renamed elsewhere")
+    City.objects.filter(pk=city.pk).update(name="RenamedCity")
+    get_redis_connection('default').incr(reference.REFERENCE_VERSION_KEY)
+    assert reference.get_store(new_store.pk).name == "NewRefStore"
+    settings.CATALOG_REFERENCE_CHECK_INTERVAL = 0
+    assert reference.get_store(new_store.pk).name == "Renamed elsewhere"
+    assert reference.get_store(store.pk).city.name == "RenamedCity"
+
+    store.delete()
+    assert reference.get_store(store.pk) is None
@@ -0,0 +1,75 @@
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from uuid import UUID
+
+import pytest
+from django.test import RequestFactory
+from django.utils.translation import gettext_lazy
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from catalog.models import City, Price, Product, ProductImage, Stock, Store, StoreCatalogEntry
+from catalog.projection import refresh_stores
+from catalog.renderers import ORJSONRenderer
+from catalog.serializers import ProductSerializer, StoreCatalogEntrySerializer, image_url
+
+
+@pytest.mark.parametrize('data', [
+    {'id': 1, 'name': 'Ноутбук «Про» 💻', 'description': None, 'images': [], 'price': '10.50', 'stock': 0},
+    [{'a': True, 'b': False, 'c': None}, [], {}, '', 'tab\t"quote"\\ \x00 \x1f \x7f'],
+    {'separators': 'line\u2028paragraph\u2029end', 'lazy': gettext_lazy('Not found.')},
+    {'decimal': Decimal('1.10'), 'uuid': UUID(int=1), 'big': 2 ** 70, 'negative': -2 ** 63},
+    {'datetime': datetime(2024, 5, 1, 12, 30, 15, 123456, tzinfo=dt_timezone.utc),
+     'naive': datetime(2024, 5, 1, 12, 30), 'date': date(2024, 5, 1), 'time': time(8, 0, 1, 500),
+     'delta': timedelta(seconds=90), 'tuple': (1, 2), 'set_like': frozenset()},
+    {1: 'int key'},
+])
+def test_orjson_renderer_matches_drf(data):
+    assert ORJSONRenderer().render(data) == JSONRenderer().render(data)
+
+
+def test_orjson_renderer_indent_and_empty():
+    renderer, drf = ORJSONRenderer(), JSONRenderer()
+    context = {'indent': 2}
+    assert renderer.render({'a': [1]}, 'application/json', context) == drf.render({'a': [1]}, 'application/json', context)
+    assert renderer.render({'a': 1}, 'application/json; indent=4') == drf.render({'a': 1}, 'application/json; indent=4')
+    assert renderer.render(None) == b''
+
+
+def drf_representation(serializer, instance):
+    # Эталон: обход полей Serializer.to_representation
+    return serializers.Serializer.to_representation(serializer, instance)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('with_store', [True, False])
+def test_compiled_serializers_match_drf(with_store):
+    city = City.objects.create(name="LeanCity")
+    store = Store.objects.create(name="LeanStore", city=city)
+    plain = Product.objects.create(name="Без цены", description=None)
+    priced = Product.objects.create(name="С ценой", description="Описание")
+    Price.objects.create(product=priced, store=store, amount=Decimal('12.30'))
+    Stock.objects.create(product=priced, store=store, quantity=7)
+    ProductImage.objects.create(product=priced, image_data='aGVsbG8=')
+    ProductImage.objects.create(product=plain, image_data='Z2VuZXJpYw==')
+    ProductImage.objects.create(product=plain, city=city, image_data='Y2l0eQ==')
+    refresh_stores([store.pk])
+
+    request = Request(RequestFactory().get('/api/v1/catalog/'))
+    context = {'request': request, 'store': store if with_store else None}
+    products = list(Product.objects.with_store_data(store if with_store else None).order_by('id'))
+    serializer = ProductSerializer(products, many=True, context=context)
+    expected = [drf_representation(serializer.child, product) for product in products]
+    assert serializer.data == expected
+    assert ORJSONRenderer().render(serializer.data) == JSONRenderer().render(expected)
+    for item in expected:
+        assert [image['url'] for image in item['images']] == [image_url(image['hash'], request) for image in item['images']]
+    if with_store:
+        assert [len(item['images']) for item in expected] == [1, 1]
+        assert expected[1]['price'] == '12.30' and expected[0]['price'] is None
+
+    entries = StoreCatalogEntry.objects.filter(store=store).order_by('product_id')
+    serializer = StoreCatalogEntrySerializer(entries, many=True, context={'request': request})
+    assert serializer.data == [drf_representation(serializer.child, entry) for entry in entries]
+    assert serializer.data[0]['images'][0]['url'].startswith('http://testserver/api/v1/images/')
@@ -0,0 +1,151 @@
+import pytest
+from django.contrib.auth.models import User
+from django.db import OperationalError
+from rest_framework.test import APIClient
+
+from catalog import tasks
+from catalog.metrics import render_metrics
+from catalog.models import City, Product, Stock, Store
+from catalog.rate_limits import acquire_rows
+from testProject.celery import app as celery_app
+
+CHUNK_TASK = 'catalog.tasks.apply_stock_chunk_task'
+
+
+def make_feed(username):
+    User.objects.create_user(username=username, password='feedpass')
+    city = City.objects.create(name=f"City {username}")
+    store = Store.objects.create(name=f"Store {username}", city=city)
+    products = [Product.objects.create(name=f"{username} product {i}") for i in range(3)]
+
+    client = APIClient()
+    token_resp = client.post('/api/v1/token/', {'username': username, 'password': 'feedpass'}, format='json')
+    client.credentials(HTTP_AUTHORIZATION='Bearer ' + token_resp.data['access'])
+    return client, [{"product_id": p.id, "store_id": store.id, "quantity": 5} for p in products]
+
+
+@pytest.fixture
+def store_eager_results(monkeypatch):
+    # Результаты eager-задач — в CELERY_RESULT_BACKEND, как у воркера (настройка
+    # task_store_eager_result читается задачей один раз, при привязке к приложению)
+    monkeypatch.setattr(tasks.apply_stock_chunk_task, 'store_eager_result', True)
+    monkeypatch.setattr(celery_app.conf, 'task_store_eager_result', True)
+
+
+@pytest.fixture
+def eager_retries():
+    # При task_eager_propagates Retry пробрасывается наружу; без него eager-задача
+    # повторяется сразу (countdown не ждётся), как повторил бы воркер
+    celery_app.conf.task_eager_propagates = False
+    yield
+
+
+def test_stock_tasks_routed_to_own_queue():
+    router = celery_app.amqp.router
+    assert router.route({}, CHUNK_TASK)['queue'].name == 'stocks'
+    assert router.route({}, 'catalog.tasks.bulk_update_stocks_task')['queue'].name == 'stocks'
+    assert router.route({}, 'catalog.tasks.flush_view_counts_task')['queue'].name == 'default'
+
+
+def test_acquire_rows_limits_rows_per_second():
+    # 100 строк при 100 строк/с занимают секунду квоты, запас — полсекунды
+    assert acquire_rows('test', 100, rate=100, burst=0.5) == 0.0
+    wait = acquire_rows('test', 1, rate=100, burst=0.5)
+    assert 0 < wait <= 0.5
+    # без ограничения
+    assert acquire_rows('test', 10 ** 6, rate=0) == 0.0
+
+
+@pytest.mark.django_db
+def test_task_status_endpoint(store_eager_results, settings):
+    """
+    /api/v1/tasks/<id>: задание целиком по job id и отдельная пачка по id задачи Celery —
+    только автору задания и staff.
+    """
+    settings.STOCK_UPDATE_CHUNK_SIZE = 2
+    client, update_data = make_feed('tasks')
+    resp = client.post('/api/v1/catalog/update/stocks', update_data, format='json')
+    job_id = resp.json()["task_id"]
+
+    job = client.get(f'/api/v1/tasks/{job_id}').json()
+    assert job["state"] == "SUCCESS"
+    assert [chunk["task_id"] for chunk in job["chunks"]] == [f'{job_id}.0', f'{job_id}.1']
+
+    resp = client.get(f'/api/v1/tasks/{job_id}.1')
+    assert resp.status_code == 200
+    chunk = resp.json()
+    assert chunk["state"] == "SUCCESS"
+    assert chunk["result"] == {"inserted": 1, "updated": 0, "unchanged": 0, "skipped": 0}
+    assert chunk["date_done"]
+
+    assert client.get('/api/v1/tasks/unknown-task').status_code == 404
+    assert APIClient().get(f'/api/v1/tasks/{job_id}').status_code == 401
+
+    # Чужое задание и его пачки не видны; staff видит любые задачи
+    stranger, _ = make_feed('stranger')
+    assert stranger.get(f'/api/v1/tasks/{job_id}').status_code == 404
+    assert stranger.get(f'/api/v1/tasks/{job_id}.1').status_code == 404
+    assert stranger.get(f'/api/v1/catalog/update/stocks/{job_id}').status_code == 404
+
+    staff, _ = make_feed('staff')
+    staff_user = User.objects.get(username='staff')
+    staff_user.is_staff = True
+    staff_user.save()
+    assert staff.get(f'/api/v1/tasks/{job_id}').json()["state"] == "SUCCESS"
+    assert staff.get(f'/api/v1/tasks/{job_id}.1').json()["state"] == "SUCCESS"
+    assert staff.get('/api/v1/tasks/unknown-task').json()["state"] == "PENDING"
+
+
+@pytest.mark.django_db
+def test_stock_chunk_retries_and_task_metrics(eager_retries, monkeypatch):
+    """
+    Пачка повторяется, пока не получит квоту, и после ошибки соединения с БД;
+    длительность, строки и повторы попадают в /metrics.
+    """
+    waits = iter([0.5])
+    monkeypatch.setattr(tasks, 'acquire_rows', lambda *args: next(waits, 0.0))
+    upsert = tasks.upsert_stock_rows
+    failures = iter([OperationalError('connection lost')])
+
+    def flaky_upsert(rows):
+        failure = next(failures, None)
+        if failure:
+            raise failure
+        return upsert(rows)
+
+    monkeypatch.setattr(tasks, 'upsert_stock_rows', flaky_upsert)
+
+    client, update_data = make_feed('retries')
+    job_id = client.post('/api/v1/catalog/update/stocks', update_data, format='json').json()["task_id"]
+    job = client.get(f'/api/v1/tasks/{job_id}').json()
+    assert job["state"] == "SUCCESS"
+    assert job["totals"]["inserted"] == 3
+    assert Stock.objects.filter(quantity=5).count() == 3
+
+    text = render_metrics()
+    labels = f'task="{CHUNK_TASK}"'
+    assert f'catalog_task_retries_total{{{labels},reason="RateLimited"}} 1' in text
+    assert f'catalog_task_retries_total{{{labels},reason="OperationalError"}} 1' in text
+    assert f'catalog_task_runs_total{{{labels},state="RETRY"}} 2' in text
+    assert f'catalog_task_runs_total{{{labels},state="SUCCESS"}} 1' in text
+    assert f'catalog_task_rows_total{{{labels}}} 3' in text
+    assert f'catalog_task_duration_seconds_count{{{labels}}} 3' in text
+    assert '# TYPE catalog_task_rows_per_second gauge' in text
+
+
+@pytest.mark.django_db
+def test_stock_chunk_fails_after_db_retries(eager_retries, monkeypatch):
+    def broken_upsert(rows):
+        raise OperationalError('connection lost')
+
+    monkeypatch.setattr(tasks, 'upsert_stock_rows', broken_upsert)
+    client, update_data = make_feed('broken')
+    job_id = client.post('/api/v1/catalog/update/stocks', update_data, format='json').json()["task_id"]
+    job = client.get(f'/api/v1/tasks/{job_id}').json()
+    assert job["state"] == "FAILURE"
+    assert job["chunks"][0]["result"] == {"error": "OperationalError('connection lost')"}
+
+    text = render_metrics()
+    labels = f'task="{CHUNK_TASK}"'
+    assert f'catalog_task_retries_total{{{labels},reason="OperationalError"}} {tasks.STOCK_DB_RETRIES}' in text
+    assert f'catalog_task_runs_total{{{labels},state="FAILURE"}} 1' in text
@@ -1,9 +1,18 @@
-from django.urls import path
-from catalog.views import CatalogListView, ProductDetailView, ProductSearchView, StockUpdateView
+from django.urls import path, re_path
+from catalog.async_views import (
+    AsyncCatalogListView, AsyncProductDetailView, AsyncProductMultiGetView, AsyncProductSearchView,
+)
+from catalog.views import CatalogChangesView, StockUpdateView, StockUpdateStatusView, ProductImageView, TaskStatusView
 
 urlpatterns = [
-    path('catalog/', CatalogListView.as_view(), name='catalog'),
-    path('product/<int:pk>/', ProductDetailView.as_view(), name='product-detail'),
-    path('search/', ProductSearchView.as_view(), name='product-search'),
+    # Чтение каталога — async views (ASGI), лента изменений, запись и статусы — синхронные DRF views
+    path('catalog/', AsyncCatalogListView.as_view(), name='catalog'),
+    path('catalog/changes', CatalogChangesView.as_view(), name='catalog-changes'),
+    path('product/<int:pk>/', AsyncProductDetailView.as_view(), name='product-detail'),
+    path('products/', AsyncProductMultiGetView.as_view(), name='product-multi-get'),
+    path('search/', AsyncProductSearchView.as_view(), name='product-search'),
     path('catalog/update/stocks', StockUpdateView.as_view(), name='stock-update'),
+    path('catalog/update/stocks/<str:task_id>', StockUpdateStatusView.as_view(), name='stock-update-status'),
+    path('tasks/<str:task_id>', TaskStatusView.as_view(), name='task-status'),
+    re_path(r'^images/(?P<content_hash>[0-9a-f]{64})$', ProductImageView.as_view(), name='product-image'),
 ]
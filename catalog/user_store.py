@@ -0,0 +1,77 @@
+"""
+Кэш связи пользователь -> id магазина в Redis, чтобы запросы каталога не ходили в БД
+за профилем; сам магазин (с городом) — из справочника процесса (catalog.reference).
+Сбрасывается сигналами при изменении UserProfile и Store.
+
+Магазин пользователя также записан в claims его JWT (catalog.authentication) вместе
+с версией: сброс увеличивает версию, и токены со старой версией считаются устаревшими.
+"""
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django_redis import get_redis_connection
+
+from .async_redis import get_async_redis
+from .models import UserProfile
+from .reference import aget_store, get_store
+
+USER_STORE_KEY = 'catalog:user-store:{}'
+USER_STORE_TIMEOUT = 60 * 60
+USER_STORE_VERSION_KEY = 'catalog:user-store-version:{}'
+# В кэше хранится False, если магазина у пользователя нет (None cache.get не отличит от промаха)
+_NO_STORE = False
+
+
+def _profile_store_id(user_id):
+    # Кэш живёт USER_STORE_TIMEOUT: профиль читается с primary, а не с отстающей реплики
+    return UserProfile.objects.using(DEFAULT_DB_ALIAS).filter(user_id=user_id).values_list('store_id', flat=True)
+
+
+def get_user_store(user_id):
+    key = USER_STORE_KEY.format(user_id)
+    store_id = cache.get(key)
+    if store_id is None:
+        store_id = _profile_store_id(user_id).first()
+        store_id = store_id or _NO_STORE
+        cache.set(key, store_id, USER_STORE_TIMEOUT)
+    return get_store(store_id) if store_id else None
+
+
+async def aget_user_store(user_id):
+    key = USER_STORE_KEY.format(user_id)
+    store_id = await cache.aget(key)
+    if store_id is None:
+        store_id = await _profile_store_id(user_id).afirst()
+        store_id = store_id or _NO_STORE
+        await cache.aset(key, store_id, USER_STORE_TIMEOUT)
+    return await aget_store(store_id) if store_id else None
+
+
+def user_store_version(user_id):
+    version = get_redis_connection('default').get(USER_STORE_VERSION_KEY.format(user_id))
+    return int(version) if version else 0
+
+
+async def auser_store_version(user_id):
+    version = await get_async_redis().get(USER_STORE_VERSION_KEY.format(user_id))
+    return int(version) if version else 0
+
+
+def forget_user_stores(user_ids):
+    """
+    Сбрасывает кэш и версию магазина пользователей. Как и bump_store_versions: сразу
+    и ещё раз после коммита, чтобы не пережить чтение профиля до коммита.
+    """
+    user_ids = set(user_ids)
+    if not user_ids:
+        return
+
+    def forget():
+        cache.delete_many([USER_STORE_KEY.format(user_id) for user_id in user_ids])
+        pipe = get_redis_connection('default').pipeline()
+        for user_id in user_ids:
+            pipe.incr(USER_STORE_VERSION_KEY.format(user_id))
+        pipe.execute()
+
+    forget()
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(forget)
@@ -0,0 +1,156 @@
+"""
+Быстрая валидация фида остатков для StockUpdateView.
+
+StockUpdateSerializer(many=True) строит дерево полей и структуры ошибок на каждый элемент,
+что на 100k строк стоит секунды CPU. Здесь те же правила (IntegerField, id от 1 до границы
+bigint, quantity >= 0) проверяются в одном цикле, ошибки отдаются в формате ListSerializer:
+список по индексам, {} для валидных элементов.
+"""
+import re
+
+from rest_framework import serializers
+from rest_framework.settings import api_settings
+
+STOCK_FIELDS = ('product_id', 'store_id', 'quantity')
+# Верхняя граница PositiveIntegerField в PostgreSQL
+MAX_QUANTITY = 2147483647
+# id товара и магазина — bigint: больше не дойдёт до запроса без ошибки БД
+MAX_ID = 2 ** 63 - 1
+
+_integer_messages = serializers.IntegerField.default_error_messages
+_field_messages = serializers.Field.default_error_messages
+_re_decimal = serializers.IntegerField.re_decimal
+
+REQUIRED = str(_field_messages['required'])
+NULL = str(_field_messages['null'])
+INVALID = str(_integer_messages['invalid'])
+MAX_STRING_LENGTH = str(_integer_messages['max_string_length'])
+MIN_QUANTITY = str(_integer_messages['min_value']).format(min_value=0)
+MAX_QUANTITY_MESSAGE = str(_integer_messages['max_value']).format(max_value=MAX_QUANTITY)
+MIN_ID_MESSAGE = str(_integer_messages['min_value']).format(min_value=1)
+MAX_ID_MESSAGE = str(_integer_messages['max_value']).format(max_value=MAX_ID)
+NOT_A_DICT = str(serializers.Serializer.default_error_messages['invalid'])
+NOT_A_LIST = str(serializers.ListField.default_error_messages['not_a_list'])
+COLUMNS_LENGTH = 'All columns must have the same length.'
+
+_missing = object()
+
+
+def _to_integer(value):
+    """
+    Повторяет IntegerField.run_validation: возвращает (число, None) или (None, сообщение).
+    """
+    if value is _missing:
+        return None, REQUIRED
+    if value is None:
+        return None, NULL
+    if isinstance(value, str) and len(value) > serializers.IntegerField.MAX_STRING_LENGTH:
+        return None, MAX_STRING_LENGTH
+    try:
+        return int(_re_decimal.sub('', str(value))), None
+    except (ValueError, TypeError):
+        return None, INVALID
+
+
+def _validate_values(values):
+    """
+    Медленный путь для строки, не прошедшей быструю проверку: (строка, None) или (None, ошибки).
+    """
+    row, errors = [], {}
+    for name, value in zip(STOCK_FIELDS, values):
+        number, message = _to_integer(value)
+        if message is None and name == 'quantity':
+            if number < 0:
+                message = MIN_QUANTITY
+            elif number > MAX_QUANTITY:
+                message = MAX_QUANTITY_MESSAGE
+        elif message is None:
+            if number < 1:
+                message = MIN_ID_MESSAGE
+            elif number > MAX_ID:
+                message = MAX_ID_MESSAGE
+        if message is not None:
+            errors[name] = [message]
+        row.append(number)
+    if errors:
+        return None, errors
+    return tuple(row), None
+
+
+def _raise_for_errors(size, errors):
+    if errors:
+        details = [{} for _ in range(size)]
+        for index, error in errors.items():
+            details[index] = error
+        raise serializers.ValidationError(details)
+
+
+def validate_stock_rows(items):
+    """
+    Проверяет список {product_id, store_id, quantity}.
+    Возвращает список строк (product_id, store_id, quantity) или бросает ValidationError.
+    """
+    rows = []
+    errors = {}
+    append = rows.append
+    for index, item in enumerate(items):
+        if type(item) is dict:
+            product_id = item.get('product_id', _missing)
+            store_id = item.get('store_id', _missing)
+            quantity = item.get('quantity', _missing)
+            # Быстрый путь: JSON уже дал int-ы (bool отсекается сравнением типов)
+            if (type(product_id) is int and type(store_id) is int and type(quantity) is int
+                    and 0 < product_id <= MAX_ID and 0 < store_id <= MAX_ID
+                    and 0 <= quantity <= MAX_QUANTITY):
+                append((product_id, store_id, quantity))
+                continue
+            row, error = _validate_values((product_id, store_id, quantity))
+        else:
+            row = None
+            error = {api_settings.NON_FIELD_ERRORS_KEY: [NOT_A_DICT.format(datatype=type(item).__name__)]}
+
+        if error:
+            errors[index] = error
+        else:
+            append(row)
+
+    _raise_for_errors(len(items), errors)
+    return rows
+
+
+def validate_stock_columns(data):
+    """
+    Проверяет колоночный формат {"product_id": [...], "store_id": [...], "quantity": [...]}.
+    Ошибки значений отдаются по индексу строки, как для списка объектов.
+    """
+    errors = {}
+    for name in STOCK_FIELDS:
+        column = data.get(name, _missing)
+        if column is _missing:
+            errors[name] = [REQUIRED]
+        elif not isinstance(column, list):
+            errors[name] = [NOT_A_LIST.format(input_type=type(column).__name__)]
+    if errors:
+        raise serializers.ValidationError(errors)
+
+    columns = [data[name] for name in STOCK_FIELDS]
+    if len({len(column) for column in columns}) > 1:
+        raise serializers.ValidationError({api_settings.NON_FIELD_ERRORS_KEY: [COLUMNS_LENGTH]})
+
+    rows = []
+    errors = {}
+    append = rows.append
+    for index, (product_id, store_id, quantity) in enumerate(zip(*columns)):
+        if (type(product_id) is int and type(store_id) is int and type(quantity) is int
+                and 0 < product_id <= MAX_ID and 0 < store_id <= MAX_ID
+                and 0 <= quantity <= MAX_QUANTITY):
+            append((product_id, store_id, quantity))
+            continue
+        row, error = _validate_values((product_id, store_id, quantity))
+        if error:
+            errors[index] = error
+        else:
+            append(row)
+
+    _raise_for_errors(len(columns[0]), errors)
+    return rows
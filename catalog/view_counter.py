@@ -0,0 +1,211 @@
+"""
+Write-behind счётчик просмотров товаров.
+
+Каждый просмотр — HINCRBY в Redis-хэше (без записи в Postgres).
+Периодическая задача flush_view_counts_task переносит накопленные дельты в БД
+одним UPDATE ... SET view_count = view_count + delta (только Product: каталог читает
+view_count оттуда же).
+"""
+import uuid
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django_redis import get_redis_connection
+
+from .async_redis import get_async_redis
+from .models import Product, ViewCountFlush
+
+PENDING_KEY = 'catalog:views:pending'
+# Дельты, которые сейчас переносятся в БД (или не перенеслись из-за ошибки)
+FLUSHING_KEY = 'catalog:views:flushing'
+# Те же дельты после UPDATE, перед коммитом: читатели их уже не прибавляют
+FLUSHED_KEY = 'catalog:views:flushed'
+# id переноса дельт из FLUSHING_KEY / FLUSHED_KEY (ViewCountFlush.flush_id)
+FLUSH_ID_KEY = 'catalog:views:flush-id'
+FLUSH_LOCK_KEY = 'catalog:views:flush-lock'
+FLUSH_LOCK_TIMEOUT = 300
+# Сколько хранить применённые id: повтор flush приходит следующим запуском задачи
+FLUSH_ID_RETENTION = timedelta(days=1)
+
+# Новые дельты для переноса (если прошлый перенос не завершён — его же) и их id.
+# KEYS: pending, flushing, flush-id; ARGV: id для нового переноса
+_CLAIM = """
+if redis.call('EXISTS', KEYS[2]) == 0 then
+    if redis.call('EXISTS', KEYS[1]) == 0 then
+        return false
+    end
+    redis.call('RENAME', KEYS[1], KEYS[2])
+    redis.call('SET', KEYS[3], ARGV[1])
+end
+local flush_id = redis.call('GET', KEYS[3])
+if not flush_id then
+    redis.call('SET', KEYS[3], ARGV[1])
+    flush_id = ARGV[1]
+end
+return flush_id
+"""
+# Переименование хэша KEYS[1] -> KEYS[2], только если это перенос с id ARGV[1].
+# KEYS: source, destination, flush-id
+_MOVE = """
+if redis.call('GET', KEYS[3]) == ARGV[1] and redis.call('EXISTS', KEYS[1]) == 1 then
+    redis.call('RENAME', KEYS[1], KEYS[2])
+    return 1
+end
+return 0
+"""
+# Удаление применённых дельт, только если это перенос с id ARGV[1]. KEYS: flushed, flush-id
+_FORGET = """
+if redis.call('GET', KEYS[2]) == ARGV[1] then
+    redis.call('DEL', KEYS[1], KEYS[2])
+    return 1
+end
+return 0
+"""
+
+_FLUSH_SQL = f"""
+WITH applied AS (
+    INSERT INTO {ViewCountFlush._meta.db_table} (flush_id, applied_at) VALUES (%s, now())
+    ON CONFLICT (flush_id) DO NOTHING
+    RETURNING flush_id
+), expired AS (
+    DELETE FROM {ViewCountFlush._meta.db_table} WHERE applied_at < now() - %s
+)
+UPDATE {Product._meta.db_table} AS p
+SET view_count = p.view_count + d.delta
+FROM unnest(%s::bigint[], %s::bigint[]) AS d(id, delta)
+WHERE p.id = d.id AND EXISTS (SELECT 1 FROM applied)
+"""
+
+
+def _redis():
+    return get_redis_connection('default')
+
+
+def record_view(product_id):
+    """
+    Засчитывает просмотр товара и возвращает число ещё не сохранённых в БД просмотров.
+    """
+    pipe = _redis().pipeline()
+    pipe.hincrby(PENDING_KEY, product_id, 1)
+    pipe.hget(FLUSHING_KEY, product_id)
+    pending, flushing = pipe.execute()
+    return pending + int(flushing or 0)
+
+
+async def arecord_view(product_id):
+    pipe = get_async_redis().pipeline()
+    pipe.hincrby(PENDING_KEY, product_id, 1)
+    pipe.hget(FLUSHING_KEY, product_id)
+    pending, flushing = await pipe.execute()
+    return pending + int(flushing or 0)
+
+
+def record_views(product_ids):
+    """
+    Засчитывает по просмотру каждому товару одним pipeline (один round trip).
+    Возвращает {product_id: не сохранённые в БД просмотры}.
+    """
+    product_ids = list(product_ids)
+    if not product_ids:
+        return {}
+    pipe = _redis().pipeline()
+    _add_views(pipe, product_ids)
+    return _pending_counts(product_ids, pipe.execute())
+
+
+async def arecord_views(product_ids):
+    product_ids = list(product_ids)
+    if not product_ids:
+        return {}
+    pipe = get_async_redis().pipeline()
+    _add_views(pipe, product_ids)
+    return _pending_counts(product_ids, await pipe.execute())
+
+
+def _add_views(pipe, product_ids):
+    for product_id in product_ids:
+        pipe.hincrby(PENDING_KEY, product_id, 1)
+    pipe.hmget(FLUSHING_KEY, product_ids)
+
+
+def _pending_counts(product_ids, results):
+    *pending, flushing = results
+    return {
+        product_id: p + int(f or 0)
+        for product_id, p, f in zip(product_ids, pending, flushing)
+    }
+
+
+def pending_views(product_ids):
+    """
+    Не сохранённые в БД просмотры для списка товаров: {product_id: count}.
+    """
+    product_ids = list(product_ids)
+    if not product_ids:
+        return {}
+    pipe = _redis().pipeline()
+    pipe.hmget(PENDING_KEY, product_ids)
+    pipe.hmget(FLUSHING_KEY, product_ids)
+    pending, flushing = pipe.execute()
+    return {
+        product_id: int(p or 0) + int(f or 0)
+        for product_id, p, f in zip(product_ids, pending, flushing)
+    }
+
+
+def flush_view_counts():
+    """
+    Переносит накопленные просмотры в Postgres. Возвращает число обновлённых товаров.
+
+    Хэш атомарно переименовывается, так что новые просмотры во время flush
+    копятся в новом хэше. Каждый перенос получает id, который записывается
+    в ViewCountFlush в той же транзакции, что и UPDATE: дельты переноса с уже
+    записанным id повторно не прибавляются. Перед коммитом дельты убираются
+    из FLUSHING_KEY (читатели больше не прибавляют их к значению из БД),
+    после коммита удаляются. Если предыдущий flush упал, его дельты
+    переносятся (или, если он успел закоммитить, удаляются) при следующем запуске.
+    """
+    redis = _redis()
+    with redis.lock(FLUSH_LOCK_KEY, timeout=FLUSH_LOCK_TIMEOUT):
+        _recover(redis)
+        flush_id = redis.eval(_CLAIM, 3, PENDING_KEY, FLUSHING_KEY, FLUSH_ID_KEY, str(uuid.uuid4()))
+        if flush_id is None:
+            # Нет ни одного нового просмотра
+            return 0
+        flush_id = flush_id.decode()
+
+        deltas = redis.hgetall(FLUSHING_KEY)
+        ids = [int(product_id) for product_id in deltas]
+        values = [int(delta) for delta in deltas.values()]
+
+        try:
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    cursor.execute(_FLUSH_SQL, [flush_id, FLUSH_ID_RETENTION, ids, values])
+                    updated = cursor.rowcount
+                _move(redis, FLUSHING_KEY, FLUSHED_KEY, flush_id)
+        except BaseException:
+            # Коммита не было (или его исход неизвестен — повтор тогда ничего не добавит)
+            _move(redis, FLUSHED_KEY, FLUSHING_KEY, flush_id)
+            raise
+        redis.eval(_FORGET, 2, FLUSHED_KEY, FLUSH_ID_KEY, flush_id)
+        return updated
+
+
+def _move(redis, source, destination, flush_id):
+    redis.eval(_MOVE, 3, source, destination, FLUSH_ID_KEY, flush_id)
+
+
+def _recover(redis):
+    """
+    Дельты, оставшиеся в FLUSHED_KEY после падения между UPDATE и очисткой Redis:
+    удаляются, если транзакция с их id закоммичена, иначе возвращаются в FLUSHING_KEY.
+    """
+    flush_id = redis.get(FLUSH_ID_KEY)
+    if flush_id is None or not redis.exists(FLUSHED_KEY):
+        return
+    flush_id = flush_id.decode()
+    if ViewCountFlush.objects.filter(flush_id=flush_id).exists():
+        redis.eval(_FORGET, 2, FLUSHED_KEY, FLUSH_ID_KEY, flush_id)
+    else:
+        _move(redis, FLUSHED_KEY, FLUSHING_KEY, flush_id)
@@ -1,108 +1,483 @@
+import uuid
+from functools import cached_property
+from celery import group
+from celery.result import AsyncResult
+from django.conf import settings
 from django.db import transaction
-from django.contrib.postgres.search import SearchVector, SearchQuery, SearchRank
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.crypto import constant_time_compare
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework import status, generics
-from .models import Product, Stock
-from .serializers import ProductSerializer, StockUpdateSerializer
-from django.core.cache import cache
-from django.db.models import Q, Case, When, IntegerField, ExpressionWrapper
-from .tasks import bulk_update_stocks_task
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.urls import replace_query_param
+from .models import Product, StoreCatalogEntry
+from .serializers import ProductSerializer, StoreCatalogEntrySerializer
+from .renderers import ORJSONRenderer
+from .pagination import KeysetPagination
+from .parsers import NDJSONParser
+from .search import SEARCH_ORDERING, search_catalog
+from . import compression, product_fragments, response_cache, stock_jobs
+from .changes import ChangesExpired, changes_page, get_positions
+from .stocks import plan_stock_chunks
+from .tasks import apply_stock_chunk_task
+from .validators import validate_stock_columns, validate_stock_rows
+from .view_counter import record_view, record_views
+from .images import get_image, safe_content_type
+from .metrics import render_metrics
+from .authentication import get_request_store, user_is_staff
+from .conditional import (
+    catalog_validators, is_conditional, loaded_product_version, not_modified, product_validators,
+    product_version_queryset, product_versions_queryset, search_validators, set_validators,
+)
 
-class CatalogListView(generics.ListAPIView):
+class StoreContextMixin:
+    """
+    Резолвит store пользователя (вместе с city) один раз на запрос
+    и передаёт его в контекст сериализатора.
+    """
+
+    @cached_property
+    def store(self):
+        return get_request_store(self.request.user)
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['store'] = self.store
+        return context
+
+
+class StreamingListMixin:
+    """
+    ?stream=1 — отдаёт весь список JSON-массивом через StreamingHttpResponse,
+    сериализуя товары пачками по stream_chunk_size (queryset.iterator(chunk_size)),
+    чтобы память воркера не зависела от размера каталога.
+    """
+    stream_query_param = 'stream'
+    stream_chunk_size = 200
+
+    def list(self, request, *args, **kwargs):
+        if request.query_params.get(self.stream_query_param) in ('1', 'true'):
+            queryset = self.filter_queryset(self.get_queryset())
+            response = StreamingHttpResponse(self.stream_json(queryset), content_type='application/json')
+            # отключаем буферизацию ответа на nginx
+            response['X-Accel-Buffering'] = 'no'
+            return response
+        return super().list(request, *args, **kwargs)
+
+    def stream_json(self, queryset):
+        renderer = ORJSONRenderer()
+        yield b'['
+        chunk, first = [], True
+        for obj in queryset.iterator(chunk_size=self.stream_chunk_size):
+            chunk.append(obj)
+            if len(chunk) == self.stream_chunk_size:
+                yield (b'' if first else b',') + self.render_chunk(renderer, chunk)
+                chunk, first = [], False
+        if chunk:
+            yield (b'' if first else b',') + self.render_chunk(renderer, chunk)
+        yield b']'
+
+    def render_chunk(self, renderer, objects):
+        # рендерим пачку как JSON-массив и срезаем внешние скобки
+        return renderer.render(self.get_serializer(objects, many=True).data)[1:-1]
+
+
+class CachedCatalogPageMixin:
+    """
+    Отдаёт страницу каталога магазина из Redis (catalog.response_cache): ключ — магазин, город,
+    курсор/limit и версия магазина, которую увеличивают записи в его каталог.
+    При попадании в кэш Postgres не запрашивается. Кэшируется только JSON-ответ; сжатый по
+    Accept-Encoding вариант хранится рядом и отдаётся без повторного сжатия.
+    Та же версия — ETag ответа: совпавший If-None-Match получает 304 без чтения страницы.
+    """
+
+    def list(self, request, *args, **kwargs):
+        if (self.store is None
+                or request.query_params.get(self.stream_query_param) in ('1', 'true')
+                or not isinstance(request.accepted_renderer, JSONRenderer)):
+            return super().list(request, *args, **kwargs)
+
+        version, modified = response_cache.store_validators(self.store.pk)
+        validators = catalog_validators(self.store, version, modified)
+        response = not_modified(request, *validators)
+        if response is not None:
+            return response
+
+        key = response_cache.page_key(
+            self.store,
+            request.get_host(),
+            request.query_params.get(self.paginator.cursor_query_param),
+            request.query_params.get(self.paginator.page_size_query_param),
+            version=version,
+        )
+        content, hit, encoding = response_cache.get_or_build(
+            key, lambda: self.render_page(request, *args, **kwargs), compression.accepted_encoding(request),
+        )
+        response = HttpResponse(content, content_type=request.accepted_renderer.media_type)
+        response['X-Cache'] = 'HIT' if hit else 'MISS'
+        set_validators(response, *validators)
+        return compression.mark_encoded(response, encoding) if encoding else response
+
+    def render_page(self, request, *args, **kwargs):
+        data = super().list(request, *args, **kwargs).data
+        return request.accepted_renderer.render(data, request.accepted_media_type, self.get_renderer_context())
+
+
+class CatalogListView(StoreContextMixin, CachedCatalogPageMixin, StreamingListMixin, generics.ListAPIView):
     permission_classes = [IsAuthenticated]
-    serializer_class = ProductSerializer
+    serializer_class = StoreCatalogEntrySerializer
+    pagination_class = KeysetPagination
+    keyset_ordering = ('product_id',)
 
     def get_queryset(self):
-        user = self.request.user
-        store = user.profile.store if hasattr(user, 'profile') and user.profile.store else None
+        store = self.store
 
         # Фильтруем товары по наличию (Stock > 0)
         # Если store не назначен пользователю, возможно логика по умолчанию: пустой или все товары.
         # Допустим, если нет store - возвращаем пустой список.
         if not store:
-            return Product.objects.none()
+            return StoreCatalogEntry.objects.none()
+
+        # Проекция каталога (catalog.projection): цена, остаток и изображения уже собраны
+        # для магазина, страница — один range scan по индексу (store_id, product_id);
+        # view_count — из Product по первичному ключу в том же запросе (with_view_count)
+        return (
+            StoreCatalogEntry.objects.filter(store=store, quantity__gt=0)
+            .with_view_count().order_by('product_id')
+        )
+
+
+class CatalogChangesView(StoreContextMixin, APIView):
+    """
+    Лента изменений каталога магазина пользователя (catalog.changes).
+
+    Без since — только текущая позиция: клиент запоминает seq, читает каталог целиком
+    и дальше запрашивает ?since=<seq>. Ответ — изменившиеся товары после since в порядке
+    номеров: upsert с той же строкой, что в /catalog/, или delete (товара больше нет в каталоге
+    магазина), и seq для следующего запроса. 410 — since вне журнала, нужна полная синхронизация.
+    """
+    permission_classes = [IsAuthenticated]
+    page_size = 500
+    max_page_size = 5000
+
+    def get(self, request):
+        try:
+            since = request.query_params.get('since')
+            since = None if since is None else int(since)
+            limit = min(int(request.query_params.get('limit', self.page_size)), self.max_page_size)
+        except ValueError:
+            return Response({"detail": "since and limit must be integers."}, status=status.HTTP_400_BAD_REQUEST)
+        if limit < 1 or (since is not None and since < 0):
+            return Response({"detail": "since and limit must be positive."}, status=status.HTTP_400_BAD_REQUEST)
+
+        store = self.store
+        if since is None:
+            head = get_positions(store.pk)[0] if store else 0
+            return Response({"seq": head, "has_more": False, "next": None, "results": []})
+        if not store:
+            return Response({"seq": since, "has_more": False, "next": None, "results": []})
+
+        try:
+            page = changes_page(store.pk, since, limit)
+        except ChangesExpired as exc:
+            return Response(
+                {"detail": "Changes since this position are no longer available, resync the catalog.",
+                 "seq": exc.head},
+                status=status.HTTP_410_GONE,
+            )
 
-        # Получаем id товаров, которые есть в наличии в данном store
-        product_ids_with_stock = Stock.objects.filter(store=store, quantity__gt=0).values_list('product_id', flat=True)
-        return Product.objects.filter(id__in=product_ids_with_stock).select_related().prefetch_related('images', 'prices', 'stocks')
+        entries = [entry for _, _, entry in page['changes'] if entry is not None]
+        items = iter(StoreCatalogEntrySerializer(entries, many=True, context={'request': request}).data)
+        results = [
+            {"seq": seq, "id": product_id, "op": "upsert", "item": next(items)}
+            if entry is not None else
+            {"seq": seq, "id": product_id, "op": "delete", "item": None}
+            for seq, product_id, entry in page['changes']
+        ]
+        next_url = None
+        if page['has_more']:
+            next_url = replace_query_param(request.build_absolute_uri(), 'since', page['seq'])
+        return Response({"seq": page['seq'], "has_more": page['has_more'], "next": next_url, "results": results})
 
 
-class ProductDetailView(generics.RetrieveAPIView):
+class ProductDetailView(StoreContextMixin, generics.RetrieveAPIView):
     permission_classes = [IsAuthenticated]
     serializer_class = ProductSerializer
-    queryset = Product.objects.all()
+
+    def get_queryset(self):
+        return Product.objects.with_store_data(self.store)
 
     def get_object(self):
         product = super().get_object()
-        product.view_count += 1
-        product.save()
+        # Просмотр копится в Redis и переносится в БД задачей flush_view_counts_task;
+        # в ответе — сохранённые + ещё не перенесённые просмотры.
+        product.view_count += record_view(product.pk)
         return product
 
+    def retrieve(self, request, *args, **kwargs):
+        # Условный запрос: версия карточки одним запросом, при совпадении — 304 без загрузки
+        # товара (просмотр всё равно засчитывается)
+        if is_conditional(request):
+            version = product_version_queryset(kwargs['pk'], self.store).first()
+            if version is not None:
+                response = not_modified(request, *product_validators(kwargs['pk'], self.store, version))
+                if response is not None:
+                    record_view(kwargs['pk'])
+                    return response
+
+        product = self.get_object()
+        response = Response(self.get_serializer(product).data)
+        return set_validators(response, *product_validators(product.pk, self.store, loaded_product_version(product)))
+
+
+class ProductMultiGetView(StoreContextMixin, generics.GenericAPIView):
+    """
+    Несколько карточек товара за запрос: ?ids=1,2,3 (до PRODUCTS_MULTI_GET_MAX), для корзин
+    и избранного. Ответ — массив в порядке ids в формате /product/<pk>/, несуществующие id
+    пропускаются, каждому товару засчитывается просмотр.
+
+    Число запросов не зависит от числа товаров: версии карточек одним запросом, карточки —
+    из кэша фрагментов (catalog.product_fragments), промахи — одним with_store_data.
+    """
+    permission_classes = [IsAuthenticated]
+    serializer_class = ProductSerializer
+
+    def get_queryset(self):
+        return Product.objects.with_store_data(self.store)
+
+    def get_ids(self):
+        try:
+            ids = [int(value) for value in self.request.query_params.get('ids', '').split(',') if value.strip()]
+        except ValueError:
+            raise ValidationError({'ids': 'Expected comma-separated product ids.'})
+        ids = list(dict.fromkeys(ids))
+        if not ids or len(ids) > settings.PRODUCTS_MULTI_GET_MAX:
+            raise ValidationError({'ids': f'Expected 1 to {settings.PRODUCTS_MULTI_GET_MAX} product ids.'})
+        return ids
+
+    def fragment_keys(self, versions):
+        host = self.request.get_host()
+        return {
+            product_id: product_fragments.fragment_key(product_id, self.store, version, host)
+            for product_id, version, _ in versions
+        }
+
+    def render_fragments(self, products):
+        data = self.get_serializer(products, many=True).data
+        return {product.pk: product_fragments.render_fragment(item) for product, item in zip(products, data)}
+
+    def assemble(self, ids, versions, fragments, pending):
+        stored = {product_id: view_count for product_id, _, view_count in versions}
+        found = [product_id for product_id in ids if product_id in fragments]
+        return product_fragments.assemble(
+            [fragments[product_id] for product_id in found],
+            [stored[product_id] + pending[product_id] for product_id in found],
+        )
+
+    def get(self, request):
+        ids = self.get_ids()
+        versions = list(product_versions_queryset(ids, self.store))
+        keys = self.fragment_keys(versions)
+        fragments = product_fragments.get_many(keys)
 
-class ProductSearchView(generics.ListAPIView):
+        misses = [product_id for product_id in keys if product_id not in fragments]
+        if misses:
+            built = self.render_fragments(list(self.get_queryset().filter(pk__in=misses)))
+            product_fragments.set_many({keys[product_id]: fragment for product_id, fragment in built.items()})
+            fragments.update(built)
+
+        pending = record_views(fragments)
+        return HttpResponse(self.assemble(ids, versions, fragments, pending), content_type='application/json')
+
+
+class ProductSearchView(StoreContextMixin, StreamingListMixin, generics.ListAPIView):
     permission_classes = [IsAuthenticated]
     serializer_class = ProductSerializer
+    pagination_class = KeysetPagination
+    keyset_ordering = SEARCH_ORDERING
+
+    def list(self, request, *args, **kwargs):
+        if (request.query_params.get(self.stream_query_param) in ('1', 'true')
+                or not isinstance(request.accepted_renderer, JSONRenderer)):
+            return super().list(request, *args, **kwargs)
+
+        # Выдача меняется при любом изменении каталога: валидатор — версия каталога в целом
+        validators = search_validators(self.store, *response_cache.catalog_validators())
+        response = not_modified(request, *validators)
+        if response is None:
+            response = set_validators(super().list(request, *args, **kwargs), *validators)
+        return response
 
     def get_queryset(self):
         query_str = self.request.GET.get('q', '').strip()
-        user = self.request.user
-        store = getattr(getattr(user, 'profile', None), 'store', None)
+        store = self.store
 
         if not query_str:
             # Нет поискового запроса - пустой результат
             return Product.objects.none()
 
-        # Находим товары, в которых встречается подстрока query_str (нечувствительно к регистру)
-        # Используем Q для поиска по name или description:
-        qs = Product.objects.filter(
-            Q(name__icontains=query_str) | Q(description__icontains=query_str)
-        )
+        # Полнотекстовый поиск по name/description (префиксный) + триграммы для опечаток,
+        # только товары в наличии; товары в наличии в store пользователя — выше в списке
+        return search_catalog(query_str, store).with_store_data(store)
 
-        # Фильтруем только товары, у которых есть остатки в каком-либо магазине
-        qs = qs.filter(stocks__quantity__gt=0).distinct()
-
-        if store:
-            # Аннотируем товары полем, показывающим есть ли товар в user's store
-            qs = qs.annotate(
-                in_user_store=ExpressionWrapper(
-                    Case(
-                        When(stocks__store=store, stocks__quantity__gt=0, then=1),
-                        default=0,
-                        output_field=IntegerField()
-                    ),
-                    output_field=IntegerField()
-                )
-            ).order_by('-in_user_store')
-            # Товары у которых in_user_store=1 будут выше в списке.
-        else:
-            # Если у пользователя нет store, просто возвращаем товары, найденные по поиску и имеющие остаток.
-            # Можно добавить сортировку по имени или как удобно, но приоритет уже не требуется.
-            # qs = qs.order_by('name')  # например, по алфавиту, если нужно
-            pass
 
-        return qs
+class ProductImageView(APIView):
+    """
+    Бинарное изображение по sha256 содержимого. Адрес неизменяем (content-addressed),
+    поэтому ответ кэшируется клиентами и CDN без ограничений, повтор с If-None-Match — 304.
+    Без JWT: ссылки используются напрямую в <img>.
+    """
+    authentication_classes = []
+    permission_classes = [AllowAny]
+    cache_control = 'public, max-age=31536000, immutable'
+
+    def get(self, request, content_hash):
+        etag = f'"{content_hash}"'
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            not_modified['Cache-Control'] = self.cache_control
+            return not_modified
+
+        image = get_image(content_hash)
+        if image is None:
+            return Response({"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND)
+
+        content, content_type = image
+        response = HttpResponse(content, content_type=safe_content_type(content_type))
+        response['ETag'] = etag
+        response['Cache-Control'] = self.cache_control
+        # Браузер не угадывает тип по содержимому: octet-stream не исполнится как HTML
+        response['X-Content-Type-Options'] = 'nosniff'
+        return response
 
 
 class StockUpdateView(APIView):
+    """
+    Принимает список {product_id, store_id, quantity} (JSON-массив или NDJSON)
+    либо колоночный объект {"product_id": [...], "store_id": [...], "quantity": [...]}
+    и раскладывает его на пачки
+    (STOCK_UPDATE_CHUNK_SIZE строк, сгруппированы по магазину), которые обрабатываются
+    параллельно группой задач Celery. Заголовок Idempotency-Key (свой у каждого пользователя)
+    защищает от повторного применения того же запроса: повтор вернёт уже созданное задание.
+    """
     permission_classes = [IsAuthenticated]
+    parser_classes = [JSONParser, NDJSONParser]
 
     def post(self, request):
         data = request.data
-        if not isinstance(data, list):
+        # Вместо StockUpdateSerializer(many=True): те же правила и формат ошибок, без накладных
+        # расходов DRF на каждый элемент
+        if isinstance(data, list):
+            rows = validate_stock_rows(data)
+        elif isinstance(data, dict):
+            rows = validate_stock_columns(data)
+        else:
             return Response({"detail": "Invalid data format"}, status=status.HTTP_400_BAD_REQUEST)
 
-        serializer = StockUpdateSerializer(data=data, many=True)
-        serializer.is_valid(raise_exception=True)
-
-        validated_data = serializer.validated_data
+        job_id = str(uuid.uuid4())
+        chunks = plan_stock_chunks(rows, settings.STOCK_UPDATE_CHUNK_SIZE)
+        # Задание создаётся до того, как занят ключ идемпотентности: параллельный повтор
+        # получает id уже существующего задания
+        stock_jobs.create_job(job_id, chunks, request.user.pk)
+        idempotency_key = request.headers.get('Idempotency-Key')
+        if idempotency_key:
+            existing_job_id = stock_jobs.claim_idempotency_key(request.user.pk, idempotency_key, job_id)
+            if existing_job_id:
+                stock_jobs.delete_job(job_id)
+                return Response(
+                    {"detail": "Stocks update task already queued", "task_id": existing_job_id},
+                    status=status.HTTP_200_OK
+                )
 
-        # Отправляем задачу в очередь RabbitMQ
-        task = bulk_update_stocks_task.delay(validated_data)
+        # Отправляем пачки в очередь остатков (CELERY_TASK_ROUTES)
+        try:
+            if chunks:
+                group(
+                    apply_stock_chunk_task.s(job_id, index, chunk).set(task_id=stock_jobs.chunk_task_id(job_id, index))
+                    for index, chunk in enumerate(chunks)
+                ).apply_async()
+        except Exception:
+            if idempotency_key:
+                stock_jobs.release_idempotency_key(request.user.pk, idempotency_key)
+            stock_jobs.delete_job(job_id)
+            raise
 
         # Возвращаем быстрый ответ (202 Accepted)
         return Response(
-            {"detail": "Stocks update task queued", "task_id": task.id},
+            {"detail": "Stocks update task queued", "task_id": job_id, "chunks": len(chunks)},
             status=status.HTTP_202_ACCEPTED
         )
+
+
+class StockUpdateStatusView(APIView):
+    """
+    Прогресс задания на обновление остатков по task_id из StockUpdateView (только своего, staff — любого).
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, task_id):
+        job = stock_jobs.get_job(task_id, request.user)
+        if job is None:
+            return Response({"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(job)
+
+
+class TaskStatusView(APIView):
+    """
+    Статус фоновой задачи: задания на обновление остатков (id из StockUpdateView, прогресс по пачкам)
+    или пачки (task_id из задания) по результатам в CELERY_RESULT_BACKEND. Пользователь видит
+    только свои задания и их пачки, остальное — 404; staff — любую задачу Celery
+    (неизвестный бэкенду id отдаётся как PENDING).
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, task_id):
+        job = stock_jobs.get_job(task_id, request.user)
+        if job is not None:
+            return Response(job)
+        job_id, _, _ = task_id.rpartition('.')
+        if not (job_id and stock_jobs.job_visible(job_id, request.user)) and not user_is_staff(request.user):
+            return Response({"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND)
+
+        result = AsyncResult(task_id)
+        data = {
+            'task_id': task_id,
+            'state': result.state,
+            'name': result.name,
+            'date_done': result.date_done,
+            'retries': result.retries,
+        }
+        if result.successful():
+            data['result'] = result.result
+        elif result.failed():
+            data['error'] = repr(result.result)
+        return Response(data)
+
+
+def metrics_allowed(request):
+    """
+    /metrics — для scrape с METRICS_TOKEN (Authorization: Bearer) или для staff по сессии.
+    """
+    token = settings.METRICS_TOKEN
+    scheme, _, credentials = request.headers.get('Authorization', '').partition(' ')
+    if token and scheme.lower() == 'bearer' and constant_time_compare(credentials.strip(), token):
+        return True
+    return request.user.is_staff
+
+
+def metrics_view(request):
+    """
+    Метрики в формате Prometheus для scrape (catalog.metrics).
+    """
+    if not metrics_allowed(request):
+        if request.user.is_authenticated:
+            return HttpResponse(status=status.HTTP_403_FORBIDDEN)
+        response = HttpResponse(status=status.HTTP_401_UNAUTHORIZED)
+        response['WWW-Authenticate'] = 'Bearer realm="metrics"'
+        return response
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
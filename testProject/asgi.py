@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'testProject.settings')
 
 application = get_asgi_application()
+
+# Справочники City/Store загружаются в каждом воркере до первого запроса
+from catalog.reference import warm_reference  # noqa: E402
+
+warm_reference()
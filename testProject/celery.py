@@ -1,5 +1,6 @@
 import os
 from celery import Celery
+from celery.signals import worker_process_init
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'testProject.settings')
 
@@ -9,3 +10,10 @@ app = Celery('testProject')
 app.config_from_object('django.conf:settings', namespace='CELERY')
 
 app.autodiscover_tasks()
+
+
+@worker_process_init.connect
+def warm_reference_data(**kwargs):
+    # Справочники City/Store в памяти каждого процесса воркера (catalog.reference)
+    from catalog.reference import warm_reference
+    warm_reference()
@@ -40,12 +40,19 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     # new
     'rest_framework',
+    'django_celery_results',
     'catalog',
     'django.contrib.postgres',
 
 ]
 
 MIDDLEWARE = [
+    # Первым: время запроса включает все остальные middleware
+    'catalog.middleware.PerformanceMiddleware',
+    # Чтения с реплик и закрепление за primary после записи (catalog.db_routing)
+    'catalog.middleware.DatabaseRoutingMiddleware',
+    # gzip / brotli по Accept-Encoding (catalog.compression); видит ответ после всех остальных
+    'catalog.middleware.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -59,11 +66,17 @@ ROOT_URLCONF = 'testProject.urls'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # JWT с магазином в claims: пользователь без запроса к БД (catalog.authentication)
+        'catalog.authentication.StoreClaimsJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
+    'DEFAULT_RENDERER_CLASSES': (
+        # JSON через orjson, побайтно как rest_framework.renderers.JSONRenderer (catalog.renderers)
+        'catalog.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
 }
 
 SIMPLE_JWT = {
@@ -71,6 +84,9 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
     'ROTATE_REFRESH_TOKENS': True,
     'BLACKLIST_AFTER_ROTATION': True,
+    'TOKEN_OBTAIN_SERIALIZER': 'catalog.authentication.CatalogTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'catalog.authentication.CatalogTokenRefreshSerializer',
+    'TOKEN_USER_CLASS': 'catalog.authentication.CatalogTokenUser',
 }
 
 TEMPLATES = [
@@ -95,20 +111,54 @@ WSGI_APPLICATION = 'testProject.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
+# Постоянные соединения: DB_CONN_MAX_AGE секунд, перед повторным использованием соединение
+# проверяется (CONN_HEALTH_CHECKS). Под ASGI (web) каждый запрос исполняет sync-код в своём потоке
+# и соединения не переиспользуются — там DB_CONN_MAX_AGE=0 и пул PgBouncer (docker-compose);
+# Celery-воркеры держат соединения сами. За PgBouncer в режиме transaction серверные курсоры
+# (queryset.iterator в ?stream=1) отключаются: DB_DISABLE_SERVER_SIDE_CURSORS=1.
+DB_CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE', 0))
+DB_DISABLE_SERVER_SIDE_CURSORS = os.environ.get('DB_DISABLE_SERVER_SIDE_CURSORS', '0') == '1'
+
+
+def _database(host, port, **extra):
+    return {
         'ENGINE': 'django.db.backends.postgresql',
         'NAME': os.getenv('POSTGRES_DB'),
         'USER': os.getenv('POSTGRES_USER'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD'),
-        'HOST': os.getenv('POSTGRES_HOST'),
-        'PORT': os.getenv('POSTGRES_PORT'),
-        'TEST': {
+        'HOST': host,
+        'PORT': port,
+        'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': DB_CONN_MAX_AGE != 0,
+        'DISABLE_SERVER_SIDE_CURSORS': DB_DISABLE_SERVER_SIDE_CURSORS,
+        **extra,
+    }
+
+
+DATABASES = {
+    'default': _database(
+        os.getenv('POSTGRES_HOST'), os.getenv('POSTGRES_PORT'),
+        TEST={
             'NAME': 'test_mydb',  # Имя временной тестовой базы
         },
-    }
+    ),
 }
 
+# Реплики для чтения каталога: POSTGRES_REPLICA_HOSTS="host[:port],..." (порт по умолчанию —
+# POSTGRES_PORT), пользователь и база — как у primary. Маршрутизация — catalog.db_routing.
+# Локально реплику заменяет второй алиас на тот же сервер (POSTGRES_REPLICA_HOSTS=$POSTGRES_HOST);
+# в тестах реплики — зеркала тестовой базы.
+DATABASE_REPLICAS = []
+for _index, _replica in enumerate(filter(None, os.environ.get('POSTGRES_REPLICA_HOSTS', '').split(',')), 1):
+    _host, _, _port = _replica.strip().partition(':')
+    DATABASES[f'replica_{_index}'] = _database(_host, _port or os.getenv('POSTGRES_PORT'),
+                                               TEST={'MIRROR': 'default'})
+    DATABASE_REPLICAS.append(f'replica_{_index}')
+
+DATABASE_ROUTERS = ['catalog.db_routing.PrimaryReplicaRouter']
+# Сколько секунд после изменяющего запроса пользователь читает с primary (read-your-writes)
+DATABASE_REPLICA_STICKY_SECONDS = int(os.environ.get('DATABASE_REPLICA_STICKY_SECONDS', 10))
+
 REDIS_PASSWORD = os.environ.get('REDIS_PASSWORD', 'secret_redis_password')
 REDIS_HOST = os.environ.get('REDIS_HOST', 'redis')
 REDIS_PORT = os.environ.get('REDIS_PORT', '6379')
@@ -123,6 +173,50 @@ CACHES = {
     }
 }
 
+# Время жизни страниц каталога в кэше (сек); устаревшие страницы отсекаются версией магазина раньше
+CATALOG_CACHE_TIMEOUT = int(os.environ.get('CATALOG_CACHE_TIMEOUT', 300))
+
+# Сжатие ответов (catalog.compression): ответы меньше COMPRESSION_MIN_SIZE байт отдаются как есть;
+# уровни на лету — дешевле, для вариантов страниц в кэше (сжимаются один раз) — сильнее
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', 1024))
+COMPRESSION_CONTENT_TYPES = ('application/json', 'text/')
+# Потоковые ответы (?stream=1) сжимаются по фрагментам со сбросом после каждого
+COMPRESSION_STREAMING = os.environ.get('COMPRESSION_STREAMING', '1') == '1'
+COMPRESSION_GZIP_LEVEL = int(os.environ.get('COMPRESSION_GZIP_LEVEL', 6))
+COMPRESSION_BROTLI_QUALITY = int(os.environ.get('COMPRESSION_BROTLI_QUALITY', 4))
+COMPRESSION_CACHED_GZIP_LEVEL = int(os.environ.get('COMPRESSION_CACHED_GZIP_LEVEL', 9))
+COMPRESSION_CACHED_BROTLI_QUALITY = int(os.environ.get('COMPRESSION_CACHED_BROTLI_QUALITY', 9))
+# Время жизни сериализованных карточек товара (/api/v1/products/?ids=) в кэше (сек); изменённые
+# карточки отсекаются версией в ключе раньше. Сколько товаров можно запросить за раз
+PRODUCT_FRAGMENT_CACHE_TIMEOUT = int(os.environ.get('PRODUCT_FRAGMENT_CACHE_TIMEOUT', 60 * 60))
+PRODUCTS_MULTI_GET_MAX = int(os.environ.get('PRODUCTS_MULTI_GET_MAX', 500))
+# Как часто (сек) процесс сверяет версию справочников City/Store в памяти (catalog.reference)
+CATALOG_REFERENCE_CHECK_INTERVAL = float(os.environ.get('CATALOG_REFERENCE_CHECK_INTERVAL', 1))
+
+# Метрики и профилирование запросов (catalog.middleware.PerformanceMiddleware, /metrics)
+PERF_METRICS_ENABLED = os.environ.get('PERF_METRICS_ENABLED', '1') == '1'
+# Доля запросов с подробным профилем: SQL, N+1, сериализация, Server-Timing, лог catalog.perf
+PERF_SAMPLE_RATE = float(os.environ.get('PERF_SAMPLE_RATE', 0.1))
+# Запросы медленнее (мс) пишутся в лог с уровнем WARNING
+PERF_SLOW_REQUEST_MS = float(os.environ.get('PERF_SLOW_REQUEST_MS', 500))
+# Один и тот же SQL столько раз за запрос — признак N+1
+PERF_DUPLICATE_QUERY_THRESHOLD = int(os.environ.get('PERF_DUPLICATE_QUERY_THRESHOLD', 3))
+# Как часто (сек) процесс переносит накопленные метрики запросов в Redis (0 — на каждый запрос)
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 10))
+# /metrics отдаётся staff (сессия) или по заголовку Authorization: Bearer <METRICS_TOKEN>
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'catalog.perf': {'handlers': ['console'], 'level': os.environ.get('PERF_LOG_LEVEL', 'INFO')},
+    },
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -173,8 +267,41 @@ CELERY_BROKER_URL = os.environ.get("CELERY_BROKER_URL", "amqp://myuser:mypass@ra
 CELERY_TASK_ACKS_LATE = True
 CELERY_WORKER_PREFETCH_MULTIPLIER = 1
 
+# Очереди: обновления остатков — в отдельной очереди со своими воркерами
+# (celery -A testProject worker -Q stocks), остальная фоновая работа — в default
+CELERY_TASK_DEFAULT_QUEUE = 'default'
+CELERY_STOCK_QUEUE = os.environ.get('CELERY_STOCK_QUEUE', 'stocks')
+CELERY_TASK_ROUTES = {
+    'catalog.tasks.bulk_update_stocks_task': {'queue': CELERY_STOCK_QUEUE},
+    'catalog.tasks.apply_stock_chunk_task': {'queue': CELERY_STOCK_QUEUE},
+}
 
+# Результаты и статусы задач (django-celery-results): /api/v1/tasks/<task_id>
+CELERY_RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND', 'django-db')
+CELERY_RESULT_EXTENDED = True
+CELERY_TASK_TRACK_STARTED = True
+CELERY_RESULT_EXPIRES = int(os.environ.get('CELERY_RESULT_EXPIRES', 60 * 60 * 24))
+
+# Ограничение скорости обновления остатков в строках в секунду на все воркеры
+# (0 — без ограничения) и допустимый запас в секундах: пачка ждёт, пока не освободится квота
+STOCK_UPDATE_ROWS_PER_SECOND = int(os.environ.get('STOCK_UPDATE_ROWS_PER_SECOND', 0))
+STOCK_UPDATE_RATE_BURST = float(os.environ.get('STOCK_UPDATE_RATE_BURST', 1.0))
+
+# Размер пачки при обновлении остатков: большой фид делится на задачи по столько строк
+STOCK_UPDATE_CHUNK_SIZE = int(os.environ.get('STOCK_UPDATE_CHUNK_SIZE', 5000))
+
+# Периодические задачи (celery beat)
+CELERY_BEAT_SCHEDULE = {
+    'flush-product-view-counts': {
+        'task': 'catalog.tasks.flush_view_counts_task',
+        'schedule': float(os.environ.get('VIEW_COUNT_FLUSH_INTERVAL', 30)),
+    },
+    'compact-catalog-changes': {
+        'task': 'catalog.tasks.compact_catalog_changes_task',
+        'schedule': float(os.environ.get('CATALOG_CHANGES_COMPACT_INTERVAL', 60 * 60)),
+    },
+}
 
-
-
-
+# Сколько секунд хранится журнал изменений каталога (/api/v1/catalog/changes): клиент,
+# не синхронизировавшийся дольше, перечитывает каталог целиком
+CATALOG_CHANGES_RETENTION = int(os.environ.get('CATALOG_CHANGES_RETENTION', 60 * 60 * 24 * 7))
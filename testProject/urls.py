@@ -17,6 +17,7 @@ from django.contrib import admin
 from django.urls import path
 
 from django.urls import path, include
+from catalog.views import metrics_view
 from rest_framework_simplejwt.views import (
     TokenObtainPairView,
     TokenRefreshView,
@@ -27,5 +28,6 @@ urlpatterns = [
     path('api/v1/', include('catalog.urls')),
     path('api/v1/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/v1/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('metrics', metrics_view, name='metrics'),
 ]
 
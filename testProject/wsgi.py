@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'testProject.settings')
 
 application = get_wsgi_application()
+
+# Справочники City/Store загружаются в каждом воркере до первого запроса
+from catalog.reference import warm_reference  # noqa: E402
+
+warm_reference()